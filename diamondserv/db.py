@@ -0,0 +1,51 @@
+"""
+file: diamondserv/db.py
+author: lkmhaqer
+
+Keeping our persistent database connections healthy. Django 3.1 has no
+CONN_HEALTH_CHECKS setting, so we check reused connections ourselves
+before handing them to a request or a background loop.
+"""
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+
+def note_use(execute, sql, params, many, context):
+  """
+  An execute wrapper noting when a connection last ran a query, so
+  check_connections() can tell which have been sitting idle.
+  """
+  context['connection'].last_used = time.monotonic()
+  return execute(sql, params, many, context)
+
+def check_connections(idle=0):
+  """
+  Close any open connection that no longer answers, so the next query
+  opens a fresh one instead of failing on a connection the database
+  server already dropped. Connections that ran a query in the last idle
+  seconds are taken to be fine, rather than asked again.
+  """
+  if not settings.DB_CONN_HEALTH_CHECKS:
+    return
+
+  now = time.monotonic()
+  for connection in connections.all():
+    if connection.connection is None:
+      continue
+    if now - getattr(connection, 'last_used', float('-inf')) < idle:
+      continue
+    if connection.is_usable():
+      connection.last_used = now
+    else:
+      connection.close()
+
+def refresh_connections():
+  """
+  For long running commands, do what Django does between requests:
+  close connections past CONN_MAX_AGE or in error, then health check
+  the ones we keep.
+  """
+  close_old_connections()
+  check_connections()
@@ -0,0 +1,62 @@
+"""
+file: diamondserv/middleware.py
+author: lkmhaqer
+"""
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .db import check_connections, note_use
+from .timing import (
+  db_span,
+  request_metrics,
+  server_timing,
+  start_timing,
+  stop_timing
+)
+
+
+class TimingMiddleware: # pylint: disable=too-few-public-methods
+  """
+  Break each request's time down into database, docker, status probe
+  and template spans. They're sent back in a Server-Timing header, and
+  recorded per view for /metrics.
+  """
+  def __init__(self, get_response):
+    self.get_response = get_response
+
+  def __call__(self, request):
+    timings, token = start_timing()
+    try:
+      with ExitStack() as stack:
+        for connection in connections.all():
+          stack.enter_context(connection.execute_wrapper(db_span))
+        response = self.get_response(request)
+    finally:
+      stop_timing(token)
+
+    match = request.resolver_match
+    request_metrics.record(match.view_name if match else 'unresolved', timings)
+    if settings.SERVER_TIMING:
+      response['Server-Timing'] = server_timing(timings)
+
+    return response
+
+
+class DatabaseHealthCheckMiddleware: # pylint: disable=too-few-public-methods
+  """
+  Health check persistent database connections before each request,
+  so a connection dropped while idle never fails a page view. Only those
+  idle for DB_CONN_HEALTH_CHECK_IDLE seconds are checked, so busy workers,
+  and requests that never touch the database, don't pay a round trip.
+  """
+  def __init__(self, get_response):
+    self.get_response = get_response
+
+  def __call__(self, request):
+    check_connections(idle=settings.DB_CONN_HEALTH_CHECK_IDLE)
+    with ExitStack() as stack:
+      for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(note_use))
+      return self.get_response(request)
@@ -54,6 +54,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+  'diamondserv.middleware.TimingMiddleware',
+  'diamondserv.middleware.DatabaseHealthCheckMiddleware',
   'django.middleware.security.SecurityMiddleware',
   'django.contrib.sessions.middleware.SessionMiddleware',
   'django.middleware.common.CommonMiddleware',
@@ -67,7 +69,7 @@ ROOT_URLCONF = 'diamondserv.urls'
 
 TEMPLATES = [
   {
-    'BACKEND': 'django.template.backends.django.DjangoTemplates',
+    'BACKEND': 'diamondserv.timing.TimedDjangoTemplates',
     'DIRS': [],
     'APP_DIRS': True,
     'OPTIONS': {
@@ -88,6 +90,15 @@ WSGI_APPLICATION = 'diamondserv.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
+# DB_CONN_MAX_AGE is how many seconds a connection is kept open and reused,
+# 0 closes it after every request, and 'None' keeps it forever. Reused
+# connections are health checked first unless DB_CONN_HEALTH_CHECKS is off,
+# requests only check those idle for DB_CONN_HEALTH_CHECK_IDLE seconds.
+
+DB_CONN_MAX_AGE = os.getenv('DB_CONN_MAX_AGE', '60')
+DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+DB_CONN_HEALTH_CHECK_IDLE = int(os.getenv('DB_CONN_HEALTH_CHECK_IDLE', '30'))
+
 DATABASES = {
   'default': {
     'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.sqlite3'),
@@ -95,10 +106,184 @@ DATABASES = {
     'USER': os.getenv('DB_USER', 'diamondserv'),
     'PASSWORD': os.getenv('DB_PASSWORD', ''),
     'HOST': os.getenv('DB_HOST', ''),
-    'PORT': os.getenv('DB_PORT', '')
+    'PORT': os.getenv('DB_PORT', ''),
+    'CONN_MAX_AGE': None if DB_CONN_MAX_AGE == 'None' else int(DB_CONN_MAX_AGE),
   }
 }
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.mysql':
+  DATABASES['default']['OPTIONS'] = {
+    'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', '5')),
+  }
+
+# Minecraft Status Probes
+# STATUS_PROBE_TIMEOUT is the deadline, in seconds, for one whole probe.
+# STATUS_PROBE_CONCURRENCY caps how many probes are in flight at once.
+
+STATUS_PROBE_TIMEOUT = float(os.getenv('STATUS_PROBE_TIMEOUT', '0.5'))
+STATUS_PROBE_CONCURRENCY = int(os.getenv('STATUS_PROBE_CONCURRENCY', '32'))
+
+# After a successful status probe, a server is pinged for its latency
+# within STATUS_PING_TIMEOUT seconds, 0 skips the ping. With
+# STATUS_QUERY_ENABLED, new containers enable the Query protocol and we ask
+# it for the full player list within STATUS_QUERY_TIMEOUT seconds.
+
+STATUS_PING_TIMEOUT = float(os.getenv('STATUS_PING_TIMEOUT', '0.5'))
+STATUS_QUERY_ENABLED = os.getenv('STATUS_QUERY_ENABLED', 'False') == 'True'
+STATUS_QUERY_TIMEOUT = float(os.getenv('STATUS_QUERY_TIMEOUT', '0.5'))
+
+# Latency Percentiles
+# The status pages show each server's and host's probe latency percentiles
+# over the last STATUS_LATENCY_WINDOW minutes of polls.
+
+STATUS_LATENCY_WINDOW = int(os.getenv('STATUS_LATENCY_WINDOW', '60'))
+
+# Probe Cache
+# Pages reuse a live probe for PROBE_CACHE_TTL seconds. A server that's
+# down isn't probed again for PROBE_DOWN_TTL seconds, doubling each time
+# it's still down, up to PROBE_DOWN_MAX_TTL.
+
+PROBE_CACHE_TTL = float(os.getenv('PROBE_CACHE_TTL', '5'))
+PROBE_DOWN_TTL = float(os.getenv('PROBE_DOWN_TTL', '2'))
+PROBE_DOWN_MAX_TTL = float(os.getenv('PROBE_DOWN_MAX_TTL', '60'))
+
+# Status Snapshot
+# The poll_status command refreshes a fleet snapshot every
+# STATUS_POLL_INTERVAL seconds. Past STATUS_SNAPSHOT_MAX_AGE the snapshot
+# expires, and pages fall back to probing live.
+
+STATUS_POLL_INTERVAL = int(os.getenv('STATUS_POLL_INTERVAL', '30'))
+STATUS_SNAPSHOT_MAX_AGE = int(os.getenv('STATUS_SNAPSHOT_MAX_AGE', '300'))
+
+# Port Allocation
+# How many times Server.save() picks a new port if a concurrent create
+# claims the one it chose first.
+
+PORT_ALLOCATION_ATTEMPTS = int(os.getenv('PORT_ALLOCATION_ATTEMPTS', '3'))
+
+# Jobs
+# At most JOB_HOST_CONCURRENCY jobs run against any one MineHost at once,
+# so a batch across the fleet can't swamp a single box. A job running for
+# longer than JOB_STALE_MINUTES lost its worker, and is failed.
+
+JOB_HOST_CONCURRENCY = int(os.getenv('JOB_HOST_CONCURRENCY', '2'))
+JOB_STALE_MINUTES = int(os.getenv('JOB_STALE_MINUTES', '60'))
+
+# Placement
+# Memory assumed for a ServerType without a MEMORY environment var, this
+# matches the default of the itzg/minecraft-server image.
+
+PLACEMENT_DEFAULT_MEMORY = os.getenv('PLACEMENT_DEFAULT_MEMORY', '1G')
+
+# Reconciliation
+# The reconcile command diffs our Server rows against every host's
+# containers each RECONCILE_INTERVAL seconds, listing
+# RECONCILE_CONCURRENCY hosts at once.
+
+RECONCILE_INTERVAL = int(os.getenv('RECONCILE_INTERVAL', '60'))
+RECONCILE_CONCURRENCY = int(os.getenv('RECONCILE_CONCURRENCY', '16'))
+
+# Hibernation
+# Servers with nobody online for HIBERNATE_IDLE_MINUTES are stopped until
+# someone wakes them, 0 never hibernates anything.
+
+HIBERNATE_IDLE_MINUTES = int(os.getenv('HIBERNATE_IDLE_MINUTES', '360'))
+
+# Image Warming
+# The warm_images command pulls every enabled ServerType's image onto
+# every MineHost each IMAGE_WARM_INTERVAL seconds, at most
+# IMAGE_PULL_CONCURRENCY pulls at a time per host to spare its bandwidth.
+
+IMAGE_WARM_INTERVAL = int(os.getenv('IMAGE_WARM_INTERVAL', '900'))
+IMAGE_PULL_CONCURRENCY = int(os.getenv('IMAGE_PULL_CONCURRENCY', '1'))
+
+# FTB Import
+# Where fill_ftb finds modpacks, how long it waits on each request, and
+# how many packs it fetches at once.
+
+FTB_API_URL = os.getenv('FTB_API_URL', 'https://api.modpacks.ch/public/modpack/')
+FTB_TIMEOUT = float(os.getenv('FTB_TIMEOUT', '10'))
+FTB_CONCURRENCY = int(os.getenv('FTB_CONCURRENCY', '8'))
+
+# Player History
+# Every poll is recorded, and rolled up into minute, hour and day rows.
+# Each is kept for its number of days, and range queries return at most
+# PLAYER_HISTORY_MAX_POINTS buckets.
+
+PLAYER_HISTORY_RETENTION_DAYS = {
+  'raw': int(os.getenv('PLAYER_HISTORY_RAW_DAYS', '2')),
+  'minute': int(os.getenv('PLAYER_HISTORY_MINUTE_DAYS', '7')),
+  'hour': int(os.getenv('PLAYER_HISTORY_HOUR_DAYS', '90')),
+  'day': int(os.getenv('PLAYER_HISTORY_DAY_DAYS', '1825')),
+}
+PLAYER_HISTORY_MAX_POINTS = int(os.getenv('PLAYER_HISTORY_MAX_POINTS', '2000'))
+
+# Docker Clients
+# One client per MineHost is kept per-process. DOCKER_API_VERSION pins the
+# API so we never negotiate it, idle clients are closed after
+# DOCKER_CLIENT_IDLE_TIMEOUT seconds, and a client unused for
+# DOCKER_HEALTHCHECK_INTERVAL seconds is pinged before being reused.
+
+DOCKER_API_VERSION = os.getenv('DOCKER_API_VERSION', '1.35')
+DOCKER_TIMEOUT = int(os.getenv('DOCKER_TIMEOUT', '60'))
+DOCKER_MAX_POOL_SIZE = int(os.getenv('DOCKER_MAX_POOL_SIZE', '10'))
+DOCKER_CLIENT_IDLE_TIMEOUT = int(os.getenv('DOCKER_CLIENT_IDLE_TIMEOUT', '300'))
+DOCKER_HEALTHCHECK_INTERVAL = int(os.getenv('DOCKER_HEALTHCHECK_INTERVAL', '30'))
+
+# Log Streaming
+# LOG_STREAM_TAIL lines are sent before following, unless the client asks
+# for up to LOG_STREAM_MAX_TAIL. Streams are closed after
+# LOG_STREAM_MAX_SECONDS so they don't pin a worker. The detail page only
+# follows logs when asked, reconnecting for a few streams at most.
+
+LOG_STREAM_TAIL = int(os.getenv('LOG_STREAM_TAIL', '50'))
+LOG_STREAM_MAX_TAIL = int(os.getenv('LOG_STREAM_MAX_TAIL', '1000'))
+LOG_STREAM_MAX_SECONDS = int(os.getenv('LOG_STREAM_MAX_SECONDS', '60'))
+
+# Resource Telemetry
+# collect_stats samples the fleet every TELEMETRY_INTERVAL seconds. Raw
+# samples older than TELEMETRY_RAW_RETENTION seconds are rolled up into
+# hourly rows, which are kept for TELEMETRY_RETENTION_DAYS.
+
+TELEMETRY_INTERVAL = int(os.getenv('TELEMETRY_INTERVAL', '60'))
+TELEMETRY_CONCURRENCY = int(os.getenv('TELEMETRY_CONCURRENCY', '16'))
+TELEMETRY_RAW_RETENTION = int(os.getenv('TELEMETRY_RAW_RETENTION', '86400'))
+TELEMETRY_RETENTION_DAYS = int(os.getenv('TELEMETRY_RETENTION_DAYS', '90'))
+TELEMETRY_CHART_HOURS = int(os.getenv('TELEMETRY_CHART_HOURS', '24'))
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# Local memory by default. The status poller runs in its own process, so
+# production needs a shared backend, like the file based cache our
+# Dockerfile configures, or memcached with
+# CACHE_BACKEND=django.core.cache.backends.memcached.MemcachedCache
+# and CACHE_LOCATION=host:11211 (several hosts may be split with ';').
+# PAGE_CACHE_SECONDS is how long our static pages are cached for.
+
+CACHES = {
+  'default': {
+    'BACKEND': os.getenv(
+      'CACHE_BACKEND',
+      'django.core.cache.backends.locmem.LocMemCache'
+    ),
+    'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    'TIMEOUT': int(os.getenv('CACHE_TIMEOUT', '300')),
+    'KEY_PREFIX': os.getenv('CACHE_KEY_PREFIX', 'diamondserv'),
+  }
+}
+
+PAGE_CACHE_SECONDS = int(os.getenv('PAGE_CACHE_SECONDS', '300'))
+
+# Metrics
+# Requests are timed per view, and the last METRICS_SAMPLES of each are
+# kept for the percentiles /metrics serves. If METRICS_TOKEN is set,
+# scrapers must send it as a bearer token. SERVER_TIMING sends each
+# request's breakdown back in a Server-Timing header.
+
+METRICS_SAMPLES = int(os.getenv('METRICS_SAMPLES', '1000'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'True') == 'True'
+
 # Email
 # https://docs.djangoproject.com/en/3.1/topics/email/
 # https://medium.com/@shafikshaon/user-registration-with-email-verification-in-django-8aeff5ce498d
@@ -0,0 +1,143 @@
+"""
+file: diamondserv/tests.py
+author: lkmhaqer
+"""
+import asyncio
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from accounts.models import User
+from diamondserv.db import check_connections, note_use
+from diamondserv.timing import request_metrics, start_timing, stop_timing, timed
+from wrangler.models import MineHost, Server
+from wrangler.probe_cache import probe_cache
+
+
+class DatabaseHealthCheckTests(TestCase):
+  """ Tests for health checking our persistent database connections. """
+  def test_unusable_connection_closed(self):
+    """ Test a connection that stopped answering is closed. """
+    with mock.patch.object(connection, 'is_usable', return_value=False), \
+      mock.patch.object(connection, 'close') as close:
+      check_connections()
+
+    close.assert_called_once()
+
+  def test_usable_connection_kept(self):
+    """ Test a healthy connection is left open for reuse. """
+    with mock.patch.object(connection, 'close') as close:
+      check_connections()
+
+    close.assert_not_called()
+
+  def test_health_checks_disabled(self):
+    """ Test we don't check connections when turned off. """
+    with self.settings(DB_CONN_HEALTH_CHECKS=False), \
+      mock.patch.object(connection, 'is_usable') as is_usable:
+      check_connections()
+
+    is_usable.assert_not_called()
+
+  def test_recently_used_connection_not_checked(self):
+    """ Test a connection that just ran a query isn't asked again. """
+    with connection.execute_wrapper(note_use):
+      User.objects.exists()
+
+    with mock.patch.object(connection, 'is_usable') as is_usable:
+      check_connections(idle=30)
+
+    is_usable.assert_not_called()
+
+  def test_idle_connection_checked(self):
+    """ Test a connection idle past the threshold is checked. """
+    with connection.execute_wrapper(note_use):
+      User.objects.exists()
+
+    with mock.patch('diamondserv.db.time.monotonic', return_value=connection.last_used + 31), \
+      mock.patch.object(connection, 'is_usable', return_value=True) as is_usable:
+      check_connections(idle=30)
+
+    is_usable.assert_called_once()
+
+
+class TimingTests(TestCase):
+  """ Tests for our request timing, Server-Timing headers and /metrics. """
+  def setUp(self):
+    probe_cache.clear()
+    cache.clear()
+    request_metrics.clear()
+
+  def tearDown(self):
+    probe_cache.clear()
+    cache.clear()
+    request_metrics.clear()
+
+  def test_spans_totalled(self):
+    """ Test sync and async spans count towards the request being timed. """
+    @timed('docker')
+    def docker_call():
+      return 'ok'
+
+    @timed('probe')
+    async def probe():
+      return 'ok'
+
+    timings, token = start_timing()
+    try:
+      docker_call()
+      docker_call()
+      asyncio.run(probe())
+    finally:
+      stop_timing(token)
+    docker_call()
+
+    self.assertEqual(timings.counts, {'docker': 2, 'probe': 1})
+
+  def test_server_timing_header(self):
+    """ Test a page breaks its time down into db, probe and template. """
+    user = User.objects.create_user('TestyMcTestFace', 'foo@bar.com', 'pw')
+    mine_host = MineHost.objects.create(name='example.com')
+    server = Server(name='mc-test', owner=user, host=mine_host)
+    server.save()
+    down = (server, {'version': {'text': '', 'error': 'timed out'}})
+
+    with mock.patch('wrangler.tasks._probe_server', mock.AsyncMock(return_value=down)):
+      response = self.client.get(reverse('wrangler:status'))
+
+    timing = response['Server-Timing']
+    self.assertIn('desc="1 calls"', timing)
+    for name in ('db', 'probe', 'template', 'total'):
+      self.assertIn(f'{name};dur=', timing)
+
+  def test_metrics(self):
+    """ Test /metrics serves percentiles per view. """
+    for _ in range(3):
+      self.client.get(reverse('wrangler:index'))
+
+    response = self.client.get(reverse('metrics'))
+
+    self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4')
+    self.assertContains(
+      response,
+      'diamondserv_request_template_seconds_count{view="wrangler:index"} 3'
+    )
+    self.assertContains(
+      response,
+      'diamondserv_request_total_seconds{view="wrangler:index",quantile="0.95"}'
+    )
+
+  def test_metrics_token(self):
+    """ Test /metrics wants our token, when we have one. """
+    with self.settings(METRICS_TOKEN='sekrit'):
+      refused = self.client.get(reverse('metrics'))
+      allowed = self.client.get(
+        reverse('metrics'),
+        HTTP_AUTHORIZATION='Bearer sekrit'
+      )
+
+    self.assertEqual(refused.status_code, 401)
+    self.assertEqual(allowed.status_code, 200)
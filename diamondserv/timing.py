@@ -0,0 +1,220 @@
+"""
+file: diamondserv/timing.py
+author: lkmhaqer
+
+Our timing API. Code wraps the slow things it does in a span, named for
+what it waits on, and the spans of a request are totalled per name. The
+TimingMiddleware reports them as a Server-Timing header, and keeps recent
+timings per view so /metrics can serve their percentiles.
+"""
+import functools
+import inspect
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+
+
+# The span categories we total, in the order Server-Timing lists them.
+CATEGORIES = ('db', 'docker', 'probe', 'template')
+QUANTILES = (0.5, 0.95, 0.99)
+
+_timings = ContextVar('timings', default=None)
+
+
+class Timings:
+  """ The time spent, and how many times, per span name, in one request. """
+  def __init__(self):
+    self.started = time.perf_counter()
+    self.seconds = defaultdict(float)
+    self.counts = defaultdict(int)
+    self._lock = threading.Lock()
+
+  def add(self, name, seconds):
+    """ Count one span of name, which took seconds. """
+    with self._lock:
+      self.seconds[name] += seconds
+      self.counts[name] += 1
+
+  def total(self):
+    """ Return the seconds since the request started. """
+    return time.perf_counter() - self.started
+
+
+def start_timing():
+  """Start totalling spans for the current request.
+
+  The Timings are kept in a context variable, so spans in threads and
+  event loop tasks started from this request count towards it too.
+
+  Returns:
+      tuple: (Timings, token), pass the token to stop_timing().
+  """
+  timings = Timings()
+  return timings, _timings.set(timings)
+
+def stop_timing(token):
+  """ Stop totalling spans, from a token from start_timing(). """
+  _timings.reset(token)
+
+@contextmanager
+def span(name):
+  """Time a block of code as a span of name, if we're timing a request.
+
+  Args:
+      name (str): What the block waits on, such as 'docker'.
+  """
+  timings = _timings.get()
+  if timings is None:
+    yield
+    return
+
+  started = time.perf_counter()
+  try:
+    yield
+  finally:
+    timings.add(name, time.perf_counter() - started)
+
+def timed(name):
+  """ Decorate a function, or coroutine function, to run as a span of name. """
+  def decorator(func):
+    if inspect.iscoroutinefunction(func):
+      @functools.wraps(func)
+      async def async_wrapper(*args, **kwargs):
+        with span(name):
+          return await func(*args, **kwargs)
+      return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+      with span(name):
+        return func(*args, **kwargs)
+    return wrapper
+
+  return decorator
+
+def db_span(execute, sql, params, many, context):
+  """ A database execute_wrapper, timing every query as a db span. """
+  with span('db'):
+    return execute(sql, params, many, context)
+
+
+class _TimedTemplate:
+  """ A template whose renders are timed as template spans. """
+  def __init__(self, template):
+    self.template = template
+
+  def __getattr__(self, name):
+    return getattr(self.template, name)
+
+  def render(self, context=None, request=None):
+    """ Render the template, timing it. """
+    with span('template'):
+      return self.template.render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+  """
+  The Django template backend, with every top level render timed.
+  Included templates render inside their parent, so aren't counted twice.
+  """
+  def from_string(self, template_code):
+    return _TimedTemplate(super().from_string(template_code))
+
+  def get_template(self, template_name):
+    return _TimedTemplate(super().get_template(template_name))
+
+
+def server_timing(timings):
+  """Describe a request's spans as a Server-Timing header value.
+
+  Args:
+      timings (Timings): From start_timing().
+
+  Returns:
+      str: Like db;dur=1.2;desc="3 calls", total;dur=20.5
+  """
+  metrics = [
+    f'{name};dur={timings.seconds[name] * 1000:.1f};desc="{timings.counts[name]} calls"'
+    for name in CATEGORIES if name in timings.counts
+  ]
+  metrics.append(f'total;dur={timings.total() * 1000:.1f}')
+  return ', '.join(metrics)
+
+
+class RequestMetrics:
+  """
+  A per-process record of recent request timings per view. Only the last
+  METRICS_SAMPLES requests of each view are kept for percentiles, while
+  counts and sums cover every request since we started.
+  """
+  def __init__(self):
+    self._samples = {}
+    self._counts = defaultdict(int)
+    self._sums = defaultdict(float)
+    self._lock = threading.Lock()
+
+  def record(self, view, timings):
+    """Keep one request's timings.
+
+    Args:
+        view (str): The name of the view that answered the request.
+        timings (Timings): The request's spans.
+    """
+    sample = {'total': timings.total()}
+    for name in CATEGORIES:
+      sample[name] = timings.seconds.get(name, 0.0)
+    sample['db_queries'] = timings.counts.get('db', 0)
+
+    with self._lock:
+      samples = self._samples.setdefault(view, deque(maxlen=settings.METRICS_SAMPLES))
+      samples.append(sample)
+      self._counts[view] += 1
+      for name, value in sample.items():
+        self._sums[(view, name)] += value
+
+  def clear(self):
+    """ Forget everything we've recorded. """
+    with self._lock:
+      self._samples.clear()
+      self._counts.clear()
+      self._sums.clear()
+
+  def render(self):
+    """Describe our timings in the Prometheus text format.
+
+    Returns:
+        str: A summary per view of total, db, docker, probe and template
+          seconds, and of db queries.
+    """
+    with self._lock:
+      samples = {view: list(values) for view, values in self._samples.items()}
+      counts = dict(self._counts)
+      sums = dict(self._sums)
+
+    lines = []
+    for name in ('total',) + CATEGORIES + ('db_queries',):
+      metric = (
+        'diamondserv_request_db_queries' if name == 'db_queries'
+        else f'diamondserv_request_{name}_seconds'
+      )
+      lines.append(f'# TYPE {metric} summary')
+      for view in sorted(samples):
+        values = sorted(sample[name] for sample in samples[view])
+        for quantile in QUANTILES:
+          rank = max(math.ceil(quantile * len(values)) - 1, 0)
+          lines.append(
+            f'{metric}{{view="{view}",quantile="{quantile}"}} {values[rank]:g}'
+          )
+        lines.append(f'{metric}_sum{{view="{view}"}} {sums[(view, name)]:g}')
+        lines.append(f'{metric}_count{{view="{view}"}} {counts[view]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+request_metrics = RequestMetrics()
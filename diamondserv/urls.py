@@ -16,7 +16,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 
+from . import views
+
 urlpatterns = [
+  path('metrics', views.metrics, name='metrics'),
   path('', include('wrangler.urls')),
   path('accounts/', include('django.contrib.auth.urls')),
   path('accounts/', include('accounts.urls')),
@@ -0,0 +1,24 @@
+"""
+file: diamondserv/views.py
+author: lkmhaqer
+"""
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+from wrangler.exporter import render_fleet_metrics
+
+from .timing import request_metrics
+
+
+def metrics(request):
+  """ Serve our request timings and fleet gauges for Prometheus to scrape. """
+  if settings.METRICS_TOKEN:
+    token = request.META.get('HTTP_AUTHORIZATION', '')
+    if not constant_time_compare(token, f'Bearer {settings.METRICS_TOKEN}'):
+      return HttpResponse('Unauthorized', status=401)
+
+  return HttpResponse(
+    request_metrics.render() + render_fleet_metrics(),
+    content_type='text/plain; version=0.0.4'
+  )
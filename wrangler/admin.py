@@ -4,10 +4,77 @@ author: lkmhaqer
 """
 from django.contrib import admin
 
-from .models import EnvironmentVar, MineHost, Server, ServerType
+from .batch import enqueue_batch
+from .models import (
+  EnvironmentVar,
+  HostImage,
+  Job,
+  JobAction,
+  MineHost,
+  ResourceSample,
+  Server,
+  ServerType
+)
 
 
+class HostImageAdmin(admin.ModelAdmin):
+  """ Show which hosts have which images warm, and any failed pulls. """
+  list_display = ('image', 'host', 'state', 'size', 'pulled', 'checked')
+  list_filter = ('state', 'host', 'image')
+  list_select_related = ('host',)
+
+class JobAdmin(admin.ModelAdmin):
+  """ Show the job queue with its state at a glance. """
+  list_display = ('server_name', 'action', 'state', 'created', 'finished')
+  list_filter = ('state', 'action')
+
+class ResourceSampleAdmin(admin.ModelAdmin):
+  """ Browse resource samples by host, container and resolution. """
+  list_display = (
+    'host',
+    'container',
+    'resolution',
+    'timestamp',
+    'cpu_percent',
+    'memory_bytes'
+  )
+  list_filter = ('resolution', 'host')
+
+def _batch_action(action):
+  """ Build an admin action queueing a job of action per selected server. """
+  def queue(modeladmin, request, queryset):
+    jobs = enqueue_batch(queryset, action)
+    modeladmin.message_user(
+      request,
+      f'Queued {action} for {jobs.count()} servers, follow them under Jobs.'
+    )
+
+  queue.short_description = f'{action.label} selected servers'
+  queue.__name__ = f'{action}_servers'
+  return queue
+
+class ServerAdmin(admin.ModelAdmin):
+  """
+  List servers without a query per row for their host, and act on many
+  of them at once, filtered by host, type or owner.
+  """
+  list_display = ('name', 'host', 'server_type', 'owner', 'port')
+  list_filter = ('host', 'server_type', 'owner')
+  list_select_related = ('host', 'server_type', 'owner')
+  actions = [
+    _batch_action(action)
+    for action in (
+      JobAction.START,
+      JobAction.STOP,
+      JobAction.RESTART,
+      JobAction.RECREATE,
+    )
+  ]
+
 admin.site.register(MineHost)
-admin.site.register(Server)
+admin.site.register(Server, ServerAdmin)
 admin.site.register(EnvironmentVar)
 admin.site.register(ServerType)
+admin.site.register(HostImage, HostImageAdmin)
+admin.site.register(Job, JobAdmin)
+admin.site.register(ResourceSample, ResourceSampleAdmin)
@@ -8,3 +8,7 @@ from django.apps import AppConfig
 class WranglerConfig(AppConfig):
   """ Our server 'wrangler' app """
   name = 'wrangler'
+
+  def ready(self):
+    # Connect our signal receivers.
+    from . import signals # pylint: disable=import-outside-toplevel,unused-import
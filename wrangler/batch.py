@@ -0,0 +1,76 @@
+"""
+file: wrangler/batch.py
+author: lkmhaqer
+
+Lifecycle operations across many servers at once, such as rolling a new
+ServerType image out to every server of that type. A batch is just a set
+of Jobs, so the run_jobs worker (or the batch_servers command) runs them,
+a few per MineHost at a time.
+"""
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Job, JobState, Server
+
+
+def fleet_servers(host=None, server_type=None, owner=None):
+  """Select the servers a batch should act on.
+
+  Args:
+      host (str): Only servers on the MineHost with this name.
+      server_type (str): Only servers of the ServerType with this name.
+      owner (str): Only servers owned by the user with this username.
+
+  Returns:
+      QuerySet: The matching servers, every server if no filter is given.
+  """
+  servers = Server.objects.for_display()
+  if host:
+    servers = servers.filter(host__name=host)
+  if server_type:
+    servers = servers.filter(server_type__name=server_type)
+  if owner:
+    servers = servers.filter(owner__username=owner)
+  return servers.order_by('host__name', 'name')
+
+def enqueue_batch(servers, action):
+  """Queue up the same lifecycle operation for every server.
+
+  Args:
+      servers (iterable): The Server objects to act on.
+      action (JobAction): What to do to each server's container.
+
+  Returns:
+      QuerySet: The newly queued jobs.
+  """
+  queued = timezone.now()
+  jobs = Job.objects.bulk_create([
+    Job(server=server, server_name=server.name, action=action)
+    for server in servers
+  ])
+  # Only some backends hand primary keys back from bulk_create.
+  if all(job.pk for job in jobs):
+    return Job.objects.filter(pk__in=[job.pk for job in jobs])
+  return Job.objects.filter(
+    action=action,
+    created__gte=queued,
+    server__in=[job.server for job in jobs]
+  )
+
+def batch_progress(jobs):
+  """Count a batch's jobs by how far along they are.
+
+  Args:
+      jobs (QuerySet): The jobs of one batch, from enqueue_batch().
+
+  Returns:
+      dict: The total, and how many are queued, running, succeeded
+        and failed.
+  """
+  return jobs.aggregate(
+    total=Count('pk'),
+    **{
+      state: Count('pk', filter=Q(state=state))
+      for state in JobState.values
+    }
+  )
@@ -0,0 +1,282 @@
+"""
+file: wrangler/benchmarks.py
+author: lkmhaqer
+
+Benchmarks for wrangler's hot paths, run by the benchmark management
+command. Each runs against fake minecraft servers and docker daemons from
+fakes.py over real sockets, and measures how our own code scales with the
+size of the fleet. Results can be saved, and compared against a baseline.
+"""
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.models import User
+
+from .clients import docker_clients
+from .fakes import FakeDocker, FakeMinecraftServers
+from .forms import ServerForm
+from .models import MineHost, Server, ServerType
+from .reconcile import find_drift
+from .tasks import docker_start_server, minecraft_status, refresh_status_snapshot
+
+
+# Fleets are published from here up on 127.0.0.1. It's below the ephemeral
+# port range, so our own probes' client sockets never take a fleet's port.
+BASE_PORT = 27000
+# Docker benchmarks spread their fleet over a fake daemon per address.
+DOCKER_ADDRESSES = ('127.0.0.2', '127.0.0.3', '127.0.0.4')
+
+
+class _Rollback(Exception):
+  """ Raised to roll a benchmark's fleet back once we're done with it. """
+
+
+@contextmanager
+def _scratch():
+  """ Run a benchmark in a transaction, and an empty cache, thrown away after. """
+  cache.clear()
+  try:
+    with transaction.atomic():
+      yield
+      raise _Rollback()
+  except _Rollback:
+    pass
+  finally:
+    cache.clear()
+
+def _measure(func, repeat):
+  """Time a function, once to warm up and then repeat times.
+
+  Returns:
+      float: The median seconds a call took.
+  """
+  func()
+  times = []
+  for _ in range(repeat):
+    started = time.perf_counter()
+    func()
+    times.append(time.perf_counter() - started)
+  return statistics.median(times)
+
+def _count_queries(func):
+  """ Return how many queries one call of a function makes. """
+  with CaptureQueriesContext(connection) as queries:
+    func()
+  return len(queries)
+
+def _fleet(size, hosts=('127.0.0.1',), min_port=BASE_PORT, span=None):
+  """Create size servers, spread evenly over hosts, in as few queries as we can.
+
+  Args:
+      size (int): How many servers.
+      hosts ((str)): MineHost names, the servers' sockets are host:port.
+      min_port (int): The first port of every host's range.
+      span (int): The size of every host's port range, which stops short
+        of max_port, by default just big enough for its servers.
+
+  Returns:
+      tuple: (owner, [MineHost], [Server])
+  """
+  owner, _ = User.objects.get_or_create(
+    username='benchmark',
+    defaults={'server_limit': size + 1}
+  )
+  per_host = -(-size // len(hosts))
+  span = span or per_host
+  mine_hosts = [
+    MineHost.objects.create(
+      name=name,
+      server_limit=per_host + 1,
+      min_port=min_port,
+      max_port=min_port + span,
+    )
+    for name in hosts
+  ]
+  server_type = ServerType.objects.order_by('pk').first()
+  Server.objects.bulk_create(
+    Server(
+      name=f'bench-{i}',
+      owner=owner,
+      host=mine_hosts[i % len(hosts)],
+      server_type=server_type,
+      port=min_port + i // len(hosts),
+    )
+    for i in range(size)
+  )
+  return owner, mine_hosts, list(Server.objects.for_display().order_by('pk'))
+
+def bench_minecraft_status(sizes, down_ratios, repeat):
+  """
+  Probe a whole fleet with minecraft_status, with a share of it down. Down
+  servers refuse connections, as a stopped container's port does.
+  """
+  results = {}
+  for size in sizes:
+    for down in down_ratios:
+      with _scratch():
+        _, _, servers = _fleet(size)
+        up = [server.port for server in servers[:round(size * (1 - down))]]
+        with FakeMinecraftServers(up):
+          seconds = _measure(lambda servers=servers: minecraft_status(servers), repeat)
+      results[f'minecraft_status[servers={size},down={down:g}]'] = {
+        'seconds': seconds,
+        'servers_per_second': size / seconds,
+      }
+  return results
+
+def bench_port_allocation(occupancies, repeat, span=1000):
+  """
+  Create, and delete again, a server with Server.save() picking its port,
+  on a host whose range is already occupied from the bottom up, the worst
+  case for finding the first free port.
+  """
+  results = {}
+  for occupancy in occupancies:
+    with _scratch():
+      owner, mine_hosts, _ = _fleet(int(span * occupancy), span=span)
+
+      def create(owner=owner, host=mine_hosts[0]):
+        server = Server(name='bench-new', owner=owner, host=host)
+        server.save()
+        server.delete()
+
+      results[f'port_allocation[occupancy={occupancy:g}]'] = {
+        'seconds': _measure(create, repeat),
+        'queries': _count_queries(create),
+      }
+  return results
+
+def bench_status_view(sizes, repeat):
+  """
+  Render the public status page from a status snapshot, as poll_status
+  leaves it, so no page view probes.
+  """
+  client = Client()
+  url = reverse('wrangler:status')
+  results = {}
+  for size in sizes:
+    with _scratch():
+      _, _, servers = _fleet(size)
+      with FakeMinecraftServers([server.port for server in servers]):
+        refresh_status_snapshot()
+
+      def get():
+        response = client.get(url)
+        assert response.status_code == 200, response.status_code
+
+      results[f'status_view[servers={size}]'] = {
+        'seconds': _measure(get, repeat),
+        'queries': _count_queries(get),
+      }
+  return results
+
+def bench_server_form(sizes, repeat):
+  """
+  Build and render a ServerForm, with the fleet spread ten servers to a
+  host, so there are host choices to annotate with their server counts.
+  """
+  results = {}
+  for size in sizes:
+    with _scratch():
+      hosts = [f'bench-host-{i}' for i in range(max(size // 10, 1))]
+      owner, _, _ = _fleet(size, hosts=hosts)
+
+      def build(owner=owner):
+        ServerForm(user=owner).as_p()
+
+      results[f'server_form[servers={size}]'] = {
+        'seconds': _measure(build, repeat),
+        'queries': _count_queries(build),
+      }
+  return results
+
+def bench_docker(sizes, repeat):
+  """
+  Start a container for every server with docker_start_server, then list
+  every host's containers with find_drift, against fake daemons.
+  """
+  results = {}
+  daemons = [FakeDocker(address).start() for address in DOCKER_ADDRESSES]
+  try:
+    for size in sizes:
+      with _scratch():
+        _, _, servers = _fleet(size, hosts=DOCKER_ADDRESSES)
+        servers = list(Server.objects.for_launch().order_by('pk'))
+
+        started = time.perf_counter()
+        for server in servers:
+          docker_start_server(server)
+        start_seconds = (time.perf_counter() - started) / size
+
+        results[f'docker[servers={size}]'] = {
+          'seconds_per_start': start_seconds,
+          'find_drift_seconds': _measure(find_drift, repeat),
+        }
+      for daemon in daemons:
+        daemon.containers.clear()
+  finally:
+    docker_clients.close_all()
+    for daemon in daemons:
+      daemon.stop()
+  return results
+
+def run_benchmarks(sizes, repeat, only=None):
+  """Run every benchmark, or those whose name starts with only.
+
+  Args:
+      sizes ([int]): The fleet sizes to measure at.
+      repeat (int): How many timed runs each measurement takes the median of.
+      only (str): A benchmark name prefix, like 'status_view'.
+
+  Returns:
+      dict: Metrics keyed by benchmark and parameters.
+  """
+  benchmarks = {
+    'minecraft_status': lambda: bench_minecraft_status(sizes, (0, 0.5, 0.9), repeat),
+    'port_allocation': lambda: bench_port_allocation((0, 0.5, 0.9, 0.99), repeat),
+    'status_view': lambda: bench_status_view(sizes, repeat),
+    'server_form': lambda: bench_server_form(sizes, repeat),
+    'docker': lambda: bench_docker(sizes, repeat),
+  }
+  results = {}
+  for name, bench in benchmarks.items():
+    if only is None or name.startswith(only):
+      results.update(bench())
+  return results
+
+def compare(baseline, results, tolerance):
+  """Find the metrics that got worse than a baseline.
+
+  Timings may be off by tolerance before they count, since no two runs
+  time the same, but any extra query is a regression.
+
+  Args:
+      baseline (dict): Earlier results from run_benchmarks().
+      results (dict): The results to check.
+      tolerance (float): How much worse a timing may be, 0.25 is 25%.
+
+  Returns:
+      list: (benchmark, metric, baseline value, value) per regression.
+  """
+  regressions = []
+  for name, metrics in results.items():
+    for metric, value in metrics.items():
+      before = baseline.get(name, {}).get(metric)
+      if before is None:
+        continue
+      if metric == 'queries':
+        worse = value > before
+      elif metric.endswith('per_second'):
+        worse = value < before * (1 - tolerance)
+      else:
+        worse = value > before * (1 + tolerance)
+      if worse:
+        regressions.append((name, metric, before, value))
+  return regressions
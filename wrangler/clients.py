@@ -0,0 +1,122 @@
+"""
+file: wrangler/clients.py
+author: lkmhaqer
+
+Long-lived docker clients, one per MineHost. Building a DockerClient sets up
+a fresh connection pool, so we keep them around per-process and reuse their
+keep-alive connections for every operation against the same host.
+"""
+import threading
+import time
+
+from django.conf import settings
+from requests.exceptions import RequestException
+from docker import DockerClient
+from docker.errors import DockerException
+
+from diamondserv.timing import timed
+
+
+class _PooledClient: # pylint: disable=too-few-public-methods
+  """ A DockerClient, and when we last used and health checked it. """
+  def __init__(self, client):
+    self.client = client
+    self.last_used = time.monotonic()
+    self.last_checked = self.last_used
+
+
+class DockerClientPool:
+  """
+  A per-process registry of DockerClient()s keyed by MineHost name.
+
+  Clients idle longer than DOCKER_CLIENT_IDLE_TIMEOUT are closed, and a
+  client not used for DOCKER_HEALTHCHECK_INTERVAL is pinged before it is
+  handed out again, so a host that went away gets a fresh client.
+  """
+  def __init__(self):
+    self._clients = {}
+    self._lock = threading.Lock()
+
+  @staticmethod
+  def _connect(host):
+    """
+    Build a new client for a MineHost, with our pinned API version.
+    Every HTTP call it makes to docker is timed as a docker span.
+    """
+    client = DockerClient(
+      base_url=f'tcp://{host.name}:2375',
+      version=settings.DOCKER_API_VERSION,
+      timeout=settings.DOCKER_TIMEOUT,
+      max_pool_size=settings.DOCKER_MAX_POOL_SIZE,
+    )
+    client.api.send = timed('docker')(client.api.send)
+    return client
+
+  @staticmethod
+  def _healthy(pooled):
+    """ Ping the docker daemon behind a pooled client. """
+    try:
+      pooled.client.ping()
+    except (DockerException, RequestException):
+      return False
+    pooled.last_checked = time.monotonic()
+    return True
+
+  def get(self, host):
+    """Return a warm DockerClient for a MineHost, creating one if needed.
+
+    Args:
+        host (MineHost): The host we want to talk to.
+
+    Returns:
+        DockerClient: A client shared with every other caller for this host.
+    """
+    self.evict_idle()
+    with self._lock:
+      pooled = self._clients.get(host.name)
+
+    now = time.monotonic()
+    if pooled and now - pooled.last_checked > settings.DOCKER_HEALTHCHECK_INTERVAL:
+      if not self._healthy(pooled):
+        self.discard(host)
+        pooled = None
+
+    if pooled is None:
+      with self._lock:
+        pooled = self._clients.get(host.name)
+        if pooled is None:
+          pooled = _PooledClient(self._connect(host))
+          self._clients[host.name] = pooled
+
+    pooled.last_used = now
+    return pooled.client
+
+  def discard(self, host):
+    """ Close and forget the client for a MineHost, if we have one. """
+    with self._lock:
+      pooled = self._clients.pop(host.name, None)
+    if pooled:
+      pooled.client.close()
+
+  def evict_idle(self):
+    """ Close every client that hasn't been used in a while. """
+    cutoff = time.monotonic() - settings.DOCKER_CLIENT_IDLE_TIMEOUT
+    with self._lock:
+      idle = [
+        name for name, pooled in self._clients.items()
+        if pooled.last_used < cutoff
+      ]
+      evicted = [self._clients.pop(name) for name in idle]
+    for pooled in evicted:
+      pooled.client.close()
+
+  def close_all(self):
+    """ Close every client in the pool. """
+    with self._lock:
+      evicted = list(self._clients.values())
+      self._clients.clear()
+    for pooled in evicted:
+      pooled.client.close()
+
+
+docker_clients = DockerClientPool()
@@ -0,0 +1,206 @@
+"""
+file: wrangler/exporter.py
+author: lkmhaqer
+
+Describes the fleet as Prometheus gauges, per server and per MineHost.
+Everything here is read from what poll_status and reconcile have already
+cached, so a scrape never probes a server or calls docker.
+"""
+from django.core.cache import cache
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .history import LATENCY_KEY, PERCENTILES
+from .models import MineHost, Server
+from .reconcile import CONTAINER_STATES_KEY
+from .tasks import STATUS_SNAPSHOT_KEY
+
+
+def _labels(**labels):
+  """ Format Prometheus labels, escaping their values. """
+  pairs = []
+  for name, value in labels.items():
+    value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    pairs.append(f'{name}="{value}"')
+  return '{' + ','.join(pairs) + '}'
+
+
+class _Gauges:
+  """ Collects samples per gauge, so each is written out under one header. """
+  def __init__(self):
+    self._gauges = {}
+
+  def add(self, name, help_text, value, **labels):
+    """ Add one sample of a gauge, skipping those we have no value for. """
+    samples = self._gauges.setdefault(name, (help_text, []))[1]
+    if value is not None:
+      samples.append(f'{name}{_labels(**labels) if labels else ""} {value:g}')
+
+  def render(self):
+    """ Return every gauge in the Prometheus text format. """
+    lines = []
+    for name, (help_text, samples) in self._gauges.items():
+      lines.append(f'# HELP {name} {help_text}')
+      lines.append(f'# TYPE {name} gauge')
+      lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+def _seconds(milliseconds):
+  """ Convert a probe's milliseconds into seconds, as Prometheus prefers. """
+  return None if milliseconds is None else milliseconds / 1000
+
+def _status_gauges(gauges, status, labels):
+  """ Add the gauges a server's last status probe tells us. """
+  up = 'players' in status
+  gauges.add(
+    'diamondserv_server_up',
+    'Whether a server answered its last status probe.',
+    int(up),
+    **labels
+  )
+  if not up:
+    return
+
+  gauges.add(
+    'diamondserv_server_players_online',
+    'Players online at the last probe.',
+    status['players']['online'],
+    **labels
+  )
+  gauges.add(
+    'diamondserv_server_players_max',
+    'Player slots at the last probe.',
+    status['players']['max'],
+    **labels
+  )
+  gauges.add(
+    'diamondserv_server_latency_seconds',
+    'Latency of the last probe, by ping where we have one.',
+    _seconds(status.get('ping') or status.get('latency')),
+    **labels
+  )
+
+def _server_gauges(gauges, statuses, latency, states):
+  """ Add every server's gauges, from its row and our cached snapshots. """
+  servers = Server.objects.values_list('pk', 'name', 'host__name', 'port', 'hibernated')
+  for pk, name, host, port, hibernated in servers.order_by('host__name', 'name'):
+    labels = {'server': name, 'host': host}
+    gauges.add(
+      'diamondserv_server_port',
+      'The host port a server is published on.',
+      port,
+      **labels
+    )
+    gauges.add(
+      'diamondserv_server_hibernated',
+      'Whether a server is hibernating.',
+      int(hibernated),
+      **labels
+    )
+
+    status = statuses.get(pk)
+    if status is not None and not hibernated:
+      _status_gauges(gauges, status, labels)
+
+    for percentile in PERCENTILES:
+      gauges.add(
+        'diamondserv_server_latency_percentile_seconds',
+        'Probe latency percentiles over STATUS_LATENCY_WINDOW.',
+        _seconds(latency.get(pk, {}).get(f'p{percentile}')),
+        quantile=percentile / 100,
+        **labels
+      )
+
+    state = states.get(f'{host}/{name}')
+    if state:
+      gauges.add(
+        'diamondserv_server_container_state',
+        'The state docker reported for a server\'s container, always 1.',
+        1,
+        state=state,
+        **labels
+      )
+
+def _host_gauges(gauges, latency):
+  """
+  Add every MineHost's gauges. Like Server.save() and placement, we count
+  a host's ports from min_port up to, but not including, max_port.
+  """
+  hosts = MineHost.objects.annotate(
+    servers=Count('server'),
+    ports_used=Count('server', filter=Q(
+      server__port__gte=F('min_port'),
+      server__port__lt=F('max_port'),
+    )),
+  ).order_by('name')
+  for host in hosts:
+    labels = {'host': host.name}
+    gauges.add(
+      'diamondserv_host_enabled',
+      'Whether new servers may be placed on a host.',
+      int(host.enabled),
+      **labels
+    )
+    gauges.add(
+      'diamondserv_host_servers',
+      'Servers on a host.',
+      host.servers,
+      **labels
+    )
+    gauges.add(
+      'diamondserv_host_server_limit',
+      'Servers a host may hold.',
+      host.server_limit,
+      **labels
+    )
+    gauges.add(
+      'diamondserv_host_ports',
+      'Ports servers may be given on a host, from min_port up to max_port.',
+      host.max_port - host.min_port,
+      **labels
+    )
+    gauges.add(
+      'diamondserv_host_ports_used',
+      'Ports in a host\'s range held by its servers.',
+      host.ports_used,
+      **labels
+    )
+    for percentile in PERCENTILES:
+      gauges.add(
+        'diamondserv_host_latency_percentile_seconds',
+        'Probe latency percentiles of a host\'s servers over STATUS_LATENCY_WINDOW.',
+        _seconds(latency.get(host.name, {}).get(f'p{percentile}')),
+        quantile=percentile / 100,
+        **labels
+      )
+
+def render_fleet_metrics():
+  """Describe every server and host from our cached snapshots.
+
+  Servers the status snapshot doesn't cover, or that are hibernating,
+  only get the gauges we know without probing them.
+
+  Returns:
+      str: Our fleet gauges in the Prometheus text format.
+  """
+  snapshot = cache.get(STATUS_SNAPSHOT_KEY) or {}
+  latency = cache.get(LATENCY_KEY) or {'servers': {}, 'hosts': {}}
+  gauges = _Gauges()
+
+  if snapshot:
+    gauges.add(
+      'diamondserv_status_snapshot_age_seconds',
+      'Seconds since the fleet was last probed.',
+      (timezone.now() - snapshot['taken']).total_seconds()
+    )
+
+  _server_gauges(
+    gauges,
+    snapshot.get('statuses', {}),
+    latency['servers'],
+    cache.get(CONTAINER_STATES_KEY) or {}
+  )
+  _host_gauges(gauges, latency['hosts'])
+
+  return gauges.render()
@@ -0,0 +1,272 @@
+"""
+file: wrangler/fakes.py
+author: lkmhaqer
+
+Stand-ins for the things wrangler talks to over the network: minecraft
+servers answering status and ping, and docker daemons answering the handful
+of API calls we make. Our benchmarks run against these, so they measure our
+own code over real sockets without a fleet to hand.
+"""
+import asyncio
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _varint(value):
+  """ Encode an int as a minecraft protocol VarInt. """
+  out = bytearray()
+  while True:
+    byte = value & 0x7F
+    value >>= 7
+    if value:
+      out.append(byte | 0x80)
+    else:
+      out.append(byte)
+      return bytes(out)
+
+async def _read_varint(reader):
+  """ Read a VarInt from a stream. """
+  value = 0
+  for shift in range(0, 35, 7):
+    byte = (await reader.readexactly(1))[0]
+    value |= (byte & 0x7F) << shift
+    if not byte & 0x80:
+      return value
+  raise ValueError('VarInt too long')
+
+def _packet(packet_id, payload):
+  """ Frame a packet, with its length and id. """
+  body = _varint(packet_id) + payload
+  return _varint(len(body)) + body
+
+
+class FakeMinecraftServers:
+  """
+  Minecraft servers on 127.0.0.1, one per port, answering the status and
+  ping of the server list protocol from a background event loop. Ports not
+  listened on refuse connections, which is how a stopped server looks.
+  """
+  def __init__(self, ports, online=3, max_players=20):
+    self.ports = list(ports)
+    self.status = json.dumps({
+      'version': {'name': '1.16.4', 'protocol': 754},
+      'players': {'online': online, 'max': max_players, 'sample': []},
+      'description': {'text': 'A fake minecraft server'},
+    }).encode()
+    self._loop = None
+    self._thread = None
+    self._servers = []
+
+  async def _handle(self, reader, writer):
+    """ Answer packets until the client hangs up. """
+    try:
+      while True:
+        length = await _read_varint(reader)
+        packet = await reader.readexactly(length)
+        if packet[0] == 0 and len(packet) == 1:
+          writer.write(_packet(0, _varint(len(self.status)) + self.status))
+        elif packet[0] == 1:
+          writer.write(_packet(1, packet[1:9]))
+        # Anything else is the handshake, which needs no answer.
+        await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+      pass
+    finally:
+      writer.close()
+
+  async def _listen(self):
+    for port in self.ports:
+      self._servers.append(
+        await asyncio.start_server(self._handle, '127.0.0.1', port, backlog=128)
+      )
+
+  def start(self):
+    """ Start listening on every port, returning once they all are. """
+    self._loop = asyncio.new_event_loop()
+    self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+    self._thread.start()
+    asyncio.run_coroutine_threadsafe(self._listen(), self._loop).result()
+    return self
+
+  def stop(self):
+    """ Close every listener and stop the event loop. """
+    async def close():
+      for server in self._servers:
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run_coroutine_threadsafe(close(), self._loop).result()
+    self._loop.call_soon_threadsafe(self._loop.stop)
+    self._thread.join()
+    self._loop.close()
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self, *exc_info):
+    self.stop()
+
+
+class _DockerHandler(BaseHTTPRequestHandler):
+  """ Answers the docker API calls wrangler makes, from a FakeDocker. """
+  protocol_version = 'HTTP/1.1'
+  # Send each response in one write, or Nagle's algorithm stalls keep-alive.
+  wbufsize = -1
+  disable_nagle_algorithm = True
+
+  def log_message(self, format, *args): # pylint: disable=redefined-builtin
+    pass
+
+  def _reply(self, status, document=None):
+    body = json.dumps(document).encode() if document is not None else b''
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def _body(self):
+    length = int(self.headers.get('Content-Length') or 0)
+    return json.loads(self.rfile.read(length) or b'{}')
+
+  def _path(self):
+    # Drop the API version prefix and the query string.
+    return re.sub(r'^/v[\d.]+', '', self.path.split('?')[0])
+
+  def do_GET(self): # pylint: disable=invalid-name
+    """ Ping, list containers, or inspect one. """
+    docker = self.server.docker
+    path = self._path()
+    if path == '/_ping':
+      self._reply(200, 'OK')
+      return
+    if path == '/containers/json':
+      self._reply(200, docker.listing())
+      return
+
+    match = re.fullmatch(r'/containers/([^/]+)/json', path)
+    container = match and docker.find(match.group(1))
+    if container is None:
+      self._reply(404, {'message': 'No such container'})
+      return
+    self._reply(200, docker.inspect(container))
+
+  def do_POST(self): # pylint: disable=invalid-name
+    """ Create, start, stop or restart a container. """
+    docker = self.server.docker
+    path = self._path()
+    if path == '/containers/create':
+      name = re.search(r'name=([^&]+)', self.path).group(1)
+      container = docker.add(name, self._body())
+      self._reply(201, {'Id': container['Id'], 'Warnings': []})
+      return
+
+    match = re.fullmatch(r'/containers/([^/]+)/(start|stop|restart)', path)
+    container = match and docker.find(match.group(1))
+    if container is None:
+      self._reply(404, {'message': 'No such container'})
+      return
+    container['State'] = 'exited' if match.group(2) == 'stop' else 'running'
+    self._reply(204)
+
+  def do_DELETE(self): # pylint: disable=invalid-name
+    """ Remove a container. """
+    match = re.fullmatch(r'/containers/([^/]+)', self._path())
+    if match is None or not self.server.docker.remove(match.group(1)):
+      self._reply(404, {'message': 'No such container'})
+      return
+    self._reply(204)
+
+
+class FakeDocker:
+  """
+  A docker daemon on address:2375, where DockerClientPool connects to a
+  MineHost named after that address. Containers live in memory.
+  """
+  def __init__(self, address='127.0.0.1', port=2375):
+    self.address = address
+    self.port = port
+    self.containers = {}
+    self._lock = threading.Lock()
+    self._httpd = None
+    self._thread = None
+
+  def add(self, name, config=None):
+    """ Create a container, as docker would from a create call. """
+    config = config or {}
+    bindings = (config.get('HostConfig') or {}).get('PortBindings') or {}
+    ports = [
+      {
+        'PrivatePort': int(private.split('/')[0]),
+        'PublicPort': int(binding[0]['HostPort']),
+        'Type': private.split('/')[1],
+      }
+      for private, binding in bindings.items()
+    ]
+    container = {
+      'Id': f'{name}-{len(self.containers)}',
+      'Names': [f'/{name}'],
+      'Labels': config.get('Labels') or {},
+      'Ports': ports,
+      'State': 'created',
+    }
+    with self._lock:
+      self.containers[name] = container
+    return container
+
+  def find(self, name_or_id):
+    """ Find a container by its name or id. """
+    with self._lock:
+      if name_or_id in self.containers:
+        return self.containers[name_or_id]
+      for container in self.containers.values():
+        if container['Id'] == name_or_id:
+          return container
+    return None
+
+  def remove(self, name_or_id):
+    """ Remove a container, returning whether there was one. """
+    container = self.find(name_or_id)
+    if container is None:
+      return False
+    with self._lock:
+      self.containers.pop(container['Names'][0].lstrip('/'), None)
+    return True
+
+  def listing(self):
+    """ Every container, as the list API describes them. """
+    with self._lock:
+      return list(self.containers.values())
+
+  @staticmethod
+  def inspect(container):
+    """ A container, as the inspect API describes it. """
+    return {
+      'Id': container['Id'],
+      'Name': container['Names'][0],
+      'State': {'Status': container['State']},
+      'Config': {'Labels': container['Labels']},
+    }
+
+  def start(self):
+    """ Start serving the API from a background thread. """
+    self._httpd = ThreadingHTTPServer((self.address, self.port), _DockerHandler)
+    self._httpd.daemon_threads = True
+    self._httpd.docker = self
+    self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+    self._thread.start()
+    return self
+
+  def stop(self):
+    """ Stop serving the API. """
+    self._httpd.shutdown()
+    self._httpd.server_close()
+    self._thread.join()
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self, *exc_info):
+    self.stop()
@@ -8,6 +8,7 @@ from django.forms import ModelForm, ModelMultipleChoiceField, ModelChoiceField
 from accounts.models import MinecraftUser
 
 from .models import MineHost, ServerType, Server
+from .placement import choose_host
 
 
 class ServerForm(ModelForm):
@@ -21,12 +22,14 @@ class ServerForm(ModelForm):
     super(ServerForm, self).__init__(*args, **kwargs) # pylint: disable=R1725
 
     # For the host field, we want to locate all hosts that have less servers
-    # than their self-defined server_limit.
+    # than their self-defined server_limit. Leaving it empty lets our
+    # placement engine choose the best host for the server type.
     self.fields['host'] = ModelChoiceField(
       queryset=MineHost.objects.annotate(
           server_count=Count('server')
         ).filter(server_count__lt=F('server_limit'), enabled=True),
-      required=True,
+      required=False,
+      empty_label='Automatic placement',
     )
     self.fields['server_type'] = ModelChoiceField(
       queryset=ServerType.objects.filter(enabled=True).order_by('name'),
@@ -43,6 +46,15 @@ class ServerForm(ModelForm):
         None,
         f'You are only allowed {self.user.server_limit} servers.'
       )
+      return
+
+    server_type = self.cleaned_data.get('server_type')
+    if server_type and not self.cleaned_data.get('host'):
+      host = choose_host(server_type)
+      if host is None:
+        self.add_error('host', 'No host has room for this server type.')
+      else:
+        self.cleaned_data['host'] = host
 
   def save(self, commit=True):
     server = super(ServerForm, self).save(commit=False) # pylint: disable=R1725
@@ -0,0 +1,182 @@
+"""
+file: wrangler/ftb.py
+author: lkmhaqer
+
+Imports popular Feed The Beast modpacks as ServerTypes. Packs are fetched
+concurrently over one pooled session, and each response is cached with its
+ETag and Last-Modified, so packs that haven't changed aren't downloaded
+again. Whether a pack needs importing is always decided by our database.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .models import EnvironmentVar, ServerType
+
+
+FTB_DOCKER_IMAGE = 'itzg/minecraft-server:multiarch'
+# Every FTB ServerType gets these, as well as its pack and version ids.
+FTB_ENVIRONMENT = (('TYPE', 'FTBA'), ('MEMORY', '4G'))
+
+
+def ftb_session():
+  """Build a session for the FTB API, pooled and retrying failed requests.
+
+  Returns:
+      requests.Session: With a connection for each of our fetch threads.
+  """
+  session = requests.Session()
+  adapter = HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=settings.FTB_CONCURRENCY,
+    max_retries=Retry(
+      total=3,
+      backoff_factor=0.5,
+      status_forcelist=(429, 500, 502, 503, 504),
+    ),
+  )
+  session.mount('http://', adapter)
+  session.mount('https://', adapter)
+  return session
+
+def fetch_json(session, url):
+  """GET a JSON document, revalidating any cached copy we have.
+
+  Args:
+      session (requests.Session): From ftb_session().
+      url (str): The document to fetch.
+
+  Returns:
+      tuple: (document, changed), where changed is False if the server
+        said our cached copy is still current.
+  """
+  key = f'wrangler:ftb:{url}'
+  cached = cache.get(key)
+  headers = {}
+  if cached:
+    if cached['etag']:
+      headers['If-None-Match'] = cached['etag']
+    if cached['last_modified']:
+      headers['If-Modified-Since'] = cached['last_modified']
+
+  response = session.get(url, headers=headers, timeout=settings.FTB_TIMEOUT)
+  if cached and response.status_code == 304:
+    return cached['document'], False
+
+  response.raise_for_status()
+  document = response.json()
+  cache.set(key, {
+    'etag': response.headers.get('ETag'),
+    'last_modified': response.headers.get('Last-Modified'),
+    'document': document,
+  }, None)
+  return document, True
+
+def fetch_packs(api_url, limit):
+  """Fetch the most installed FTB modpacks.
+
+  Args:
+      api_url (str): The modpack API root, ending in a slash.
+      limit (int): How many of the most popular packs to fetch.
+
+  Returns:
+      tuple: ({pack id: pack}, unchanged) for every pack, and a count of
+        those that hadn't changed since we last fetched them. Unchanged
+        packs come from our cache, and are still passed on, as an import
+        that failed or a reset database may be missing them.
+  """
+  with ftb_session() as session:
+    popular, _ = fetch_json(session, f'{api_url}popular/installs/FTB/{limit}')
+    with ThreadPoolExecutor(max_workers=settings.FTB_CONCURRENCY) as pool:
+      fetched = list(pool.map(
+        lambda pack_id: fetch_json(session, f'{api_url}{pack_id}'),
+        popular['packs']
+      ))
+
+  packs = {pack_id: pack for pack_id, (pack, _) in zip(popular['packs'], fetched)}
+  return packs, sum(1 for _, changed in fetched if not changed)
+
+def _environment_vars(wanted):
+  """ Fetch or create EnvironmentVars, keyed by (name, value). """
+  def existing():
+    found = EnvironmentVar.objects.filter(
+      name__in={name for name, _ in wanted},
+      value__in={value for _, value in wanted},
+    )
+    return {(var.name, var.value): var for var in found}
+
+  env_vars = existing()
+  missing = [pair for pair in wanted if pair not in env_vars]
+  if missing:
+    EnvironmentVar.objects.bulk_create(
+      EnvironmentVar(name=name, value=value) for name, value in missing
+    )
+    env_vars = existing()
+  return env_vars
+
+def import_packs(packs):
+  """Create a ServerType for each modpack version we don't have yet.
+
+  Everything is written in one transaction, with a handful of bulk
+  queries no matter how many packs there are.
+
+  Args:
+      packs (dict): FTB modpack documents keyed by pack id.
+
+  Returns:
+      tuple: (created, existing) lists of ServerTypes.
+  """
+  versions = {
+    (pack['name'], pack['versions'][-1]['name']): (pack_id, pack['versions'][-1]['id'])
+    for pack_id, pack in packs.items()
+  }
+
+  def lookup():
+    found = ServerType.objects.filter(
+      name__in={name for name, _ in versions},
+      version__in={version for _, version in versions},
+    )
+    return {
+      (server_type.name, server_type.version): server_type
+      for server_type in found
+      if (server_type.name, server_type.version) in versions
+    }
+
+  with transaction.atomic():
+    existing = lookup()
+    new = [key for key in versions if key not in existing]
+    if not new:
+      return [], list(existing.values())
+
+    ServerType.objects.bulk_create(
+      ServerType(name=name, version=version, docker_image=FTB_DOCKER_IMAGE)
+      for name, version in new
+    )
+    server_types = lookup()
+
+    pack_vars = {
+      key: (
+        ('FTB_MODPACK_ID', str(versions[key][0])),
+        ('FTB_MODPACK_VERSION_ID', str(versions[key][1])),
+      )
+      for key in new
+    }
+    env_vars = _environment_vars(
+      set(FTB_ENVIRONMENT) | {pair for pairs in pack_vars.values() for pair in pairs}
+    )
+    through = ServerType.environment_vars.through
+    through.objects.bulk_create(
+      through(
+        servertype_id=server_types[key].pk,
+        environmentvar_id=env_vars[pair].pk
+      )
+      for key in new
+      for pair in FTB_ENVIRONMENT + pack_vars[key]
+    )
+
+  return [server_types[key] for key in new], list(existing.values())
@@ -0,0 +1,75 @@
+"""
+file: wrangler/hibernation.py
+author: lkmhaqer
+
+Stops servers nobody has played on for a while, so they stop holding their
+host's memory, and marks them hibernated until someone wakes them. Which
+servers are in use comes from our status polls.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .batch import enqueue_batch
+from .models import Job, JobAction, JobState, Server
+
+
+def mark_active(snapshot):
+  """Record which servers had players online in a status snapshot.
+
+  Servers we've never seen active start their idle clock now, so a new
+  server isn't hibernated straight away.
+
+  Args:
+      snapshot (dict): A snapshot from refresh_status_snapshot().
+
+  Returns:
+      int: How many servers were marked active.
+  """
+  playing = [
+    pk for pk, status in snapshot['statuses'].items()
+    if status.get('players', {}).get('online')
+  ]
+  active = Server.objects.filter(pk__in=playing).update(
+    last_active=snapshot['taken']
+  )
+  Server.objects.filter(
+    pk__in=snapshot['statuses'],
+    last_active__isnull=True
+  ).update(last_active=snapshot['taken'])
+
+  return active
+
+def hibernate_idle(now=None):
+  """Queue a hibernate job for every server idle past our threshold.
+
+  A server whose hibernate job failed, say its container is gone or its
+  host is down, isn't tried again until it's been idle that long again,
+  rather than failing another job every poll. Reconcile reports those.
+
+  Args:
+      now (datetime): The current time, for testing.
+
+  Returns:
+      QuerySet: The queued jobs, or None if hibernation is turned off.
+  """
+  if not settings.HIBERNATE_IDLE_MINUTES:
+    return None
+  now = now or timezone.now()
+  since = now - timedelta(minutes=settings.HIBERNATE_IDLE_MINUTES)
+
+  busy = Job.objects.filter(
+    state__in=(JobState.QUEUED, JobState.RUNNING)
+  ).exclude(server=None).values('server')
+  failed = Job.objects.filter(
+    action=JobAction.HIBERNATE,
+    state=JobState.FAILED,
+    finished__gte=since
+  ).exclude(server=None).values('server')
+  idle = Server.objects.filter(
+    hibernated=False,
+    last_active__lt=since
+  ).exclude(pk__in=busy).exclude(pk__in=failed)
+
+  return enqueue_batch(list(idle), JobAction.HIBERNATE)
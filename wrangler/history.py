@@ -0,0 +1,235 @@
+"""
+file: wrangler/history.py
+author: lkmhaqer
+
+Player count history. Every poll of the fleet is recorded as PlayerSample
+rows, which are rolled up into minute, hour and day PlayerRollup rows so
+range queries never have to scan raw samples.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import TruncDay, TruncHour, TruncMinute
+from django.utils import timezone
+
+from .models import PlayerRollup, PlayerSample, Resolution, Server
+from .tasks import HIBERNATED
+
+
+LATENCY_KEY = 'wrangler:latency_percentiles'
+PERCENTILES = (50, 95, 99)
+
+# Each rollup is built from the one finer than it, raw samples first.
+ROLLUPS = (
+  (Resolution.MINUTE, None, TruncMinute),
+  (Resolution.HOUR, Resolution.MINUTE, TruncHour),
+  (Resolution.DAY, Resolution.HOUR, TruncDay),
+)
+
+RAW_AGGREGATES = {
+  'samples': Count('id'),
+  'up_samples': Count('id', filter=Q(up=True)),
+  'online_total': Sum('online'),
+  'online_peak': Max('online'),
+  'capacity_peak': Max('players_max'),
+  'latency_total': Sum('latency'),
+  'latency_samples': Count('latency'),
+}
+
+ROLLUP_AGGREGATES = {
+  'samples': Sum('samples'),
+  'up_samples': Sum('up_samples'),
+  'online_total': Sum('online_total'),
+  'online_peak': Max('online_peak'),
+  'capacity_peak': Max('capacity_peak'),
+  'latency_total': Sum('latency_total'),
+  'latency_samples': Sum('latency_samples'),
+}
+
+
+def record_players(snapshot):
+  """Store one PlayerSample per server from a status snapshot.
+
+  Hibernating servers weren't probed, so they're left out rather than
+  recorded as down. So are servers deleted since the snapshot was taken.
+
+  Args:
+      snapshot (dict): A snapshot from refresh_status_snapshot().
+
+  Returns:
+      list: The PlayerSample rows written.
+  """
+  existing = set(Server.objects.filter(
+    pk__in=snapshot['statuses']
+  ).values_list('pk', flat=True))
+  samples = []
+  for server_pk, status in snapshot['statuses'].items():
+    if server_pk not in existing or status['version'].get('error') == HIBERNATED:
+      continue
+    players = status.get('players', {})
+    samples.append(PlayerSample(
+      server_id=server_pk,
+      timestamp=snapshot['taken'],
+      up='players' in status,
+      online=players.get('online', 0),
+      players_max=players.get('max', 0),
+      # A ping measures the round trip alone, so prefer it.
+      latency=status.get('ping') or status.get('latency'),
+    ))
+
+  return PlayerSample.objects.bulk_create(samples)
+
+def rollup_players():
+  """Bring the minute, hour and day rollups up to date.
+
+  Each resolution is rebuilt from the start of its newest bucket, which
+  may still have been filling up last time, so the work done per poll
+  stays small however long the history gets.
+
+  Returns:
+      int: How many rollup rows were written.
+  """
+  written = 0
+  with transaction.atomic():
+    for resolution, source, trunc in ROLLUPS:
+      rollups = PlayerRollup.objects.filter(resolution=resolution)
+      newest = rollups.order_by('-timestamp').values_list(
+        'timestamp',
+        flat=True
+      ).first()
+
+      if source is None:
+        rows = PlayerSample.objects.all()
+        aggregates = RAW_AGGREGATES
+      else:
+        rows = PlayerRollup.objects.filter(resolution=source)
+        aggregates = ROLLUP_AGGREGATES
+      if newest:
+        rows = rows.filter(timestamp__gte=newest)
+        rollups.filter(timestamp__gte=newest).delete()
+
+      buckets = rows.annotate(bucket=trunc('timestamp')).values(
+        'server',
+        'bucket'
+      ).annotate(**aggregates)
+      written += len(PlayerRollup.objects.bulk_create([
+        PlayerRollup(
+          server_id=bucket['server'],
+          resolution=resolution,
+          timestamp=bucket['bucket'],
+          **{field: bucket[field] or 0 for field in aggregates}
+        )
+        for bucket in buckets
+      ]))
+
+  return written
+
+def prune_players(now=None):
+  """Delete raw samples and rollups older than their retention.
+
+  Args:
+      now (datetime): The current time, for testing.
+
+  Returns:
+      int: How many rows were deleted.
+  """
+  now = now or timezone.now()
+  retention = settings.PLAYER_HISTORY_RETENTION_DAYS
+  deleted, _ = PlayerSample.objects.filter(
+    timestamp__lt=now - timedelta(days=retention[Resolution.RAW])
+  ).delete()
+  for resolution, _, _ in ROLLUPS:
+    pruned, _ = PlayerRollup.objects.filter(
+      resolution=resolution,
+      timestamp__lt=now - timedelta(days=retention[resolution])
+    ).delete()
+    deleted += pruned
+
+  return deleted
+
+def player_history(server, resolution, start, end):
+  """Return the rollups for a server over a time range.
+
+  Args:
+      server (Server): An object of our Server model
+      resolution (Resolution): MINUTE, HOUR or DAY.
+      start (datetime): The first bucket to include.
+      end (datetime): Buckets from this time on are left out.
+
+  Returns:
+      list: A dict per bucket, oldest first.
+  """
+  rollups = PlayerRollup.objects.filter(
+    server=server,
+    resolution=resolution,
+    timestamp__gte=start,
+    timestamp__lt=end
+  ).order_by('timestamp')[:settings.PLAYER_HISTORY_MAX_POINTS]
+
+  return [
+    {
+      'timestamp': rollup.timestamp.isoformat(),
+      'samples': rollup.samples,
+      'uptime': rollup.up_samples / rollup.samples if rollup.samples else 0,
+      'online_avg': rollup.online_avg,
+      'online_peak': rollup.online_peak,
+      'capacity': rollup.capacity_peak,
+      'latency_avg': rollup.latency_avg,
+    }
+    for rollup in rollups
+  ]
+
+def percentiles(values):
+  """Take the nearest-rank percentiles of some latencies.
+
+  Args:
+      values ([float]): Latencies, in any order.
+
+  Returns:
+      dict: p50, p95 and p99, and how many samples they're from.
+  """
+  values = sorted(values)
+  result = {
+    f'p{percentile}': values[max(math.ceil(percentile / 100 * len(values)) - 1, 0)]
+    for percentile in PERCENTILES
+  }
+  result['samples'] = len(values)
+  return result
+
+def refresh_latency_percentiles(now=None):
+  """Work out probe latency percentiles per server and per host, and cache them.
+
+  Only the last STATUS_LATENCY_WINDOW minutes of samples are used, so slow
+  hosts show up while they're slow, and the work per poll stays small.
+
+  Args:
+      now (datetime): The current time, for testing.
+
+  Returns:
+      dict: 'servers' percentiles keyed by Server pk, and 'hosts'
+        keyed by MineHost name.
+  """
+  now = now or timezone.now()
+  rows = PlayerSample.objects.filter(
+    timestamp__gte=now - timedelta(minutes=settings.STATUS_LATENCY_WINDOW),
+    latency__isnull=False
+  ).values_list('server_id', 'server__host__name', 'latency')
+
+  servers = defaultdict(list)
+  hosts = defaultdict(list)
+  for server_pk, host_name, latency in rows:
+    servers[server_pk].append(latency)
+    hosts[host_name].append(latency)
+
+  latency = {
+    'servers': {pk: percentiles(values) for pk, values in servers.items()},
+    'hosts': {name: percentiles(values) for name, values in hosts.items()},
+  }
+  cache.set(LATENCY_KEY, latency, timeout=settings.STATUS_SNAPSHOT_MAX_AGE)
+
+  return latency
@@ -0,0 +1,149 @@
+"""
+file: wrangler/images.py
+author: lkmhaqer
+
+Keeps every enabled ServerType's docker image pulled on every MineHost,
+so creating a server is a container start rather than a download of a
+multi-gigabyte modpack image. What each host has is kept as HostImage rows.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from requests.exceptions import RequestException
+from docker.errors import DockerException
+from docker.utils import parse_repository_tag
+
+from .clients import docker_clients
+from .models import HostImage, ImageState, MineHost, ServerType
+
+
+def normalize_image(image):
+  """Spell an image the way docker lists its tags, with an explicit tag.
+
+  Args:
+      image (str): A docker image, like itzg/minecraft-server
+
+  Returns:
+      str: The image with its tag, like itzg/minecraft-server:latest
+  """
+  repository, tag = parse_repository_tag(image)
+  return f"{repository}:{tag or 'latest'}"
+
+def wanted_images():
+  """ Return every image an enabled ServerType may be started from. """
+  return sorted({
+    normalize_image(image)
+    for image in ServerType.objects.filter(enabled=True).values_list(
+      'docker_image',
+      flat=True
+    )
+  })
+
+def _pull(client, image):
+  """ Pull one image, and describe how it went as HostImage fields. """
+  repository, tag = parse_repository_tag(image)
+  try:
+    pulled = client.images.pull(repository, tag=tag)
+  except (DockerException, RequestException) as err:
+    return {'state': ImageState.FAILED, 'message': str(err)}
+
+  return {
+    'state': ImageState.PRESENT,
+    'image_id': pulled.id,
+    'size': pulled.attrs.get('Size'),
+    'message': '',
+    'pulled': timezone.now(),
+  }
+
+def _warm_host(host, images, concurrency):
+  """Pull whichever images a host is missing.
+
+  Only docker is touched here, so each host can be warmed in its own thread.
+
+  Args:
+      host (MineHost): The host to warm.
+      images ([str]): Normalized images the host should have.
+      concurrency (int): How many images to pull at once.
+
+  Returns:
+      dict: HostImage fields per image, or None if the host is down.
+  """
+  try:
+    client = docker_clients.get(host)
+    local = {
+      tag: image
+      for image in client.images.list()
+      for tag in image.tags
+    }
+  except (DockerException, RequestException):
+    return None
+
+  found = {}
+  for image in images:
+    if image in local:
+      found[image] = {
+        'state': ImageState.PRESENT,
+        'image_id': local[image].id,
+        'size': local[image].attrs.get('Size'),
+        'message': '',
+      }
+
+  missing = [image for image in images if image not in found]
+  if missing:
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+      pulls = pool.map(lambda image: _pull(client, image), missing)
+      found.update(zip(missing, pulls))
+
+  return found
+
+def warm_images(concurrency=None):
+  """Bring every enabled MineHost up to date with our ServerType images.
+
+  Hosts are warmed at the same time, but each pulls only concurrency
+  images at once, so a host's link isn't split across a dozen downloads.
+
+  Args:
+      concurrency (int): Pulls at once per host, defaults to
+        IMAGE_PULL_CONCURRENCY.
+
+  Returns:
+      dict: How many images are present, were pulled, or failed, and
+        how many hosts were down.
+  """
+  concurrency = concurrency or settings.IMAGE_PULL_CONCURRENCY
+  hosts = list(MineHost.objects.filter(enabled=True))
+  images = wanted_images()
+  report = {'present': 0, 'pulled': 0, 'failed': 0, 'down': 0}
+  if not hosts or not images:
+    return report
+
+  with ThreadPoolExecutor(max_workers=len(hosts)) as pool:
+    results = list(pool.map(
+      lambda host: _warm_host(host, images, concurrency),
+      hosts
+    ))
+
+  checked = timezone.now()
+  with transaction.atomic():
+    # Forget images no enabled ServerType uses anymore.
+    HostImage.objects.exclude(image__in=images).delete()
+    for host, found in zip(hosts, results):
+      if found is None:
+        report['down'] += 1
+        continue
+      for image, fields in found.items():
+        if fields['state'] == ImageState.FAILED:
+          report['failed'] += 1
+        elif 'pulled' in fields:
+          report['pulled'] += 1
+        else:
+          report['present'] += 1
+        HostImage.objects.update_or_create(
+          host=host,
+          image=image,
+          defaults={**fields, 'checked': checked},
+        )
+
+  return report
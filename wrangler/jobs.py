@@ -0,0 +1,227 @@
+"""
+file: wrangler/jobs.py
+author: lkmhaqer
+
+Our job queue for container lifecycle operations. Views enqueue a Job and
+return straight away, and the run_jobs worker claims and runs them.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Job, JobAction, JobState, MineHost, Server
+from .tasks import (
+  docker_delete_server,
+  docker_recreate_server,
+  docker_restart_server,
+  docker_start_server,
+  docker_stop_server
+)
+
+
+def _delete_server(server):
+  """ Remove the container, and then the Server it belonged to. """
+  docker_delete_server(server)
+  server.delete()
+
+def _hibernate_server(server):
+  """ Stop the container, and remember it's asleep rather than broken. """
+  docker_stop_server(server)
+  Server.objects.filter(pk=server.pk).update(hibernated=True)
+
+ACTIONS = {
+  JobAction.START: docker_start_server,
+  JobAction.STOP: docker_stop_server,
+  JobAction.RESTART: docker_restart_server,
+  JobAction.RECREATE: docker_recreate_server,
+  JobAction.HIBERNATE: _hibernate_server,
+  JobAction.WAKE: docker_start_server,
+  JobAction.DELETE: _delete_server,
+}
+
+# Once one of these succeeds the server is up, and has just been used.
+WAKING_ACTIONS = (
+  JobAction.START,
+  JobAction.RESTART,
+  JobAction.RECREATE,
+  JobAction.WAKE,
+)
+
+def enqueue(server, action):
+  """Queue up a lifecycle operation for a server.
+
+  Args:
+      server (Server): An object of our Server model
+      action (JobAction): What to do to the server's container.
+
+  Returns:
+      Job: The newly queued job.
+  """
+  return Job.objects.create(
+    server=server,
+    server_name=server.name,
+    action=action
+  )
+
+def _busy_hosts():
+  """ Return the MineHosts already running as many jobs as we allow. """
+  return Job.objects.filter(
+    state=JobState.RUNNING,
+    server__isnull=False
+  ).values('server__host').annotate(
+    running=Count('pk')
+  ).filter(
+    running__gte=settings.JOB_HOST_CONCURRENCY
+  ).values('server__host')
+
+def fail_stale_jobs(now=None):
+  """Fail jobs that have been running longer than JOB_STALE_MINUTES.
+
+  A worker that died mid-job leaves it running forever, holding one of its
+  MineHost's JOB_HOST_CONCURRENCY slots. We don't know how far it got, so
+  rather than run it again we fail it, for someone to look at.
+
+  Args:
+      now (datetime): The current time, for testing.
+
+  Returns:
+      int: How many jobs were failed.
+  """
+  now = now or timezone.now()
+  stale = Job.objects.filter(
+    state=JobState.RUNNING,
+    started__lt=now - timedelta(minutes=settings.JOB_STALE_MINUTES)
+  )
+  # Every claim calls us, and there's rarely anything stale, so don't take
+  # a write lock on the jobs table just to update nothing.
+  if not stale.exists():
+    return 0
+  return stale.update(
+    state=JobState.FAILED,
+    message='Abandoned, its worker stopped before finishing it.',
+    finished=now
+  )
+
+def _claim(pk, host_id):
+  """Mark a queued job as running, if its MineHost has a slot free.
+
+  The host row is locked while we count its running jobs, so two workers
+  can't both take its last slot. SQLite has no row locks, but only lets
+  one transaction write at a time, which comes to the same thing.
+
+  Returns:
+      bool: Whether we claimed the job, or None if its host has no slot.
+  """
+  with transaction.atomic():
+    if host_id is not None:
+      MineHost.objects.select_for_update().filter(pk=host_id).first()
+      running = Job.objects.filter(
+        state=JobState.RUNNING,
+        server__host=host_id
+      ).count()
+      if running >= settings.JOB_HOST_CONCURRENCY:
+        return None
+
+    return bool(Job.objects.filter(pk=pk, state=JobState.QUEUED).update(
+      state=JobState.RUNNING,
+      started=timezone.now()
+    ))
+
+def claim_job(jobs=None):
+  """Take the oldest queued job, marking it as running.
+
+  The claim is a conditional UPDATE, so if several workers race for the
+  same job only one of them wins it, on any database backend. Jobs for a
+  MineHost already running JOB_HOST_CONCURRENCY jobs are left queued, and
+  stale jobs are failed first so they don't hold a host's slots.
+
+  Args:
+      jobs (QuerySet): Only claim from these jobs, such as one batch.
+
+  Returns:
+      Job: The claimed job, or None if there's nothing we can run yet.
+  """
+  if jobs is None:
+    jobs = Job.objects.all()
+
+  fail_stale_jobs()
+  full = set()
+  while True:
+    job = jobs.filter(state=JobState.QUEUED).exclude(
+      server__host__in=_busy_hosts()
+    ).exclude(
+      server__host__in=full
+    ).order_by('created').values_list('pk', 'server__host').first()
+    if job is None:
+      return None
+
+    pk, host_id = job
+    claimed = _claim(pk, host_id)
+    if claimed is None:
+      # Another worker took the host's last slot, try the other hosts.
+      full.add(host_id)
+    elif claimed:
+      return Job.objects.select_related(
+        'server__host',
+        'server__server_type'
+      ).prefetch_related('server__op_list').get(pk=pk)
+
+def perform_job(job):
+  """Run a claimed job's operation, without recording how it went.
+
+  Args:
+      job (Job): A job in the running state, from claim_job().
+
+  Returns:
+      Exception: Why the job failed, or None if it succeeded.
+  """
+  try:
+    if job.server is None:
+      raise LookupError(f'Server {job.server_name} no longer exists.')
+    ACTIONS[job.action](job.server)
+  except Exception as err: # pylint: disable=broad-except
+    return err
+  return None
+
+def finish_job(job, error=None):
+  """Record whether a job succeeded, from perform_job().
+
+  Args:
+      job (Job): A job in the running state.
+      error (Exception): Why it failed, or None if it succeeded.
+
+  Returns:
+      Job: The job, now succeeded or failed.
+  """
+  if error is None:
+    if job.action in WAKING_ACTIONS:
+      Server.objects.filter(pk=job.server.pk).update(
+        hibernated=False,
+        last_active=timezone.now()
+      )
+    job.state = JobState.SUCCEEDED
+    job.message = 'Success!'
+  else:
+    job.state = JobState.FAILED
+    job.message = str(error) or error.__class__.__name__
+
+  if job.action == JobAction.DELETE and job.state == JobState.SUCCEEDED:
+    job.server = None
+  job.finished = timezone.now()
+  job.save()
+
+  return job
+
+def run_job(job):
+  """Run a claimed job, and record whether it succeeded.
+
+  Args:
+      job (Job): A job in the running state, from claim_job().
+
+  Returns:
+      Job: The job, now succeeded or failed.
+  """
+  return finish_job(job, perform_job(job))
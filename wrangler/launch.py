@@ -0,0 +1,78 @@
+"""
+file: wrangler/launch.py
+author: lkmhaqer
+
+Everything docker needs from a ServerType to start a container, worked out
+once and cached. wrangler.signals drops a type's spec whenever the type or
+any of its EnvironmentVars change, so the cached spec is never stale.
+"""
+from django.core.cache import cache
+
+from .models import ServerType
+
+
+# Mounted read only into servers that load a CurseForge modpack zip.
+MODPACK_VOLUME = {'/srv/modpacks': {'bind': '/modpacks', 'mode': 'ro'}}
+
+
+def _spec_key(server_type_pk):
+  """ Return the cache key of a ServerType's launch spec. """
+  return f'wrangler:launch_spec:{server_type_pk}'
+
+def build_launch_spec(server_type):
+  """Work out the image, environment and volumes for a ServerType.
+
+  Args:
+      server_type (ServerType): The type to build a spec for.
+
+  Returns:
+      dict: The image, a list of NAME=value environment strings, and
+        the volumes to mount, or None.
+  """
+  environment = []
+  volumes = None
+  for name, value in server_type.environment_vars.values_list('name', 'value'):
+    environment.append(f'{name}={value}')
+    if name == 'CF_SERVER_MOD':
+      volumes = MODPACK_VOLUME
+
+  return {
+    'name': server_type.name,
+    'image': server_type.docker_image,
+    'environment': environment,
+    'volumes': volumes,
+  }
+
+def launch_spec(server_type):
+  """Fetch a ServerType's launch spec, building and caching it if needed.
+
+  Args:
+      server_type (ServerType): The type of the server being started.
+
+  Returns:
+      dict: The spec, as from build_launch_spec().
+  """
+  key = _spec_key(server_type.pk)
+  spec = cache.get(key)
+  if spec is None:
+    spec = build_launch_spec(server_type)
+    # Expire as usual too, in case a signal fired in a process that
+    # doesn't share our cache.
+    cache.set(key, spec)
+  return spec
+
+def invalidate_launch_specs(server_type_pks):
+  """Drop the cached launch specs of some ServerTypes.
+
+  Args:
+      server_type_pks (iterable): The primary keys of the changed types.
+  """
+  cache.delete_many([_spec_key(pk) for pk in server_type_pks])
+
+def invalidate_for_environment_var(environment_var):
+  """ Drop the launch specs of every ServerType using an EnvironmentVar. """
+  invalidate_launch_specs(
+    ServerType.objects.filter(
+      environment_vars=environment_var
+    ).values_list('pk', flat=True)
+  )
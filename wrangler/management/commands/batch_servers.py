@@ -0,0 +1,137 @@
+"""
+file: wrangler/management/commands/batch_servers.py
+author: lkmhaqer
+
+Start, stop, restart or recreate a set of servers at once, for instance to
+roll a new ServerType image out with:
+
+  python manage.py batch_servers recreate --type FTB
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from wrangler.batch import batch_progress, enqueue_batch, fleet_servers # pylint: disable=import-error
+from wrangler.jobs import claim_job, finish_job, perform_job # pylint: disable=import-error
+from wrangler.models import JobAction, JobState # pylint: disable=import-error
+
+
+BATCH_ACTIONS = (
+  JobAction.START,
+  JobAction.STOP,
+  JobAction.RESTART,
+  JobAction.RECREATE,
+)
+
+
+class Command(BaseCommand):
+  """
+  Queue a job for every server matching --host, --type and --owner, then
+  report progress until they're done. The run_jobs worker picks the jobs
+  up, or with --workers we run them here ourselves.
+  """
+
+  help = 'Runs a lifecycle operation against many servers at once'
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+      'action',
+      choices=[action.value for action in BATCH_ACTIONS],
+      help='What to do to each server.',
+    )
+    parser.add_argument('--host', help='Only servers on this MineHost.')
+    parser.add_argument('--type', help='Only servers of this ServerType.')
+    parser.add_argument('--owner', help='Only servers owned by this user.')
+    parser.add_argument(
+      '--workers',
+      type=int,
+      default=0,
+      help='Run the jobs here with this many threads, not in run_jobs.',
+    )
+    parser.add_argument(
+      '--poll-interval',
+      type=float,
+      default=2.0,
+      help='Seconds between progress reports.',
+    )
+    parser.add_argument(
+      '--no-wait',
+      action='store_true',
+      help='Queue the jobs and exit, without waiting for them.',
+    )
+
+  def _work(self, jobs, turns):
+    """
+    Claim and run this batch's jobs, until none are left for us. Database
+    work is done in turns, the jobs' operations side by side.
+    """
+    try:
+      while True:
+        with turns:
+          job = claim_job(jobs)
+          waiting = job is None and jobs.filter(state=JobState.QUEUED).exists()
+        if job is None:
+          if not waiting:
+            return
+          # Every host with work left is at its limit, wait for a slot.
+          time.sleep(0.5)
+          continue
+        error = perform_job(job)
+        with turns:
+          finish_job(job, error)
+    finally:
+      connection.close()
+
+  def _report(self, progress):
+    """ Write a single progress line for the batch. """
+    done = progress[JobState.SUCCEEDED] + progress[JobState.FAILED]
+    self.stdout.write(
+      f"{done}/{progress['total']} done: "
+      f'{progress[JobState.SUCCEEDED]} succeeded, '
+      f'{progress[JobState.FAILED]} failed, '
+      f'{progress[JobState.RUNNING]} running, '
+      f'{progress[JobState.QUEUED]} queued'
+    )
+    return done == progress['total']
+
+  def handle(self, *args, **options):
+    servers = list(fleet_servers(
+      host=options['host'],
+      server_type=options['type'],
+      owner=options['owner'],
+    ))
+    if not servers:
+      raise CommandError('No servers match those filters.')
+
+    jobs = enqueue_batch(servers, options['action'])
+    self.stdout.write(f"Queued {options['action']} for {len(servers)} servers")
+    if options['no_wait']:
+      return
+
+    # SQLite lets one connection write at a time, and in some modes fails
+    # rather than waits for another, so there our workers take turns at
+    # the database. Their docker calls still run side by side.
+    turns = threading.Lock() if connection.vendor == 'sqlite' else nullcontext()
+    with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as pool:
+      workers = [
+        pool.submit(self._work, jobs, turns)
+        for _ in range(options['workers'])
+      ]
+      while True:
+        with turns:
+          progress = batch_progress(jobs)
+        if self._report(progress):
+          break
+        # Our own workers only stop once the batch is done, or broken.
+        if workers and all(worker.done() for worker in workers):
+          break
+        time.sleep(options['poll_interval'])
+      for worker in workers:
+        worker.result()
+
+    for job in jobs.filter(state=JobState.FAILED):
+      self.stderr.write(f'{job.server_name}: {job.message}')
@@ -0,0 +1,104 @@
+"""
+file: wrangler/management/commands/benchmark.py
+author: lkmhaqer
+
+Benchmark wrangler's hot paths against fake minecraft servers and docker
+daemons. Save a baseline on master, then compare a branch against it:
+
+  python manage.py benchmark --save baseline.json
+  python manage.py benchmark --compare baseline.json
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+  override_settings,
+  setup_test_environment,
+  teardown_test_environment
+)
+
+from wrangler.benchmarks import compare, run_benchmarks # pylint: disable=import-error
+
+
+BENCHMARK_CACHES = {
+  'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'wrangler-benchmark',
+  }
+}
+
+
+class Command(BaseCommand):
+  """
+  Run the benchmarks in a throwaway test database and a private cache, so
+  neither our data nor a shared memcached is touched. With --compare, any
+  metric worse than the baseline by more than --tolerance fails the command.
+  """
+
+  help = 'Benchmarks status probes, port allocation, the status page and docker'
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+      '--sizes',
+      default='10,100,1000',
+      help='Comma separated fleet sizes to benchmark at.',
+    )
+    parser.add_argument(
+      '--repeat',
+      type=int,
+      default=5,
+      help='Timed runs per measurement, we report their median.',
+    )
+    parser.add_argument(
+      '--only',
+      help='Only run benchmarks whose name starts with this.',
+    )
+    parser.add_argument('--save', help='Write the results to this JSON file.')
+    parser.add_argument('--compare', help='Compare against results saved with --save.')
+    parser.add_argument(
+      '--tolerance',
+      type=float,
+      default=0.25,
+      help='How much slower a timing may be than the baseline, 0.25 is 25%%.',
+    )
+
+  def handle(self, *args, **options):
+    try:
+      sizes = [int(size) for size in options['sizes'].split(',')]
+    except ValueError as err:
+      raise CommandError(f"Bad --sizes {options['sizes']}") from err
+
+    baseline = None
+    if options['compare']:
+      with open(options['compare']) as baseline_file:
+        baseline = json.load(baseline_file)
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+      with override_settings(CACHES=BENCHMARK_CACHES):
+        results = run_benchmarks(sizes, options['repeat'], options['only'])
+    finally:
+      connection.creation.destroy_test_db(old_name, verbosity=0)
+      teardown_test_environment()
+
+    for name, metrics in results.items():
+      self.stdout.write(name)
+      for metric, value in metrics.items():
+        before = (baseline or {}).get(name, {}).get(metric)
+        change = f'  ({(value - before) / before:+.0%})' if before else ''
+        self.stdout.write(f'  {metric:<20} {value:>12.6g}{change}')
+
+    if options['save']:
+      with open(options['save'], 'w') as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+      self.stdout.write(f"Saved results to {options['save']}")
+
+    if baseline is not None:
+      regressions = compare(baseline, results, options['tolerance'])
+      for name, metric, before, value in regressions:
+        self.stderr.write(f'{name} {metric} regressed: {before:.6g} -> {value:.6g}')
+      if regressions:
+        raise CommandError(f'{len(regressions)} metrics regressed.')
+      self.stdout.write('No regressions against the baseline.')
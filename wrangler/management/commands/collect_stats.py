@@ -0,0 +1,53 @@
+"""
+file: wrangler/management/commands/collect_stats.py
+author: lkmhaqer
+
+Samples CPU, memory, network and disk use across the fleet, for sizing
+server_limit per host and finding servers that eat a whole box.
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from diamondserv.db import refresh_connections # pylint: disable=import-error
+
+from wrangler.telemetry import collect_samples, downsample # pylint: disable=import-error
+
+
+class Command(BaseCommand):
+  """
+  Sample every container every --interval seconds, forever,
+  or just the once with --once.
+  """
+
+  help = 'Collects docker resource stats from every MineHost'
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+      '--interval',
+      type=int,
+      default=settings.TELEMETRY_INTERVAL,
+      help='Seconds between each round of samples.',
+    )
+    parser.add_argument(
+      '--once',
+      action='store_true',
+      help='Sample the fleet one time and exit.',
+    )
+
+  def handle(self, *args, **options):
+    while True:
+      refresh_connections()
+      started = time.monotonic()
+      samples = collect_samples()
+      rollups, deleted = downsample()
+      elapsed = time.monotonic() - started
+      self.stdout.write(
+        f'Wrote {len(samples)} samples and {rollups} rollups, '
+        f'pruned {deleted} rows in {elapsed:.2f}s'
+      )
+
+      if options['once']:
+        break
+      time.sleep(max(options['interval'] - elapsed, 0))
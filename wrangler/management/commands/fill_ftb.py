@@ -1,20 +1,14 @@
 """
-file: utils/ftb_servertypes.py
+file: wrangler/management/commands/fill_ftb.py
 author: lkmhaqer
 
-Just a little utility to walk the FTB api and get the top ten modpacks.
+Just a little utility to walk the FTB api and get the most popular modpacks.
 """
-import json
-import requests
-
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.db.utils import IntegrityError
-
-from wrangler.models import EnvironmentVar, ServerType # pylint: disable=import-error
 
+from wrangler.ftb import fetch_packs, import_packs # pylint: disable=import-error
 
-FTB_TOP_URL = 'https://api.modpacks.ch/public/modpack/popular/installs/FTB/20'
-FTB_MODPACK_URL = 'https://api.modpacks.ch/public/modpack/'
 
 class Command(BaseCommand):
   """
@@ -25,43 +19,35 @@ class Command(BaseCommand):
 
   help = 'Fills the DB with server-types from the FTB API'
 
-  def handle(self, *args, **options):
-    response = requests.get(FTB_TOP_URL)
-    query = json.loads(response.text)
+  def add_arguments(self, parser):
+    parser.add_argument(
+      '--api-url',
+      default=settings.FTB_API_URL,
+      help='The FTB modpack API root.',
+    )
+    parser.add_argument(
+      '--limit',
+      type=int,
+      default=20,
+      help='How many of the most installed packs to import.',
+    )
 
-    for i in query['packs']:
-      response = requests.get(f'{FTB_MODPACK_URL}{i}')
-      pack = json.loads(response.text)
-
-      try:
-        servertype, created = ServerType.objects.get_or_create(
-          name=pack["name"],
-          version=pack["versions"][-1]["name"],
-          docker_image='itzg/minecraft-server:multiarch',
-        )
-      except IntegrityError:
-        created = False
-
-      if created:
-        ftb_type = EnvironmentVar.objects.get(name='TYPE', value='FTBA')
-        mem_var = EnvironmentVar.objects.get(name='MEMORY', value='4G')
-        ftb_mod, created = EnvironmentVar.objects.get_or_create(
-          name='FTB_MODPACK_ID',
-          value=i
-        )
-        ftb_mod_version, created = EnvironmentVar.objects.get_or_create(
-          name='FTB_MODPACK_VERSION_ID',
-          value=pack["versions"][-1]["id"]
-        )
-        servertype.environment_vars.add(mem_var.id, ftb_type.id, ftb_mod.id, ftb_mod_version.id)
-        self.stdout.write(
-          self.style.SUCCESS(
-            f'Found {servertype}'
-          )
+  def handle(self, *args, **options):
+    api_url = options['api_url'].rstrip('/') + '/'
+    packs, unchanged = fetch_packs(api_url, options['limit'])
+    created, existing = import_packs(packs)
+
+    for servertype in created:
+      self.stdout.write(
+        self.style.SUCCESS(
+          f'Found {servertype}'
         )
-      else:
-        self.stdout.write(
-          self.style.WARNING(
-            f'{servertype} already exists.'
-          )
+      )
+    for servertype in existing:
+      self.stdout.write(
+        self.style.WARNING(
+          f'{servertype} already exists.'
         )
+      )
+    if unchanged:
+      self.stdout.write(f'{unchanged} packs unchanged since our last import.')
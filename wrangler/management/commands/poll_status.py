@@ -0,0 +1,68 @@
+"""
+file: wrangler/management/commands/poll_status.py
+author: lkmhaqer
+
+Keeps our fleet status snapshot fresh, so page views never probe
+minecraft servers themselves, records each poll in our player
+history, and hibernates idle servers. Run it beside gunicorn under
+supervisor.
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from diamondserv.db import refresh_connections # pylint: disable=import-error
+
+from wrangler.hibernation import hibernate_idle, mark_active # pylint: disable=import-error
+from wrangler.history import ( # pylint: disable=import-error
+  prune_players,
+  record_players,
+  refresh_latency_percentiles,
+  rollup_players
+)
+from wrangler.tasks import refresh_status_snapshot # pylint: disable=import-error
+
+
+class Command(BaseCommand):
+  """
+  Refresh the status snapshot every --interval seconds, forever,
+  or just the once with --once.
+  """
+
+  help = 'Periodically probes every server and caches a status snapshot'
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+      '--interval',
+      type=int,
+      default=settings.STATUS_POLL_INTERVAL,
+      help='Seconds between each refresh of the snapshot.',
+    )
+    parser.add_argument(
+      '--once',
+      action='store_true',
+      help='Refresh the snapshot one time and exit.',
+    )
+
+  def handle(self, *args, **options):
+    while True:
+      refresh_connections()
+      started = time.monotonic()
+      snapshot = refresh_status_snapshot()
+      record_players(snapshot)
+      refresh_latency_percentiles()
+      rollup_players()
+      prune_players()
+      mark_active(snapshot)
+      hibernating = hibernate_idle()
+      elapsed = time.monotonic() - started
+      self.stdout.write(
+        f"Polled {len(snapshot['statuses'])} servers in {elapsed:.2f}s"
+      )
+      if hibernating:
+        self.stdout.write(f'Hibernating {hibernating.count()} idle servers')
+
+      if options['once']:
+        break
+      time.sleep(max(options['interval'] - elapsed, 0))
@@ -0,0 +1,61 @@
+"""
+file: wrangler/management/commands/reconcile.py
+author: lkmhaqer
+
+Reports where our Server rows and the containers on each MineHost have
+drifted apart, and with --repair puts them right.
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from diamondserv.db import refresh_connections # pylint: disable=import-error
+
+from wrangler.reconcile import find_drift, repair # pylint: disable=import-error
+
+
+class Command(BaseCommand):
+  """
+  Check the fleet for drift every --interval seconds, forever,
+  or just the once with --once.
+  """
+
+  help = 'Diffs Server rows against the containers on every MineHost'
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+      '--interval',
+      type=int,
+      default=settings.RECONCILE_INTERVAL,
+      help='Seconds between each check of the fleet.',
+    )
+    parser.add_argument(
+      '--repair',
+      action='store_true',
+      help='Start missing containers, remove orphans and fix ports.',
+    )
+    parser.add_argument(
+      '--once',
+      action='store_true',
+      help='Check the fleet one time and exit.',
+    )
+
+  def handle(self, *args, **options):
+    while True:
+      refresh_connections()
+      started = time.monotonic()
+      drift, down = find_drift()
+      for host in down:
+        self.stderr.write(f'{host.name}: unable to list containers')
+      for item in drift:
+        line = f'{item.host.name}/{item.name}: {item.kind}, {item.detail}'
+        if options['repair']:
+          line = f'{line}: {repair(item)}'
+        self.stdout.write(line)
+      elapsed = time.monotonic() - started
+      self.stdout.write(f'Found {len(drift)} drifted containers in {elapsed:.2f}s')
+
+      if options['once']:
+        break
+      time.sleep(max(options['interval'] - elapsed, 0))
@@ -0,0 +1,69 @@
+"""
+file: wrangler/management/commands/run_jobs.py
+author: lkmhaqer
+
+Our job worker, run under supervisor beside gunicorn. Every worker thread
+claims queued jobs and runs them, so several hosts can be worked on at once.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from diamondserv.db import refresh_connections # pylint: disable=import-error
+
+from wrangler.jobs import claim_job, run_job # pylint: disable=import-error
+
+
+class Command(BaseCommand):
+  """
+  Run queued container lifecycle jobs with --workers threads, polling the
+  queue every --poll-interval seconds when it's empty.
+  """
+
+  help = 'Runs queued container lifecycle jobs'
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+      '--workers',
+      type=int,
+      default=4,
+      help='How many jobs may run at the same time.',
+    )
+    parser.add_argument(
+      '--poll-interval',
+      type=float,
+      default=1.0,
+      help='Seconds to wait before checking an empty queue again.',
+    )
+    parser.add_argument(
+      '--once',
+      action='store_true',
+      help='Exit once the queue is empty.',
+    )
+
+  def _work(self, options):
+    """ Claim and run jobs until the queue is empty, or forever. """
+    try:
+      while True:
+        refresh_connections()
+        job = claim_job()
+        if job is None:
+          if options['once']:
+            return
+          time.sleep(options['poll_interval'])
+          continue
+
+        job = run_job(job)
+        self.stdout.write(f'Job {job.pk}: {job}')
+    finally:
+      connection.close()
+
+  def handle(self, *args, **options):
+    with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+      workers = [
+        pool.submit(self._work, options) for _ in range(options['workers'])
+      ]
+      for worker in workers:
+        worker.result()
@@ -0,0 +1,59 @@
+"""
+file: wrangler/management/commands/warm_images.py
+author: lkmhaqer
+
+Pre-pulls ServerType images onto every MineHost, run under supervisor so
+new servers never wait on a download.
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from diamondserv.db import refresh_connections # pylint: disable=import-error
+
+from wrangler.images import warm_images # pylint: disable=import-error
+
+
+class Command(BaseCommand):
+  """
+  Warm every host's images every --interval seconds, forever,
+  or just the once with --once.
+  """
+
+  help = 'Pulls enabled ServerType images onto every MineHost'
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+      '--interval',
+      type=int,
+      default=settings.IMAGE_WARM_INTERVAL,
+      help='Seconds between each check of the fleet.',
+    )
+    parser.add_argument(
+      '--concurrency',
+      type=int,
+      default=settings.IMAGE_PULL_CONCURRENCY,
+      help='How many images each host pulls at once.',
+    )
+    parser.add_argument(
+      '--once',
+      action='store_true',
+      help='Warm the fleet one time and exit.',
+    )
+
+  def handle(self, *args, **options):
+    while True:
+      refresh_connections()
+      started = time.monotonic()
+      report = warm_images(concurrency=options['concurrency'])
+      elapsed = time.monotonic() - started
+      self.stdout.write(
+        f"{report['present']} images present, {report['pulled']} pulled, "
+        f"{report['failed']} failed, {report['down']} hosts down "
+        f'in {elapsed:.2f}s'
+      )
+
+      if options['once']:
+        break
+      time.sleep(max(options['interval'] - elapsed, 0))
@@ -0,0 +1,40 @@
+# Generated by Django 3.1.3 on 2026-10-18 08:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wrangler', '0010_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceSample',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('container', models.CharField(blank=True, default='', max_length=255)),
+                ('resolution', models.CharField(choices=[('raw', 'Raw'), ('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day')], default='raw', max_length=8)),
+                ('timestamp', models.DateTimeField()),
+                ('cpu_percent', models.FloatField(default=0)),
+                ('memory_bytes', models.BigIntegerField(default=0)),
+                ('memory_limit', models.BigIntegerField(default=0)),
+                ('net_rx_bytes', models.BigIntegerField(default=0)),
+                ('net_tx_bytes', models.BigIntegerField(default=0)),
+                ('block_read_bytes', models.BigIntegerField(default=0)),
+                ('block_write_bytes', models.BigIntegerField(default=0)),
+                ('host', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='wrangler.minehost')),
+                ('server', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='wrangler.server')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='resourcesample',
+            index=models.Index(fields=['host', 'container', 'resolution', 'timestamp'], name='wrangler_re_host_id_8e4412_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resourcesample',
+            index=models.Index(fields=['resolution', 'timestamp'], name='wrangler_re_resolut_4cb44d_idx'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 3.1.3 on 2026-10-18 08:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wrangler', '0011_resourcesample'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerSample',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('up', models.BooleanField(default=False)),
+                ('online', models.IntegerField(default=0)),
+                ('players_max', models.IntegerField(default=0)),
+                ('latency', models.FloatField(blank=True, null=True)),
+                ('server', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='wrangler.server')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PlayerRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('raw', 'Raw'), ('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day')], max_length=8)),
+                ('timestamp', models.DateTimeField()),
+                ('samples', models.IntegerField(default=0)),
+                ('up_samples', models.IntegerField(default=0)),
+                ('online_total', models.BigIntegerField(default=0)),
+                ('online_peak', models.IntegerField(default=0)),
+                ('capacity_peak', models.IntegerField(default=0)),
+                ('latency_total', models.FloatField(default=0)),
+                ('latency_samples', models.IntegerField(default=0)),
+                ('server', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='wrangler.server')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='playersample',
+            index=models.Index(fields=['timestamp'], name='wrangler_pl_timesta_ab3c60_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playersample',
+            index=models.Index(fields=['server', 'timestamp'], name='wrangler_pl_server__e60de5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playerrollup',
+            index=models.Index(fields=['resolution', 'timestamp'], name='wrangler_pl_resolut_b42e69_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='playerrollup',
+            unique_together={('server', 'resolution', 'timestamp')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.3 on 2026-10-18 08:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wrangler', '0012_player_history'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='action',
+            field=models.CharField(choices=[('start', 'Start'), ('stop', 'Stop'), ('restart', 'Restart'), ('recreate', 'Recreate'), ('delete', 'Delete')], max_length=16),
+        ),
+    ]
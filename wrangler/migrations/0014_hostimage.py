@@ -0,0 +1,31 @@
+# Generated by Django 3.1.3 on 2026-10-18 08:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wrangler', '0013_job_stop_recreate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HostImage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.CharField(max_length=255)),
+                ('state', models.CharField(choices=[('missing', 'Missing'), ('present', 'Present'), ('failed', 'Failed')], default='missing', max_length=8)),
+                ('image_id', models.CharField(blank=True, default='', max_length=80)),
+                ('size', models.BigIntegerField(blank=True, null=True)),
+                ('message', models.TextField(blank=True, default='')),
+                ('pulled', models.DateTimeField(blank=True, null=True)),
+                ('checked', models.DateTimeField()),
+                ('host', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='wrangler.minehost')),
+            ],
+            options={
+                'unique_together': {('host', 'image')},
+            },
+        ),
+    ]
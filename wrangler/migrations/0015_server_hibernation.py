@@ -0,0 +1,28 @@
+# Generated by Django 3.1.3 on 2026-10-18 08:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wrangler', '0014_hostimage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='server',
+            name='hibernated',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='server',
+            name='last_active',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='action',
+            field=models.CharField(choices=[('start', 'Start'), ('stop', 'Stop'), ('restart', 'Restart'), ('recreate', 'Recreate'), ('hibernate', 'Hibernate'), ('wake', 'Wake'), ('delete', 'Delete')], max_length=16),
+        ),
+    ]
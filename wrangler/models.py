@@ -3,7 +3,9 @@ file: wrangler/models.py
 author: lkmhaqer
 """
 from django.conf import settings
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, transaction
+from django.db.models import Exists, OuterRef
 
 from accounts.models import MinecraftUser
 
@@ -55,6 +57,17 @@ class ServerType(models.Model):
     return f'{self.name} ({self.version})'
 
 
+class ServerQuerySet(models.QuerySet):
+  """ The ways we commonly fetch servers, with what they'll need joined. """
+  def for_display(self):
+    """ Servers with their host and type, as our pages and probes use. """
+    return self.select_related('host', 'server_type')
+
+  def for_launch(self):
+    """ Servers with everything docker_start_server reads from them. """
+    return self.for_display().prefetch_related('op_list')
+
+
 class Server(models.Model):
   """
   Our server object, this represents an instance of a
@@ -82,6 +95,11 @@ class Server(models.Model):
     blank=True,
     null=True,
   )
+  # Idle servers are stopped to free their host's memory, until woken.
+  hibernated = models.BooleanField(default=False)
+  last_active = models.DateTimeField(blank=True, null=True)
+
+  objects = ServerQuerySet.as_manager()
 
   class Meta:
     unique_together = ('host', 'port')
@@ -93,22 +111,255 @@ class Server(models.Model):
     update_fields=None):
     """
     If this is our first time saving the record,
-    set the port to the next available value
+    set the port to the lowest available value
     in the host's min_port to max_port range.
     This can be overwritten if port is specified
     in the Server object when you create it.
+
+    The host row is locked while we pick a port, and if another create
+    still beats us to it, we pick again.
+    """
+    if self.pk or self.port:
+      super().save(force_insert, force_update, using, update_fields)
+      return
+
+    for attempt in range(settings.PORT_ALLOCATION_ATTEMPTS):
+      try:
+        with transaction.atomic(using=using):
+          MineHost.objects.select_for_update().filter(pk=self.host_id).first()
+          self.port = self._next_free_port()
+          super().save(force_insert, force_update, using, update_fields)
+        return
+      except IntegrityError:
+        port_taken = self.__class__.objects.filter(
+          host=self.host_id,
+          port=self.port
+        ).exists()
+        self.port = None
+        if not port_taken or attempt + 1 == settings.PORT_ALLOCATION_ATTEMPTS:
+          raise
+
+  def _next_free_port(self):
+    """
+    Return the lowest unused port on our host. Rather than walking the
+    whole range, we ask the database for the first used port whose
+    successor is free, which the (host, port) index answers directly.
     """
-    if not self.pk and not self.port:
-      port_list = list(
-        self.__class__.objects.filter(host=self.host)
-        .values_list('port', flat=True)
-      )
-      self.port = next(
-        p for p in range(self.host.min_port, self.host.max_port) if p not in port_list
-      )
+    host = self.host
+    taken = self.__class__.objects.filter(host=host)
+    if not taken.filter(port=host.min_port).exists():
+      return host.min_port
 
-    super().save()
+    port = (
+      taken.filter(port__gte=host.min_port, port__lt=host.max_port - 1)
+      .annotate(next_taken=Exists(taken.filter(port=OuterRef('port') + 1)))
+      .filter(next_taken=False)
+      .order_by('port')
+      .values_list('port', flat=True)
+      .first()
+    )
+    if port is None:
+      raise ValidationError(f'{host} has no free ports left.')
+
+    return port + 1
 
   def get_socket(self):
     """ return just the host:port socket URI """
     return f'{self.host.name}:{self.port}'
+
+
+class JobAction(models.TextChoices):
+  """ The container lifecycle operations a Job can run """
+  START = 'start'
+  STOP = 'stop'
+  RESTART = 'restart'
+  RECREATE = 'recreate'
+  HIBERNATE = 'hibernate'
+  WAKE = 'wake'
+  DELETE = 'delete'
+
+
+class JobState(models.TextChoices):
+  """ Where a Job is in its life, from queued to done """
+  QUEUED = 'queued'
+  RUNNING = 'running'
+  SUCCEEDED = 'succeeded'
+  FAILED = 'failed'
+
+
+class Job(models.Model):
+  """
+  A queued container lifecycle operation against a Server.
+  Views enqueue these, and the run_jobs worker runs them,
+  so no web request waits on docker.
+  """
+  server = models.ForeignKey(
+    Server,
+    on_delete=models.SET_NULL,
+    blank=True,
+    null=True
+  )
+  # Kept so we can still show which server a finished delete was for.
+  server_name = models.SlugField(max_length=32)
+  action = models.CharField(max_length=16, choices=JobAction.choices)
+  state = models.CharField(
+    max_length=16,
+    choices=JobState.choices,
+    default=JobState.QUEUED,
+    db_index=True
+  )
+  message = models.TextField(blank=True, default='')
+  created = models.DateTimeField(auto_now_add=True)
+  started = models.DateTimeField(blank=True, null=True)
+  finished = models.DateTimeField(blank=True, null=True)
+
+  class Meta:
+    ordering = ['created']
+
+  def __str__(self):
+    return f'{self.action} {self.server_name} ({self.state})'
+
+  @property
+  def done(self):
+    """ return True once the job has succeeded or failed """
+    return self.state in (JobState.SUCCEEDED, JobState.FAILED)
+
+
+class ImageState(models.TextChoices):
+  """ Whether a MineHost has a ServerType's image yet """
+  MISSING = 'missing'
+  PRESENT = 'present'
+  FAILED = 'failed'
+
+
+class HostImage(models.Model):
+  """
+  A ServerType docker image on a MineHost, as last seen by the
+  warm_images command, which pulls the missing ones ahead of time.
+  """
+  host = models.ForeignKey(MineHost, on_delete=models.CASCADE)
+  image = models.CharField(max_length=255)
+  state = models.CharField(
+    max_length=8,
+    choices=ImageState.choices,
+    default=ImageState.MISSING
+  )
+  image_id = models.CharField(max_length=80, blank=True, default='')
+  size = models.BigIntegerField(blank=True, null=True)
+  message = models.TextField(blank=True, default='')
+  pulled = models.DateTimeField(blank=True, null=True)
+  checked = models.DateTimeField()
+
+  class Meta:
+    unique_together = ('host', 'image')
+
+  def __str__(self):
+    return f'{self.image} on {self.host.name} ({self.state})'
+
+
+class Resolution(models.TextChoices):
+  """ How much time a time-series row covers """
+  RAW = 'raw'
+  MINUTE = 'minute'
+  HOUR = 'hour'
+  DAY = 'day'
+
+
+class ResourceSample(models.Model):
+  """
+  CPU, memory, network and disk use of a container, or with no container,
+  the total across a MineHost. Raw samples are downsampled into hourly
+  rows by the collect_stats command, which also prunes old rows.
+  """
+  host = models.ForeignKey(MineHost, on_delete=models.CASCADE)
+  # Containers we don't have a Server for are still sampled, by name.
+  container = models.CharField(max_length=255, blank=True, default='')
+  server = models.ForeignKey(
+    Server,
+    on_delete=models.SET_NULL,
+    blank=True,
+    null=True
+  )
+  resolution = models.CharField(
+    max_length=8,
+    choices=Resolution.choices,
+    default=Resolution.RAW
+  )
+  timestamp = models.DateTimeField()
+  cpu_percent = models.FloatField(default=0)
+  memory_bytes = models.BigIntegerField(default=0)
+  memory_limit = models.BigIntegerField(default=0)
+  net_rx_bytes = models.BigIntegerField(default=0)
+  net_tx_bytes = models.BigIntegerField(default=0)
+  block_read_bytes = models.BigIntegerField(default=0)
+  block_write_bytes = models.BigIntegerField(default=0)
+
+  class Meta:
+    indexes = [
+      models.Index(fields=['host', 'container', 'resolution', 'timestamp']),
+      models.Index(fields=['resolution', 'timestamp']),
+    ]
+
+  def __str__(self):
+    target = self.container or self.host.name
+    return f'{target} @ {self.timestamp} ({self.resolution})'
+
+
+class PlayerSample(models.Model):
+  """
+  One status probe of a Server, as recorded by our poller. These are
+  rolled up into PlayerRollup rows, and pruned once they age out.
+  """
+  server = models.ForeignKey(Server, on_delete=models.CASCADE)
+  timestamp = models.DateTimeField()
+  up = models.BooleanField(default=False)
+  online = models.IntegerField(default=0)
+  players_max = models.IntegerField(default=0)
+  latency = models.FloatField(blank=True, null=True)
+
+  class Meta:
+    indexes = [
+      models.Index(fields=['timestamp']),
+      models.Index(fields=['server', 'timestamp']),
+    ]
+
+  def __str__(self):
+    return f'{self.server.name} @ {self.timestamp}: {self.online}/{self.players_max}'
+
+
+class PlayerRollup(models.Model):
+  """
+  Player counts for a Server over a minute, hour or day. We keep sums
+  rather than averages, so finer rollups add up into coarser ones exactly.
+  """
+  server = models.ForeignKey(Server, on_delete=models.CASCADE)
+  resolution = models.CharField(max_length=8, choices=Resolution.choices)
+  timestamp = models.DateTimeField()
+  samples = models.IntegerField(default=0)
+  up_samples = models.IntegerField(default=0)
+  online_total = models.BigIntegerField(default=0)
+  online_peak = models.IntegerField(default=0)
+  capacity_peak = models.IntegerField(default=0)
+  latency_total = models.FloatField(default=0)
+  latency_samples = models.IntegerField(default=0)
+
+  class Meta:
+    unique_together = ('server', 'resolution', 'timestamp')
+    indexes = [
+      models.Index(fields=['resolution', 'timestamp']),
+    ]
+
+  def __str__(self):
+    return f'{self.server.name} @ {self.timestamp} ({self.resolution})'
+
+  @property
+  def online_avg(self):
+    """ return the average players online over the period """
+    return self.online_total / self.samples if self.samples else 0
+
+  @property
+  def latency_avg(self):
+    """ return the average probe latency while up, in ms """
+    if not self.latency_samples:
+      return None
+    return self.latency_total / self.latency_samples
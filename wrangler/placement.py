@@ -0,0 +1,158 @@
+"""
+file: wrangler/placement.py
+author: lkmhaqer
+
+Picks which MineHost a new Server should live on. Every enabled host with
+room is scored on its free memory, CPU, running containers and free
+ports, and the best one wins, so heavy modpacks spread across the fleet.
+"""
+import re
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db.models import Count, F, Q
+from requests.exceptions import RequestException
+from docker.errors import DockerException
+
+from .clients import docker_clients
+from .models import EnvironmentVar, MineHost, Server
+
+
+MEMORY_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+# How much each part of a host's score counts, these add up to one.
+WEIGHTS = {
+  'memory': .4,
+  'cpu': .3,
+  'slots': .2,
+  'ports': .1,
+}
+
+
+def parse_memory(value):
+  """Turn a docker style memory size, like 4G or 512M, into bytes.
+
+  Args:
+      value (str): The memory size.
+
+  Returns:
+      int: The size in bytes, or None if it couldn't be parsed.
+  """
+  match = re.fullmatch(r'(\d+)([KMG]?)B?', value.strip().upper())
+  if not match:
+    return None
+  return int(match.group(1)) * MEMORY_UNITS[match.group(2)]
+
+def server_type_memory(server_types):
+  """Look up how much memory each ServerType asks for with MEMORY.
+
+  Args:
+      server_types ([int]): ServerType primary keys.
+
+  Returns:
+      dict: bytes of memory per ServerType pk, types without a MEMORY
+        var get PLACEMENT_DEFAULT_MEMORY.
+  """
+  default = parse_memory(settings.PLACEMENT_DEFAULT_MEMORY)
+  memory = {pk: default for pk in server_types}
+  env_vars = EnvironmentVar.objects.filter(
+    name='MEMORY',
+    servertype__in=server_types
+  ).values_list('servertype', 'value')
+  for pk, value in env_vars:
+    memory[pk] = parse_memory(value) or default
+
+  return memory
+
+def _host_info(host):
+  """ Ask a host's docker daemon for its size and load, None if it's down. """
+  try:
+    info = docker_clients.get(host).info()
+  except (DockerException, RequestException):
+    return None
+
+  return {
+    'mem_total': info['MemTotal'],
+    'ncpu': info['NCPU'],
+    'running': info['ContainersRunning'],
+  }
+
+def score_host(host, info, reserved, needed):
+  """Score how good a home a host is for a new server.
+
+  Args:
+      host (MineHost): Annotated with server_count and used_ports.
+      info (dict): The host's docker info, from _host_info().
+      reserved (int): Bytes of memory already claimed by its servers.
+      needed (int): Bytes of memory the new server needs.
+
+  Returns:
+      float: A score from zero to one, higher is better, or None if
+        the server won't fit on the host.
+  """
+  free_memory = info['mem_total'] - reserved - needed
+  free_ports = host.max_port - host.min_port - host.used_ports
+  if free_memory < 0 or free_ports <= 0:
+    return None
+
+  scores = {
+    'memory': free_memory / info['mem_total'],
+    'cpu': info['ncpu'] / (info['ncpu'] + info['running']),
+    'slots': 1 - host.server_count / host.server_limit,
+    'ports': free_ports / (host.max_port - host.min_port),
+  }
+
+  return sum(WEIGHTS[part] * score for part, score in scores.items())
+
+def choose_host(server_type):
+  """Pick the best enabled MineHost with room for a server type.
+
+  Args:
+      server_type (ServerType): The type of the server being created.
+
+  Returns:
+      MineHost: The best scoring host, or None if nothing has room.
+  """
+  hosts = list(
+    MineHost.objects.annotate(
+      server_count=Count('server'),
+      used_ports=Count(
+        'server',
+        filter=Q(
+          server__port__gte=F('min_port'),
+          server__port__lt=F('max_port')
+        )
+      ),
+    ).filter(server_count__lt=F('server_limit'), enabled=True)
+  )
+  if not hosts:
+    return None
+
+  # Hibernating servers are stopped, so they hold no memory.
+  placed = list(
+    Server.objects.filter(
+      host__in=hosts,
+      hibernated=False
+    ).values_list('host', 'server_type')
+  )
+  memory = server_type_memory({server_type.pk} | {t for _, t in placed})
+  reserved = defaultdict(int)
+  for host_pk, type_pk in placed:
+    reserved[host_pk] += memory[type_pk]
+
+  with ThreadPoolExecutor(max_workers=len(hosts)) as pool:
+    infos = list(pool.map(_host_info, hosts))
+
+  scored = []
+  for host, info in zip(hosts, infos):
+    if info is None:
+      continue
+    score = score_host(host, info, reserved[host.pk], memory[server_type.pk])
+    if score is not None:
+      scored.append((score, host))
+
+  if not scored:
+    return None
+
+  return max(scored, key=lambda scored_host: scored_host[0])[1]
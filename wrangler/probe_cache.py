@@ -0,0 +1,98 @@
+"""
+file: wrangler/probe_cache.py
+author: lkmhaqer
+
+A per-process cache of minecraft status probes, keyed by socket. Live
+results are reused for a few seconds, servers that are down are backed off
+exponentially, and page loads probing the same server at the same time
+share a single ping, even across threads and event loops.
+"""
+import asyncio
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+from django.conf import settings
+
+
+# A cached status, when it expires, and how many times it's been down.
+_Entry = namedtuple('_Entry', ['status', 'expires', 'failures'])
+
+
+class ProbeCache:
+  """
+  Cached probe results, and the probes in flight, per socket. In flight
+  probes are concurrent.futures.Future()s, which any thread's event loop
+  can await, so gunicorn's threads share them too.
+  """
+  def __init__(self):
+    self._entries = {}
+    self._inflight = {}
+    self._lock = threading.Lock()
+
+  def store(self, socket, status):
+    """Remember a probe result, backing off further if the server's down.
+
+    Args:
+        socket (str): The host:port that was probed.
+        status (dict): The result, from our probes.
+    """
+    now = time.monotonic()
+    with self._lock:
+      if 'players' in status:
+        self._entries[socket] = _Entry(status, now + settings.PROBE_CACHE_TTL, 0)
+        return
+
+      previous = self._entries.get(socket)
+      failures = previous.failures + 1 if previous else 1
+      backoff = min(
+        settings.PROBE_DOWN_TTL * 2 ** (failures - 1),
+        settings.PROBE_DOWN_MAX_TTL
+      )
+      self._entries[socket] = _Entry(status, now + backoff, failures)
+
+  async def probe(self, socket, probe):
+    """Return a server's status, from cache, a probe in flight, or a new probe.
+
+    Args:
+        socket (str): The host:port of the server.
+        probe (callable): Returns a coroutine that probes the server,
+          only called if nothing cached or in flight can be used.
+
+    Returns:
+        dict: The server's status.
+    """
+    with self._lock:
+      entry = self._entries.get(socket)
+      if entry and entry.expires > time.monotonic():
+        return entry.status
+      future = self._inflight.get(socket)
+      leader = future is None
+      if leader:
+        future = self._inflight[socket] = Future()
+
+    if not leader:
+      return await asyncio.wrap_future(future)
+
+    try:
+      status = await probe()
+    except BaseException as err:
+      with self._lock:
+        del self._inflight[socket]
+      future.set_exception(err)
+      raise
+
+    self.store(socket, status)
+    with self._lock:
+      del self._inflight[socket]
+    future.set_result(status)
+    return status
+
+  def clear(self):
+    """ Forget every cached result. """
+    with self._lock:
+      self._entries.clear()
+
+
+probe_cache = ProbeCache()
@@ -0,0 +1,170 @@
+"""
+file: wrangler/reconcile.py
+author: lkmhaqer
+
+Compares our Server rows with the containers that really exist on each
+MineHost. A failed start leaves a Server with no container, and a failed
+delete leaves an orphan container holding a port; we find both, along
+with containers published on the wrong port, or running while their Server
+hibernates, and can queue the repairs.
+"""
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from requests.exceptions import RequestException
+from docker.errors import DockerException, NotFound
+
+from .clients import docker_clients
+from .jobs import enqueue
+from .models import Job, JobAction, JobState, MineHost, Server
+from .tasks import SERVER_LABEL
+
+
+CONTAINER_STATES_KEY = 'wrangler:container_states'
+
+# The kinds of drift we find.
+MISSING = 'missing'
+ORPHAN = 'orphan'
+PORT = 'port'
+AWAKE = 'awake'
+
+Drift = namedtuple('Drift', ['kind', 'host', 'name', 'detail', 'server', 'container_id'])
+
+
+def _list_containers(host):
+  """
+  List every container on a host, running or not, in a single call to
+  docker's API, or None if the host is down.
+  """
+  try:
+    return docker_clients.get(host).api.containers(all=True)
+  except (DockerException, RequestException):
+    return None
+
+def _container_port(container):
+  """ Return the host port a container publishes minecraft on, if any. """
+  for port in container.get('Ports') or []:
+    if port.get('PrivatePort') == 25565 and port.get('Type') == 'tcp':
+      return port.get('PublicPort')
+  return None
+
+def _diff_host(host, containers, expected, busy, states):
+  """Diff one host's containers against the Servers it should have.
+
+  Args:
+      host (MineHost): The host the containers were listed from.
+      containers ([dict]): The host's containers, from docker's list API.
+      expected (dict): The host's Servers keyed by name.
+      busy (set): Server pks with a job queued or running, left alone.
+      states (dict): Filled in with each container's state, keyed by
+        host and name.
+
+  Returns:
+      list: The Drift found on this host.
+  """
+  drift = []
+  found = set()
+  for container in containers:
+    name = container['Names'][0].lstrip('/')
+    states[f'{host.name}/{name}'] = container.get('State', '')
+    server = expected.get(name)
+
+    if server is None:
+      # Only containers we labelled are ours to call orphans.
+      if SERVER_LABEL in (container.get('Labels') or {}):
+        drift.append(Drift(ORPHAN, host, name, 'no Server', None, container['Id']))
+      continue
+
+    found.add(name)
+    if server.pk in busy:
+      continue
+    if server.hibernated and container.get('State') == 'running':
+      # Containers started before unless-stopped come back with docker.
+      drift.append(Drift(AWAKE, host, name, 'running while hibernated', server, container['Id']))
+    port = _container_port(container)
+    if port is not None and port != server.port:
+      drift.append(Drift(
+        PORT,
+        host,
+        name,
+        f'published on {port}, not {server.port}',
+        server,
+        container['Id']
+      ))
+
+  for name, server in expected.items():
+    if name not in found and server.pk not in busy:
+      drift.append(Drift(MISSING, host, name, 'no container', server, None))
+
+  return drift
+
+def find_drift():
+  """Diff every host's containers against our Server rows.
+
+  Hosts are listed at the same time. Servers with a job queued or running
+  are left alone, since they're in the middle of changing. We also cache
+  the state of every container we found, keyed by host and name.
+
+  Returns:
+      tuple: ([Drift], [MineHost]) the drift found, and any hosts we
+        couldn't list.
+  """
+  hosts = list(MineHost.objects.all())
+  if not hosts:
+    return [], []
+
+  with ThreadPoolExecutor(max_workers=settings.RECONCILE_CONCURRENCY) as pool:
+    listings = list(pool.map(_list_containers, hosts))
+
+  busy = set(Job.objects.filter(
+    state__in=(JobState.QUEUED, JobState.RUNNING)
+  ).values_list('server_id', flat=True))
+  servers = {}
+  for server in Server.objects.filter(host__in=hosts):
+    servers.setdefault(server.host_id, {})[server.name] = server
+
+  drift = []
+  down = []
+  states = {}
+  for host, containers in zip(hosts, listings):
+    if containers is None:
+      down.append(host)
+      continue
+    drift += _diff_host(host, containers, servers.get(host.pk, {}), busy, states)
+
+  cache.set(CONTAINER_STATES_KEY, states, settings.RECONCILE_INTERVAL * 2)
+  return drift, down
+
+def repair(drift):
+  """Fix one piece of drift.
+
+  Missing containers are started, mismatched ports recreated and awake
+  hibernated servers stopped again, through the job queue like any other
+  lifecycle operation. Orphans have no
+  Server to hang a job on, so they're removed here and now.
+
+  Args:
+      drift (Drift): From find_drift().
+
+  Returns:
+      str: What was done about it.
+  """
+  if drift.kind == MISSING:
+    enqueue(drift.server, JobAction.START)
+    return 'queued start'
+  if drift.kind == PORT:
+    enqueue(drift.server, JobAction.RECREATE)
+    return 'queued recreate'
+  if drift.kind == AWAKE:
+    enqueue(drift.server, JobAction.HIBERNATE)
+    return 'queued hibernate'
+
+  try:
+    docker_clients.get(drift.host).api.remove_container(drift.container_id, force=True)
+  except NotFound:
+    pass
+  except (DockerException, RequestException) as err:
+    return f'remove failed: {err}'
+  return 'removed'
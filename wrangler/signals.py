@@ -0,0 +1,43 @@
+"""
+file: wrangler/signals.py
+author: lkmhaqer
+
+Keeps our cached ServerType launch specs in step with the database,
+connected when the app is ready.
+"""
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .launch import invalidate_for_environment_var, invalidate_launch_specs
+from .models import EnvironmentVar, ServerType
+
+
+@receiver(post_save, sender=ServerType)
+@receiver(post_delete, sender=ServerType)
+def server_type_changed(sender, instance, **kwargs): # pylint: disable=unused-argument
+  """ A ServerType was saved or deleted, drop its launch spec. """
+  invalidate_launch_specs([instance.pk])
+
+@receiver(post_save, sender=EnvironmentVar)
+@receiver(pre_delete, sender=EnvironmentVar)
+def environment_var_changed(sender, instance, **kwargs): # pylint: disable=unused-argument
+  """
+  An EnvironmentVar was edited or is being deleted, drop the spec of
+  every ServerType using it. On delete this runs before the M2M rows
+  linking it are gone, so we can still find those types.
+  """
+  invalidate_for_environment_var(instance)
+
+@receiver(m2m_changed, sender=ServerType.environment_vars.through)
+def environment_vars_changed(sender, instance, action, reverse, pk_set, **kwargs): # pylint: disable=unused-argument,too-many-arguments
+  """
+  EnvironmentVars were added to or removed from a ServerType, from either
+  side of the relation, drop the affected launch specs.
+  """
+  if action == 'pre_clear' and reverse:
+    invalidate_for_environment_var(instance)
+  elif action in ('post_add', 'post_remove', 'post_clear'):
+    if not reverse:
+      invalidate_launch_specs([instance.pk])
+    elif pk_set:
+      invalidate_launch_specs(pk_set)
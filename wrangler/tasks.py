@@ -5,24 +5,47 @@ author: lkmhaqer
 This is our background tasks file, we have several actions that should
 be triggered from the UI, but executed without stopping our web application.
 """
+import asyncio
+import threading
+from datetime import datetime
+from datetime import timezone as dt_timezone
 from socket import gaierror
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
 from mcstatus import JavaServer
 
-from docker import DockerClient
-from docker.errors import DockerException
+from docker.errors import DockerException, NotFound
+from docker.utils import parse_repository_tag
+
+from diamondserv.timing import span
+
+from .clients import docker_clients
+from .launch import launch_spec
+from .probe_cache import probe_cache
+from .models import Server
+
+
+STATUS_SNAPSHOT_KEY = 'wrangler:status_snapshot'
+# Every container we start carries this label, naming its Server.
+SERVER_LABEL = 'diamondserv.server'
+# The status error we give servers we didn't probe, as they're hibernating.
+HIBERNATED = 'hibernated'
 
 
 def _get_client(server):
-  """Return a TCP based network client to docker
+  """Return a pooled TCP based network client to docker
 
   Args:
-      server (SerializedServer): A JSON object of our Server model
+      server (Server): An object of our Server model
 
   Returns:
-      DockerClient: An instance of a client from docker-py
+      DockerClient: An instance of a client from docker-py, shared by
+        every operation against the server's MineHost.
   """
-  return DockerClient(base_url=f"tcp://{server.host.name}:2375")
+  return docker_clients.get(server.host)
 
 def docker_get_logs(server):
   """Get logs from a docker server
@@ -40,49 +63,149 @@ def docker_get_logs(server):
   except DockerException:
     return b'Unable to collect logs.'
 
+def _log_cursor(timestamp):
+  """Normalize a docker log timestamp into a sortable cursor.
+
+  Docker trims trailing zeros from the nanoseconds, so we pad them back
+  out to make cursors compare correctly as plain strings.
+
+  Args:
+      timestamp (str): An RFC3339 timestamp from docker, like
+        2021-01-17T17:19:00.1234Z
+
+  Returns:
+      str: The timestamp with nine digits of nanoseconds.
+  """
+  seconds, _, fraction = timestamp.rstrip('Z').partition('.')
+  return f'{seconds}.{fraction:0<9}Z'
+
+def _cursor_since(cursor):
+  """ Return the whole unix second a log cursor falls in, for docker. """
+  taken = datetime.strptime(cursor[:19], '%Y-%m-%dT%H:%M:%S')
+  return int(taken.replace(tzinfo=dt_timezone.utc).timestamp())
+
+def _hang_up(stream):
+  """ Close a docker stream from another thread, ending its iteration. """
+  try:
+    stream.close()
+  except (DockerException, OSError):
+    pass
+
+def _log_lines(stream, since):
+  """ Reassemble a docker log stream's chunks into (cursor, line) pairs. """
+  buffered = b''
+  for chunk in stream:
+    buffered += chunk
+    *lines, buffered = buffered.split(b'\n')
+    for line in lines:
+      timestamp, _, text = line.decode('utf-8', 'replace').partition(' ')
+      cursor = _log_cursor(timestamp)
+      if since and cursor <= since:
+        continue
+      yield cursor, text
+
+def docker_stream_logs(server, tail=50, since=None, max_seconds=None):
+  """Follow the logs of a docker server as they are written
+
+  Args:
+      server (Server): An object of our Server model
+      tail (int): How many existing lines to send before following.
+      since (str): A cursor from a previous line, only lines after it
+        are sent, and tail is ignored.
+      max_seconds (float): Stop following after this long, even if the
+        container has written nothing, which would otherwise leave us
+        blocked reading from docker.
+
+  Yields:
+      tuple: (cursor, line) for each log line, where cursor can be
+        passed back as since to resume after that line.
+  """
+  client = _get_client(server)
+  container = client.containers.get(server.name)
+  options = {'tail': tail}
+  if since:
+    options = {'since': _cursor_since(since)}
+
+  stream = container.logs(stream=True, follow=True, timestamps=True, **options)
+  timer = None
+  if max_seconds:
+    timer = threading.Timer(max_seconds, _hang_up, args=(stream,))
+    timer.daemon = True
+    timer.start()
+
+  try:
+    yield from _log_lines(stream, since)
+  finally:
+    if timer:
+      timer.cancel()
+
 def docker_restart_server(server):
   """Restart a docker server
 
   Args:
       server (Server): An object of our Server model
+
+  Raises:
+      DockerException: If the container couldn't be restarted, so the
+        job running us is marked as failed.
   """
-  try:
-    client = _get_client(server)
-    container = client.containers.get(server.name)
-    container.restart()
-    return 'Success!'
-  except DockerException:
-    return 'Error restarting this server.'
+  client = _get_client(server)
+  container = client.containers.get(server.name)
+  container.restart()
+  return 'Success!'
 
-def docker_start_server(server):
-  """Start a docker server
+def docker_stop_server(server):
+  """Stop a docker server, leaving its container in place
 
   Args:
       server (Server): An object of our Server model
   """
   client = _get_client(server)
-  op_list = ','.join(server.op_list.values_list('name', flat=True))
-  mod_volume = None
+  container = client.containers.get(server.name)
+  container.stop()
+
+def docker_start_server(server):
+  """Start a docker server, creating its container if it has none
+
+  The ServerType's image and environment come from its cached launch
+  spec, so only the server's own op list is read.
+
+  Args:
+      server (Server): An object of our Server model, ideally fetched
+        with Server.objects.for_launch() so this costs no queries.
+  """
+  client = _get_client(server)
+  try:
+    client.containers.get(server.name).start()
+    return
+  except NotFound:
+    pass
+
+  spec = launch_spec(server.server_type)
+  ports = {'25565/tcp': server.port}
+  query = []
+  if settings.STATUS_QUERY_ENABLED:
+    ports['25565/udp'] = server.port
+    query = ['ENABLE_QUERY=true', 'QUERY_PORT=25565']
+  op_list = ','.join(user.name for user in server.op_list.all())
   env = [
     'EULA=TRUE',
     'ENABLE_COMMAND_BLOCK=false',
     f"OPS=lkmhaqer,{op_list}",
-    f"MOTD=Phukish Minecraft {server.name} ({server.server_type.name})",
+    f"MOTD=Phukish Minecraft {server.name} ({spec['name']})",
     f"MODE={server.game_type}"
-  ]
-  for var in list(server.server_type.environment_vars.values()):
-    env.append(f"{var['name']}={var['value']}")
-    if var['name'] == 'CF_SERVER_MOD':
-      mod_volume = {'/srv/modpacks': {'bind': '/modpacks', 'mode': 'ro'}}
+  ] + query + spec['environment']
 
   client.containers.run(
-    image=server.server_type.docker_image,
+    image=spec['image'],
     name=server.name,
-    ports={'25565/tcp': server.port},
+    ports=ports,
     detach=True,
-    restart_policy={'Name': 'always', 'MaximumRetryCount': 0},
+    # Not always, or a hibernated container wakes with its docker daemon.
+    restart_policy={'Name': 'unless-stopped', 'MaximumRetryCount': 0},
     environment=env,
-    volumes=mod_volume,
+    volumes=spec['volumes'],
+    labels={SERVER_LABEL: server.name},
   )
 
 def docker_delete_server(server):
@@ -95,24 +218,94 @@ def docker_delete_server(server):
   container = client.containers.get(server.name)
   container.remove(force=True)
 
-def minecraft_status(server_list):
-  """Check a list of servers for their current minecraft server status.
+def docker_recreate_server(server):
+  """Pull the server's image again, and replace its container with a new one
 
   Args:
-      server_list ([Server()]): A list of Server() objects.
+      server (Server): An object of our Server model, ideally fetched
+        with Server.objects.for_launch() so this costs no queries.
+  """
+  client = _get_client(server)
+  # Without a tag docker-py pulls every tag of the repository.
+  repository, tag = parse_repository_tag(server.server_type.docker_image)
+  client.images.pull(repository, tag=tag or 'latest')
+  try:
+    client.containers.get(server.name).remove(force=True)
+  except NotFound:
+    pass
+  docker_start_server(server)
+
+def _status_dict(response):
+  """Flatten an mcstatus PingResponse into plain data.
+
+  Plain dicts can be pickled into the cache, and still render the same
+  way in our templates as the PingResponse attributes did.
+
+  Args:
+      response (PingResponse): The status response from a live server.
 
   Returns:
-      dict: returns a dictionary of information about the list of servers.
+      dict: The version, players and latency of the server.
   """
-  servers = []
-  total_players = 0
-  total_capacity = 0
-  for server in server_list:
-    query = JavaServer.lookup(server.get_socket(), timeout=.15)
+  sample = response.players.sample or []
+  return {
+    'version': {
+      'name': response.version.name,
+      'protocol': response.version.protocol,
+    },
+    'players': {
+      'online': response.players.online,
+      'max': response.players.max,
+      'sample': [{'name': p.name, 'id': p.id} for p in sample],
+    },
+    'description': response.description,
+    'latency': response.latency,
+  }
+
+async def _optional_probe(probe, timeout):
+  """Run an extra probe of a server we know is up, None if it fails.
+
+  Args:
+      probe (coroutine): The probe, such as a ping or a query.
+      timeout (float): Seconds to give it.
+
+  Returns:
+      The probe's result, or None if it failed or timed out.
+  """
+  try:
+    return await asyncio.wait_for(probe, timeout)
+  except (asyncio.TimeoutError, OSError, ValueError):
+    return None
+
+async def _probe_server(server, socket, semaphore):
+  """Probe a single minecraft server once, bounded by our probe deadlines.
+
+  A server that answers its status is then pinged for its latency, and
+  with STATUS_QUERY_ENABLED asked for its full player list over Query.
+  Those have their own deadlines, and failing them doesn't make the
+  server down.
+
+  Args:
+      server (Server): The Server() object being probed.
+      socket (str): The host:port of the server, resolved before probing
+        so we never touch the ORM from inside the event loop.
+      semaphore (asyncio.Semaphore): Limits how many probes are in flight.
+
+  Returns:
+      tuple: (server, status), where status is a dict of the server's
+        status, or a dict describing why the server is down.
+  """
+  timeout = settings.STATUS_PROBE_TIMEOUT
+  async with semaphore:
     try:
-      servers.append((server, query.status()))
-      total_players += query.status().players.online
-      total_capacity += query.status().players.max
+      query = await asyncio.wait_for(
+        JavaServer.async_lookup(socket, timeout=timeout),
+        timeout
+      )
+      response = await asyncio.wait_for(query.async_status(), timeout)
+      status = _status_dict(response)
+    except asyncio.TimeoutError:
+      return server, {'version': {'text': '', 'error': 'timed out'}}
     except (
       BrokenPipeError,
       ConnectionRefusedError,
@@ -120,8 +313,73 @@ def minecraft_status(server_list):
       gaierror,
       OSError
     ) as err:
-      down_status = {'version': {'text': '', 'error': err} }
-      servers.append((server, down_status))
+      return server, {'version': {'text': '', 'error': str(err)}}
+
+    status['ping'] = None
+    if settings.STATUS_PING_TIMEOUT:
+      status['ping'] = await _optional_probe(
+        query.async_ping(),
+        settings.STATUS_PING_TIMEOUT
+      )
+    if settings.STATUS_QUERY_ENABLED:
+      result = await _optional_probe(
+        query.async_query(),
+        settings.STATUS_QUERY_TIMEOUT
+      )
+      if result is not None:
+        status['players']['names'] = result.players.names
+        status['map'] = result.map
+
+    return server, status
+
+async def _cached_probe(server, socket, semaphore):
+  """ Probe a server through our probe cache, sharing any probe in flight. """
+  async def probe():
+    _, status = await _probe_server(server, socket, semaphore)
+    return status
+
+  return server, await probe_cache.probe(socket, probe)
+
+async def probe_servers(targets, cached=False):
+  """Probe every server at once, with a bounded number in flight.
+
+  Args:
+      targets ([(Server, str)]): A list of (server, socket) pairs.
+      cached (bool): Answer from our probe cache where we can. Fresh
+        probes are stored in the cache either way.
+
+  Returns:
+      list: (server, status) tuples, in the same order as targets.
+  """
+  semaphore = asyncio.Semaphore(settings.STATUS_PROBE_CONCURRENCY)
+  with span('probe'):
+    if cached:
+      return await asyncio.gather(
+        *[_cached_probe(server, socket, semaphore) for server, socket in targets]
+      )
+
+    results = await asyncio.gather(
+      *[_probe_server(server, socket, semaphore) for server, socket in targets]
+    )
+  for (_, socket), (_, status) in zip(targets, results):
+    probe_cache.store(socket, status)
+  return results
+
+def summarize_status(servers):
+  """Total up the players and capacity from a list of probe results.
+
+  Args:
+      servers ([(Server, status)]): The output of probe_servers().
+
+  Returns:
+      dict: returns a dictionary of information about the list of servers.
+  """
+  total_players = 0
+  total_capacity = 0
+  for _, status in servers:
+    if 'players' in status:
+      total_players += status['players']['online']
+      total_capacity += status['players']['max']
 
   output = {
     'serverlist': servers,
@@ -130,3 +388,130 @@ def minecraft_status(server_list):
   }
 
   return output
+
+def minecraft_status(server_list):
+  """Check a list of servers for their current minecraft server status.
+
+  Every server is probed concurrently, with a single status round trip
+  each, so the cost is roughly one probe deadline rather than one per
+  server.
+
+  Args:
+      server_list ([Server()]): A list of Server() objects.
+
+  Returns:
+      dict: returns a dictionary of information about the list of servers.
+  """
+  targets = [(server, server.get_socket()) for server in server_list]
+  if not targets:
+    return summarize_status([])
+
+  return summarize_status(asyncio.run(probe_servers(targets)))
+
+def refresh_status_snapshot():
+  """Probe the whole fleet and store the result in our cache.
+
+  This is run on an interval by the poll_status management command, so
+  that page views never have to probe the fleet themselves.
+
+  Returns:
+      dict: The snapshot, with the time it was taken and a status
+        per Server primary key.
+  """
+  servers = list(Server.objects.for_display())
+  output = minecraft_status([server for server in servers if not server.hibernated])
+  statuses = {server.pk: status for server, status in output['serverlist']}
+  # Hibernating servers are stopped, there's no point probing them.
+  for server in servers:
+    if server.hibernated:
+      statuses[server.pk] = {'version': {'text': '', 'error': HIBERNATED}}
+  snapshot = {
+    'taken': timezone.now(),
+    'statuses': statuses,
+  }
+  cache.set(
+    STATUS_SNAPSHOT_KEY,
+    snapshot,
+    timeout=settings.STATUS_SNAPSHOT_MAX_AGE
+  )
+
+  return snapshot
+
+def _snapshot_lookup(server_list):
+  """Find a list of servers in the status snapshot.
+
+  This is the part of a snapshot lookup that touches the cache and ORM,
+  so async callers run it in a thread.
+
+  Args:
+      server_list ([Server()]): A list of Server() objects.
+
+  Returns:
+      tuple: (server_list, taken, statuses, targets), where taken is the
+        time of the snapshot or None, statuses the snapshot's status per
+        Server pk, and targets the (server, socket) pairs it's missing.
+  """
+  server_list = list(server_list)
+  snapshot = cache.get(STATUS_SNAPSHOT_KEY)
+  taken = None
+  statuses = {}
+  if snapshot is not None:
+    taken = snapshot['taken']
+    statuses = dict(snapshot['statuses'])
+
+  targets = [
+    (server, server.get_socket())
+    for server in server_list if server.pk not in statuses
+  ]
+
+  return server_list, taken, statuses, targets
+
+def _snapshot_output(server_list, taken, statuses, probed):
+  """ Merge live probes into snapshot statuses, and total them up. """
+  for server, status in probed:
+    statuses[server.pk] = status
+
+  output = summarize_status(
+    [(server, statuses[server.pk]) for server in server_list]
+  )
+  output['taken'] = taken
+
+  return output
+
+def snapshot_status(server_list):
+  """Look up a list of servers in the status snapshot.
+
+  If no poller has stored a snapshot recently, or a server is newer than
+  the snapshot, we fall back to probing those servers live, through our
+  probe cache.
+
+  Args:
+      server_list ([Server()]): A list of Server() objects.
+
+  Returns:
+      dict: The same output as minecraft_status(), plus 'taken', the
+        time the snapshot was taken, or None if it was probed live.
+  """
+  server_list, taken, statuses, targets = _snapshot_lookup(server_list)
+  probed = asyncio.run(probe_servers(targets, cached=True)) if targets else []
+
+  return _snapshot_output(server_list, taken, statuses, probed)
+
+async def async_snapshot_status(server_list):
+  """Look up a list of servers in the status snapshot, from async views.
+
+  The same as snapshot_status(), but any live probes run on the caller's
+  event loop rather than a new one.
+
+  Args:
+      server_list ([Server()]): A list of Server() objects.
+
+  Returns:
+      dict: The same output as snapshot_status().
+  """
+  server_list, taken, statuses, targets = await sync_to_async(
+    _snapshot_lookup
+  )(server_list)
+  probed = await probe_servers(targets, cached=True) if targets else []
+
+  return _snapshot_output(server_list, taken, statuses, probed)
@@ -0,0 +1,182 @@
+"""
+file: wrangler/telemetry.py
+author: lkmhaqer
+
+Samples docker stats for every container on every MineHost, and keeps them
+as compact ResourceSample rows. Raw samples are rolled up into hourly rows
+once they age out, and hourly rows are pruned past our retention.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Max
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+from requests.exceptions import RequestException
+from docker.errors import DockerException
+
+from .clients import docker_clients
+from .models import MineHost, Resolution, ResourceSample, Server
+
+
+COUNTERS = (
+  'memory_bytes',
+  'memory_limit',
+  'net_rx_bytes',
+  'net_tx_bytes',
+  'block_read_bytes',
+  'block_write_bytes',
+)
+
+
+def parse_stats(stats):
+  """Boil a docker stats response down to the numbers we keep.
+
+  CPU is worked out the same way the docker CLI does it, from the change
+  in container and system CPU time between the two samples docker sends.
+
+  Args:
+      stats (dict): A response from Container.stats(stream=False).
+
+  Returns:
+      dict: The fields of a ResourceSample.
+  """
+  cpu = stats.get('cpu_stats', {})
+  precpu = stats.get('precpu_stats', {})
+  cpu_delta = (
+    cpu.get('cpu_usage', {}).get('total_usage', 0)
+    - precpu.get('cpu_usage', {}).get('total_usage', 0)
+  )
+  system_delta = cpu.get('system_cpu_usage', 0) - precpu.get('system_cpu_usage', 0)
+  online_cpus = cpu.get('online_cpus') or len(
+    cpu.get('cpu_usage', {}).get('percpu_usage') or [None]
+  )
+  cpu_percent = 0.0
+  if cpu_delta > 0 and system_delta > 0:
+    cpu_percent = cpu_delta / system_delta * online_cpus * 100
+
+  memory = stats.get('memory_stats', {})
+  networks = (stats.get('networks') or {}).values()
+  block_io = stats.get('blkio_stats', {}).get('io_service_bytes_recursive') or []
+
+  return {
+    'cpu_percent': cpu_percent,
+    'memory_bytes': memory.get('usage', 0) - memory.get('stats', {}).get('cache', 0),
+    'memory_limit': memory.get('limit', 0),
+    'net_rx_bytes': sum(net.get('rx_bytes', 0) for net in networks),
+    'net_tx_bytes': sum(net.get('tx_bytes', 0) for net in networks),
+    'block_read_bytes': sum(
+      io['value'] for io in block_io if io.get('op', '').lower() == 'read'
+    ),
+    'block_write_bytes': sum(
+      io['value'] for io in block_io if io.get('op', '').lower() == 'write'
+    ),
+  }
+
+def _list_containers(host):
+  """ List the running containers on a host, or none if it's down. """
+  try:
+    return [(host, c) for c in docker_clients.get(host).containers.list()]
+  except (DockerException, RequestException):
+    return []
+
+def _sample_container(host_container):
+  """ Take one stats sample of a container, None if it went away. """
+  host, container = host_container
+  try:
+    return host, container.name, parse_stats(container.stats(stream=False))
+  except (DockerException, RequestException):
+    return None
+
+def collect_samples():
+  """Sample every container on every enabled host, all at once.
+
+  Each container gets a row, and each host a row with no container that
+  totals its containers.
+
+  Returns:
+      list: The ResourceSample rows that were written.
+  """
+  hosts = list(MineHost.objects.filter(enabled=True))
+  if not hosts:
+    return []
+
+  taken = timezone.now()
+  with ThreadPoolExecutor(max_workers=settings.TELEMETRY_CONCURRENCY) as pool:
+    containers = [c for found in pool.map(_list_containers, hosts) for c in found]
+    results = [r for r in pool.map(_sample_container, containers) if r]
+
+  servers = {
+    (server.host_id, server.name): server
+    for server in Server.objects.filter(host__in=hosts)
+  }
+  totals = {}
+  samples = []
+  for host, name, fields in results:
+    samples.append(ResourceSample(
+      host=host,
+      container=name,
+      server=servers.get((host.pk, name)),
+      timestamp=taken,
+      **fields
+    ))
+    total = totals.setdefault(host.pk, ResourceSample(host=host, timestamp=taken))
+    total.cpu_percent += fields['cpu_percent']
+    for counter in COUNTERS:
+      setattr(total, counter, getattr(total, counter) + fields[counter])
+
+  samples.extend(totals.values())
+  return ResourceSample.objects.bulk_create(samples)
+
+def downsample(now=None):
+  """Roll raw samples up into hourly rows, and prune what's too old.
+
+  Only whole hours older than TELEMETRY_RAW_RETENTION are rolled up, so an
+  hour is never split between raw and hourly rows.
+
+  Args:
+      now (datetime): The current time, for testing.
+
+  Returns:
+      tuple: (rollups written, rows deleted)
+  """
+  now = now or timezone.now()
+  cutoff = (now - timedelta(seconds=settings.TELEMETRY_RAW_RETENTION)).replace(
+    minute=0,
+    second=0,
+    microsecond=0
+  )
+  expired = now - timedelta(days=settings.TELEMETRY_RETENTION_DAYS)
+
+  with transaction.atomic():
+    raw = ResourceSample.objects.filter(
+      resolution=Resolution.RAW,
+      timestamp__lt=cutoff
+    )
+    hours = raw.annotate(hour=TruncHour('timestamp')).values(
+      'host',
+      'container',
+      'server',
+      'hour'
+    ).annotate(
+      cpu=Avg('cpu_percent'),
+      **{f'max_{counter}': Max(counter) for counter in COUNTERS}
+    )
+    rollups = ResourceSample.objects.bulk_create([
+      ResourceSample(
+        host_id=hour['host'],
+        container=hour['container'],
+        server_id=hour['server'],
+        resolution=Resolution.HOUR,
+        timestamp=hour['hour'],
+        cpu_percent=hour['cpu'],
+        **{counter: hour[f'max_{counter}'] for counter in COUNTERS}
+      )
+      for hour in hours
+    ])
+    deleted, _ = raw.delete()
+    pruned, _ = ResourceSample.objects.filter(timestamp__lt=expired).delete()
+
+  return len(rollups), deleted + pruned
@@ -0,0 +1,160 @@
+"""
+file: wrangler/tests/test_batch.py
+author: lkmhaqer
+"""
+import threading
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from docker.errors import NotFound
+
+from accounts.models import User
+
+from wrangler.batch import batch_progress, enqueue_batch, fleet_servers
+from wrangler.jobs import claim_job
+from wrangler.models import Job, JobAction, JobState, MineHost, Server, ServerType
+from wrangler.tasks import docker_recreate_server, docker_start_server
+
+
+class BatchTests(TestCase):
+  """ Tests for running lifecycle operations across many servers. """
+  def setUp(self):
+    self.user = User.objects.create_user('TestyMcTestFace', 'foo@bar.com', 'pw')
+    self.other = User.objects.create_user('Other', 'bar@foo.com', 'pw')
+    self.server_type = ServerType.objects.create(
+      name='FTB',
+      version='1.0',
+      docker_image='itzg/minecraft-server:java8'
+    )
+    self.hosts = [MineHost.objects.create(name=f'mc{i}.example.com') for i in range(2)]
+    for i in range(4):
+      Server(
+        name=f'mc-0{i}',
+        owner=self.user if i else self.other,
+        host=self.hosts[i % 2],
+        server_type=self.server_type if i < 2 else ServerType.objects.get(pk=1),
+      ).save()
+
+  def test_fleet_servers_filters(self):
+    """ Test servers are selected by host, type and owner together. """
+    servers = fleet_servers(host='mc1.example.com', owner='TestyMcTestFace')
+    self.assertEqual([s.name for s in servers], ['mc-01', 'mc-03'])
+
+    servers = fleet_servers(server_type='FTB')
+    self.assertEqual([s.name for s in servers], ['mc-00', 'mc-01'])
+
+  def test_batch_progress(self):
+    """ Test a batch's jobs are counted by state. """
+    jobs = enqueue_batch(fleet_servers(), JobAction.RESTART)
+    claim_job(jobs)
+
+    progress = batch_progress(jobs)
+
+    self.assertEqual(progress['total'], 4)
+    self.assertEqual(progress[JobState.RUNNING], 1)
+    self.assertEqual(progress[JobState.QUEUED], 3)
+
+  @override_settings(JOB_HOST_CONCURRENCY=1)
+  def test_claim_respects_host_limit(self):
+    """ Test that a host at its job limit has its other jobs left queued. """
+    enqueue_batch(fleet_servers(), JobAction.RESTART)
+
+    claimed = {claim_job().server.host_id, claim_job().server.host_id}
+
+    self.assertEqual(claimed, {host.pk for host in self.hosts})
+    self.assertIsNone(claim_job())
+
+  def test_admin_action_queues_jobs(self):
+    """ Test the admin action queues a job per selected server. """
+    admin = User.objects.create_superuser('admin', 'admin@foo.com', 'pw')
+    self.client.force_login(admin)
+
+    self.client.post('/admin/wrangler/server/', {
+      'action': 'recreate_servers',
+      '_selected_action': [s.pk for s in fleet_servers(server_type='FTB')],
+    })
+
+    self.assertEqual(
+      list(Job.objects.values_list('action', flat=True)),
+      [JobAction.RECREATE] * 2
+    )
+
+
+class BatchCommandTests(TransactionTestCase):
+  """
+  Tests for the batch_servers command, its workers are threads with their
+  own database connections, so they need committed rows to see.
+  """
+  def setUp(self):
+    self.user = User.objects.create_user('TestyMcTestFace', 'foo@bar.com', 'pw')
+    self.mine_host = MineHost.objects.create(name='mc0.example.com')
+    for i in range(2):
+      Server(name=f'mc-0{i}', owner=self.user, host=self.mine_host).save()
+
+  def test_command_runs_batch(self):
+    """
+    Test the command runs every matching job, its workers' operations side
+    by side, and reports progress.
+    """
+    # Neither restart finishes until both have started.
+    started = threading.Barrier(2, timeout=5)
+    docker_restart = mock.MagicMock(side_effect=lambda server: started.wait())
+    out = StringIO()
+    with mock.patch.dict('wrangler.jobs.ACTIONS', {JobAction.RESTART: docker_restart}):
+      call_command(
+        'batch_servers',
+        'restart',
+        '--host=mc0.example.com',
+        '--workers=2',
+        '--poll-interval=0.01',
+        stdout=out
+      )
+
+    self.assertEqual(docker_restart.call_count, 2)
+    self.assertIn('2/2 done: 2 succeeded, 0 failed', out.getvalue())
+    self.assertEqual(
+      Job.objects.filter(state=JobState.SUCCEEDED).count(),
+      2
+    )
+
+
+class DockerBatchTaskTests(TestCase):
+  """ Tests for the docker operations batches run. """
+  def setUp(self):
+    self.user = User.objects.create_user('TestyMcTestFace', 'foo@bar.com', 'pw')
+    self.mine_host = MineHost.objects.create(name='example.com')
+    server_type = ServerType.objects.create(
+      name='FTB',
+      version='1.0',
+      docker_image='itzg/minecraft-server:java8'
+    )
+    self.server = Server(
+      name='mc-00',
+      owner=self.user,
+      host=self.mine_host,
+      server_type=server_type
+    )
+    self.server.save()
+
+  @mock.patch('wrangler.tasks._get_client')
+  def test_start_existing_container(self, get_client):
+    """ Test a stopped container is started rather than created again. """
+    docker_start_server(self.server)
+
+    get_client.return_value.containers.get.return_value.start.assert_called_once()
+    get_client.return_value.containers.run.assert_not_called()
+
+  @mock.patch('wrangler.tasks._get_client')
+  def test_recreate_pulls_one_tag(self, get_client):
+    """ Test recreate pulls only the image's tag, then runs a new container. """
+    get_client.return_value.containers.get.side_effect = NotFound('gone')
+
+    docker_recreate_server(self.server)
+
+    get_client.return_value.images.pull.assert_called_once_with(
+      'itzg/minecraft-server',
+      tag='java8'
+    )
+    get_client.return_value.containers.run.assert_called_once()
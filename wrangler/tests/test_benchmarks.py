@@ -0,0 +1,99 @@
+"""
+file: wrangler/tests/test_benchmarks.py
+author: lkmhaqer
+"""
+from django.core.cache import cache
+from django.test import TestCase
+
+from accounts.models import User
+
+from wrangler.benchmarks import BASE_PORT, compare, run_benchmarks
+from wrangler.clients import docker_clients
+from wrangler.fakes import FakeDocker, FakeMinecraftServers
+from wrangler.models import MineHost, Server
+from wrangler.probe_cache import probe_cache
+from wrangler.reconcile import find_drift
+from wrangler.tasks import SERVER_LABEL, docker_start_server, minecraft_status
+
+
+class FakesTests(TestCase):
+  """ Tests our fakes answer wrangler the way the real things do. """
+  def setUp(self):
+    probe_cache.clear()
+    cache.clear()
+    self.user = User.objects.create_user('TestyMcTestFace', 'foo@bar.com', 'pw')
+
+  def tearDown(self):
+    probe_cache.clear()
+    cache.clear()
+    docker_clients.close_all()
+
+  def test_fake_minecraft_servers(self):
+    """ Test servers we listen for are up, and the rest refuse. """
+    mine_host = MineHost.objects.create(
+      name='127.0.0.1',
+      min_port=BASE_PORT,
+      max_port=BASE_PORT + 10
+    )
+    servers = [
+      Server.objects.create(name=f'mc-0{i}', owner=self.user, host=mine_host)
+      for i in range(2)
+    ]
+
+    with FakeMinecraftServers([servers[0].port], online=5):
+      output = minecraft_status(servers)
+
+    up, down = [status for _, status in output['serverlist']]
+    self.assertEqual(up['players']['online'], 5)
+    self.assertIsNotNone(up['ping'])
+    self.assertIn('error', down['version'])
+    self.assertEqual(output['total_players'], 5)
+
+  def test_fake_docker(self):
+    """ Test a container started on a fake daemon is found by reconcile. """
+    mine_host = MineHost.objects.create(name='127.0.0.2')
+    server = Server.objects.create(name='mc-00', owner=self.user, host=mine_host)
+
+    with FakeDocker('127.0.0.2') as docker:
+      docker_start_server(server)
+      drift, down = find_drift()
+
+    container = docker.containers['mc-00']
+    self.assertEqual(container['State'], 'running')
+    self.assertEqual(container['Labels'], {SERVER_LABEL: 'mc-00'})
+    self.assertEqual(container['Ports'][0]['PublicPort'], server.port)
+    self.assertEqual((drift, down), ([], []))
+
+
+class BenchmarkTests(TestCase):
+  """ Tests for running benchmarks, and comparing them to a baseline. """
+  def setUp(self):
+    probe_cache.clear()
+
+  def test_run_benchmarks(self):
+    """ Test a small run measures each fleet size, and leaves nothing behind. """
+    results = run_benchmarks([2, 4], 1, only='status_view')
+
+    self.assertEqual(
+      sorted(results),
+      ['status_view[servers=2]', 'status_view[servers=4]']
+    )
+    self.assertGreater(results['status_view[servers=2]']['seconds'], 0)
+    self.assertFalse(Server.objects.exists())
+
+  def test_compare(self):
+    """ Test timings may drift by the tolerance, but queries may not grow. """
+    baseline = {
+      'status_view[servers=10]': {'seconds': 1.0, 'queries': 3},
+      'minecraft_status[servers=10,down=0]': {'servers_per_second': 100.0},
+    }
+    results = {
+      'status_view[servers=10]': {'seconds': 1.2, 'queries': 4},
+      'minecraft_status[servers=10,down=0]': {'servers_per_second': 70.0},
+      'server_form[servers=10]': {'seconds': 9.0},
+    }
+
+    self.assertEqual(compare(baseline, results, 0.25), [
+      ('status_view[servers=10]', 'queries', 3, 4),
+      ('minecraft_status[servers=10,down=0]', 'servers_per_second', 100.0, 70.0),
+    ])
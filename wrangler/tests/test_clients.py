@@ -0,0 +1,59 @@
+"""
+file: wrangler/tests/test_clients.py
+author: lkmhaqer
+"""
+from unittest import mock
+
+from django.test import SimpleTestCase
+from docker.errors import DockerException
+
+from wrangler.clients import DockerClientPool
+from wrangler.models import MineHost
+
+
+@mock.patch('wrangler.clients.DockerClient')
+class DockerClientPoolTests(SimpleTestCase):
+  """ Tests for our per-host docker client registry. """
+  def setUp(self):
+    self.pool = DockerClientPool()
+    self.mine_host = MineHost(name='minecraft-00.cvn')
+
+  def test_client_reused_per_host(self, docker_client): # pylint: disable=unused-argument
+    """ Test that a host gets the same client until it's evicted. """
+    first = self.pool.get(self.mine_host)
+    second = self.pool.get(MineHost(name='minecraft-00.cvn'))
+
+    self.assertIs(first, second)
+
+  def test_client_pins_api_version(self, docker_client):
+    """ Test that we connect with our pinned docker API version. """
+    with self.settings(DOCKER_API_VERSION='1.41'):
+      self.pool.get(self.mine_host)
+
+    docker_client.assert_called_once_with(
+      base_url='tcp://minecraft-00.cvn:2375',
+      version='1.41',
+      timeout=mock.ANY,
+      max_pool_size=mock.ANY,
+    )
+
+  def test_idle_client_evicted(self, docker_client):
+    """ Test that idle clients are closed, and a new one is built. """
+    first = self.pool.get(self.mine_host)
+    with self.settings(DOCKER_CLIENT_IDLE_TIMEOUT=-1):
+      self.pool.evict_idle()
+
+    first.close.assert_called_once()
+    self.pool.get(self.mine_host)
+    self.assertEqual(docker_client.call_count, 2)
+
+  def test_unhealthy_client_replaced(self, docker_client):
+    """ Test that a client failing its health check is replaced. """
+    docker_client.side_effect = [mock.MagicMock(), mock.MagicMock()]
+    first = self.pool.get(self.mine_host)
+    first.ping.side_effect = DockerException('host went away')
+    with self.settings(DOCKER_HEALTHCHECK_INTERVAL=-1):
+      second = self.pool.get(self.mine_host)
+
+    self.assertIsNot(first, second)
+    first.close.assert_called_once()
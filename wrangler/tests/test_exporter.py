@@ -0,0 +1,118 @@
+"""
+file: wrangler/tests/test_exporter.py
+author: lkmhaqer
+"""
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+
+from wrangler.exporter import render_fleet_metrics
+from wrangler.history import LATENCY_KEY
+from wrangler.models import MineHost, Server
+from wrangler.probe_cache import probe_cache
+from wrangler.reconcile import CONTAINER_STATES_KEY
+from wrangler.tasks import STATUS_SNAPSHOT_KEY
+
+
+class ExporterTests(TestCase):
+  """ Tests for the fleet gauges served on /metrics. """
+  def setUp(self):
+    probe_cache.clear()
+    cache.clear()
+    self.user = User.objects.create_user('TestyMcTestFace', 'foo@bar.com', 'pw')
+    self.mine_host = MineHost.objects.create(name='example.com', server_limit=4)
+    self.servers = []
+    for i in range(3):
+      server = Server(name=f'mc-0{i}', owner=self.user, host=self.mine_host)
+      server.save()
+      self.servers.append(server)
+    Server.objects.filter(pk=self.servers[2].pk).update(hibernated=True)
+
+    cache.set(STATUS_SNAPSHOT_KEY, {
+      'taken': timezone.now() - timedelta(seconds=30),
+      'statuses': {
+        self.servers[0].pk: {
+          'version': {'name': '1.16.4', 'protocol': 754},
+          'players': {'online': 3, 'max': 20, 'sample': []},
+          'latency': 12.0,
+          'ping': 8.0,
+        },
+        self.servers[1].pk: {'version': {'text': '', 'error': 'timed out'}},
+        self.servers[2].pk: {'version': {'text': '', 'error': 'hibernated'}},
+      },
+    })
+    cache.set(CONTAINER_STATES_KEY, {
+      'example.com/mc-00': 'running',
+      'example.com/mc-01': 'exited',
+    })
+    cache.set(LATENCY_KEY, {
+      'servers': {self.servers[0].pk: {'p50': 8.0, 'p95': 20.0, 'p99': 40.0, 'samples': 5}},
+      'hosts': {'example.com': {'p50': 8.0, 'p95': 20.0, 'p99': 40.0, 'samples': 5}},
+    })
+
+  def tearDown(self):
+    probe_cache.clear()
+    cache.clear()
+
+  def test_server_gauges(self):
+    """ Test servers are described from the snapshot, up or down. """
+    output = render_fleet_metrics()
+
+    for line in (
+      'diamondserv_server_up{server="mc-00",host="example.com"} 1',
+      'diamondserv_server_players_online{server="mc-00",host="example.com"} 3',
+      'diamondserv_server_players_max{server="mc-00",host="example.com"} 20',
+      'diamondserv_server_latency_seconds{server="mc-00",host="example.com"} 0.008',
+      'diamondserv_server_latency_percentile_seconds'
+      '{quantile="0.95",server="mc-00",host="example.com"} 0.02',
+      'diamondserv_server_up{server="mc-01",host="example.com"} 0',
+      'diamondserv_server_container_state'
+      '{state="exited",server="mc-01",host="example.com"} 1',
+      'diamondserv_server_hibernated{server="mc-02",host="example.com"} 1',
+      '# TYPE diamondserv_server_up gauge',
+    ):
+      self.assertIn(line, output)
+    self.assertNotIn('diamondserv_server_players_online{server="mc-01"', output)
+    self.assertNotIn('diamondserv_server_up{server="mc-02"', output)
+    self.assertIn('diamondserv_status_snapshot_age_seconds 3', output)
+
+  def test_host_gauges(self):
+    """ Test hosts report their servers and ports against their limits. """
+    # Servers moved outside the host's range hold none of its ports, and
+    # the range stops short of max_port.
+    Server.objects.filter(pk=self.servers[1].pk).update(port=30000)
+    Server.objects.filter(pk=self.servers[2].pk).update(port=self.mine_host.max_port)
+
+    output = render_fleet_metrics()
+
+    for line in (
+      'diamondserv_host_servers{host="example.com"} 3',
+      'diamondserv_host_server_limit{host="example.com"} 4',
+      'diamondserv_host_ports{host="example.com"} 128',
+      'diamondserv_host_ports_used{host="example.com"} 1',
+      'diamondserv_host_latency_percentile_seconds{quantile="0.5",host="example.com"} 0.008',
+    ):
+      self.assertIn(line, output)
+
+  def test_no_snapshot(self):
+    """ Test a scrape never probes, even with nothing cached. """
+    cache.clear()
+
+    with mock.patch('wrangler.tasks.probe_servers') as probe_servers:
+      output = render_fleet_metrics()
+
+    probe_servers.assert_not_called()
+    self.assertNotIn('diamondserv_server_up{', output)
+    self.assertIn('diamondserv_host_servers{host="example.com"} 3', output)
+
+  def test_metrics_view(self):
+    """ Test /metrics serves the fleet alongside request timings. """
+    response = self.client.get(reverse('metrics'))
+
+    self.assertContains(response, 'diamondserv_server_up{server="mc-00",host="example.com"} 1')
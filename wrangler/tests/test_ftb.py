@@ -0,0 +1,104 @@
+"""
+file: wrangler/tests/test_ftb.py
+author: lkmhaqer
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+
+from wrangler.models import ServerType
+
+
+PACKS = {
+  '/popular/installs/FTB/2': {'packs': [35, 79]},
+  '/35': {'name': 'FTB Revelation', 'versions': [{'id': 1, 'name': '3.3.0'}]},
+  '/79': {'name': 'FTB Presents Direwolf20', 'versions': [{'id': 2, 'name': '1.5.0'}]},
+}
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+  """ Serves our fixture packs, with ETags, like the FTB API. """
+  requests = []
+
+  def do_GET(self): # pylint: disable=invalid-name
+    """ Answer with a fixture, or a 304 if the client has it. """
+    self.requests.append(self.path)
+    if self.path not in PACKS:
+      self.send_error(404)
+      return
+    etag = f'"{self.path}"'
+    if self.headers.get('If-None-Match') == etag:
+      self.send_response(304)
+      self.end_headers()
+      return
+    body = json.dumps(PACKS[self.path]).encode()
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('ETag', etag)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, format, *args): # pylint: disable=redefined-builtin
+    """ Keep the test output quiet. """
+
+
+class FillFtbTests(TestCase):
+  """ Tests for importing modpacks from a local FTB API fixture. """
+  @classmethod
+  def setUpClass(cls):
+    super().setUpClass()
+    cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+    cls.api_url = f'http://127.0.0.1:{cls.server.server_port}/'
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.server.shutdown()
+    cls.server.server_close()
+    super().tearDownClass()
+
+  def setUp(self):
+    cache.clear()
+    FixtureHandler.requests = []
+
+  def _fill(self):
+    """ Run fill_ftb against our fixture server, returning its output. """
+    out = StringIO()
+    call_command('fill_ftb', f'--api-url={self.api_url}', '--limit=2', stdout=out)
+    return out.getvalue()
+
+  def test_import_packs(self):
+    """ Test each pack becomes a ServerType with its environment. """
+    output = self._fill()
+
+    self.assertIn('Found FTB Revelation (3.3.0)', output)
+    server_type = ServerType.objects.get(name='FTB Revelation')
+    self.assertEqual(
+      sorted(str(var) for var in server_type.environment_vars.all()),
+      ['FTB_MODPACK_ID=35', 'FTB_MODPACK_VERSION_ID=1', 'MEMORY=4G', 'TYPE=FTBA']
+    )
+    self.assertEqual(
+      ServerType.objects.filter(docker_image='itzg/minecraft-server:multiarch').count(),
+      2
+    )
+
+  def test_unchanged_packs_revalidated(self):
+    """
+    Test a second import revalidates rather than downloads, but still
+    imports unchanged packs our database has lost.
+    """
+    self._fill()
+    ServerType.objects.filter(name='FTB Revelation').delete()
+
+    output = self._fill()
+
+    self.assertIn('2 packs unchanged', output)
+    self.assertIn('Found FTB Revelation (3.3.0)', output)
+    self.assertEqual(ServerType.objects.filter(name='FTB Revelation').count(), 1)
+    self.assertEqual(len(FixtureHandler.requests), 6)
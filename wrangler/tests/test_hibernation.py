@@ -0,0 +1,134 @@
+"""
+file: wrangler/tests/test_hibernation.py
+author: lkmhaqer
+"""
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from docker.errors import NotFound
+
+from accounts.models import User
+
+from wrangler.hibernation import hibernate_idle, mark_active
+from wrangler.history import record_players
+from wrangler.jobs import claim_job, enqueue, run_job
+from wrangler.models import Job, JobAction, JobState, MineHost, Server
+from wrangler.probe_cache import probe_cache
+from wrangler.tasks import docker_start_server, refresh_status_snapshot
+
+
+START = datetime(2021, 1, 20, 12, 0, tzinfo=timezone.utc)
+
+
+@override_settings(HIBERNATE_IDLE_MINUTES=60)
+class HibernationTests(TestCase):
+  """ Tests for hibernating idle servers, and waking them again. """
+  def setUp(self):
+    probe_cache.clear()
+    cache.clear()
+    self.user = User.objects.create_user('TestyMcTestFace', 'foo@bar.com', 'pw')
+    self.mine_host = MineHost.objects.create(name='example.com')
+    self.busy = Server(name='mc-busy', owner=self.user, host=self.mine_host)
+    self.busy.save()
+    self.idle = Server(name='mc-idle', owner=self.user, host=self.mine_host)
+    self.idle.save()
+
+  def tearDown(self):
+    probe_cache.clear()
+    cache.clear()
+
+  def _poll(self, taken, online):
+    """ Record a poll where only mc-busy has players. """
+    mark_active({'taken': taken, 'statuses': {
+      self.busy.pk: {'version': {'name': '1.16.4'}, 'players': {'online': online}},
+      self.idle.pk: {'version': {'name': '1.16.4'}, 'players': {'online': 0}},
+    }})
+
+  def test_idle_servers_hibernated(self):
+    """ Test only servers idle past the threshold get a hibernate job. """
+    self._poll(START, online=0)
+    self._poll(START + timedelta(minutes=50), online=3)
+
+    jobs = hibernate_idle(now=START + timedelta(minutes=61))
+
+    self.assertEqual([job.server_name for job in jobs], ['mc-idle'])
+    self.assertEqual(hibernate_idle(now=START + timedelta(minutes=61)).count(), 0)
+
+  def test_failed_hibernate_not_retried(self):
+    """ Test a server we couldn't stop isn't queued again every poll. """
+    self._poll(START, online=0)
+    hibernate_idle(now=START + timedelta(minutes=61))
+    with mock.patch('wrangler.jobs.docker_stop_server', side_effect=NotFound('gone')):
+      for _ in range(2):
+        run_job(claim_job())
+    self.assertEqual(Job.objects.filter(state=JobState.FAILED).count(), 2)
+
+    now = datetime.now(timezone.utc)
+    self.assertEqual(hibernate_idle(now=now).count(), 0)
+    self.assertEqual(hibernate_idle(now=now + timedelta(minutes=61)).count(), 2)
+
+  @mock.patch('wrangler.jobs.docker_stop_server')
+  def test_hibernate_then_wake(self, docker_stop):
+    """ Test hibernating stops the container, and waking starts it. """
+    enqueue(self.idle, JobAction.HIBERNATE)
+    run_job(claim_job())
+    docker_stop.assert_called_once()
+    self.assertTrue(Server.objects.get(pk=self.idle.pk).hibernated)
+
+    enqueue(self.idle, JobAction.WAKE)
+    docker_start = mock.MagicMock()
+    with mock.patch.dict('wrangler.jobs.ACTIONS', {JobAction.WAKE: docker_start}):
+      run_job(claim_job())
+    docker_start.assert_called_once()
+    server = Server.objects.get(pk=self.idle.pk)
+    self.assertFalse(server.hibernated)
+    self.assertIsNotNone(server.last_active)
+
+  def test_hibernated_servers_not_probed(self):
+    """ Test the poller leaves hibernating servers out of its probes. """
+    Server.objects.filter(pk=self.idle.pk).update(hibernated=True)
+    live = {'serverlist': [], 'total_players': 0, 'total_capacity': 0}
+    with mock.patch('wrangler.tasks.minecraft_status', return_value=live) as probe:
+      snapshot = refresh_status_snapshot()
+
+    self.assertEqual([s.name for s in probe.call_args.args[0]], ['mc-busy'])
+    self.assertEqual(
+      snapshot['statuses'][self.idle.pk]['version']['error'],
+      'hibernated'
+    )
+
+    # Nor is its history recorded, as if it were down.
+    samples = record_players(snapshot)
+    self.assertNotIn(self.idle.pk, [sample.server_id for sample in samples])
+
+  def test_stopped_containers_stay_stopped(self):
+    """ Test a container we stop isn't started again with its docker daemon. """
+    client = mock.MagicMock()
+    client.containers.get.side_effect = NotFound('no container')
+    with mock.patch('wrangler.tasks._get_client', return_value=client):
+      docker_start_server(self.idle)
+
+    self.assertEqual(
+      client.containers.run.call_args.kwargs['restart_policy']['Name'],
+      'unless-stopped'
+    )
+
+  def test_wake_view(self):
+    """ Test any logged in user can wake a server, once. """
+    Server.objects.filter(pk=self.idle.pk).update(hibernated=True)
+    friend = User.objects.create_user('Friend', 'friend@bar.com', 'pw')
+    self.client.force_login(user=friend)
+    url = reverse('wrangler:server_wake', kwargs={'server_name': 'mc-idle'})
+
+    response = self.client.post(url)
+    self.client.post(url)
+
+    self.assertRedirects(
+      response,
+      reverse('wrangler:server_detail', kwargs={'server_name': 'mc-idle'}),
+      fetch_redirect_response=False
+    )
+    self.assertEqual(Job.objects.filter(action=JobAction.WAKE).count(), 1)
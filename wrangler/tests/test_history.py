@@ -0,0 +1,171 @@
+"""
+file: wrangler/tests/test_history.py
+author: lkmhaqer
+"""
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from accounts.models import User
+
+from wrangler.history import (
+  prune_players,
+  record_players,
+  refresh_latency_percentiles,
+  rollup_players
+)
+from wrangler.models import MineHost, PlayerRollup, PlayerSample, Resolution, Server
+from wrangler.probe_cache import probe_cache
+
+
+START = datetime(2021, 1, 20, 12, 0, tzinfo=timezone.utc)
+
+
+class PlayerHistoryTests(TestCase):
+  """ Tests for recording, rolling up and querying player counts. """
+  def setUp(self):
+    probe_cache.clear()
+    self.user = User.objects.create_user('TestyMcTestFace', 'foo@bar.com', 'pw')
+    self.mine_host = MineHost(name='example.com')
+    self.mine_host.save()
+    self.server = Server(name='mc-00', owner=self.user, host=self.mine_host)
+    self.server.save()
+
+  def tearDown(self):
+    probe_cache.clear()
+
+  def _poll(self, taken, online=None):
+    """ Record a poll, with the server down if online is None. """
+    status = {'version': {'text': '', 'error': 'timed out'}}
+    if online is not None:
+      status = {
+        'version': {'name': '1.16.4'},
+        'players': {'online': online, 'max': 20},
+        'latency': 10.0,
+      }
+    record_players({'taken': taken, 'statuses': {self.server.pk: status}})
+
+  def test_deleted_server_not_recorded(self):
+    """ Test a server deleted since its poll doesn't break recording. """
+    status = {'version': {'text': '', 'error': 'timed out'}}
+    deleted = Server(name='mc-gone', owner=self.user, host=self.mine_host)
+    deleted.save()
+    deleted_pk = deleted.pk
+    deleted.delete()
+
+    samples = record_players({'taken': START, 'statuses': {
+      self.server.pk: status,
+      deleted_pk: status,
+    }})
+
+    self.assertEqual([sample.server_id for sample in samples], [self.server.pk])
+
+  def test_rollups_add_up(self):
+    """
+    Test that minute rollups feed hour and day rollups, and that polls
+    landing in an already rolled up bucket update it.
+    """
+    self._poll(START, online=2)
+    self._poll(START + timedelta(seconds=30), online=6)
+    rollup_players()
+    self._poll(START + timedelta(minutes=1), online=1)
+    self._poll(START + timedelta(minutes=1, seconds=30))
+    rollup_players()
+
+    minutes = PlayerRollup.objects.filter(resolution=Resolution.MINUTE)
+    self.assertEqual(minutes.count(), 2)
+    hour = PlayerRollup.objects.get(resolution=Resolution.HOUR)
+    self.assertEqual(hour.samples, 4)
+    self.assertEqual(hour.up_samples, 3)
+    self.assertEqual(hour.online_avg, 9 / 4)
+    self.assertEqual(hour.online_peak, 6)
+    self.assertEqual(hour.latency_avg, 10.0)
+    day = PlayerRollup.objects.get(resolution=Resolution.DAY)
+    self.assertEqual(day.online_total, hour.online_total)
+
+  def test_prune_old_rows(self):
+    """ Test that raw samples are pruned once past their retention. """
+    self._poll(START, online=1)
+    rollup_players()
+
+    prune_players(now=START + timedelta(days=3))
+
+    self.assertFalse(PlayerSample.objects.exists())
+    self.assertTrue(PlayerRollup.objects.filter(resolution=Resolution.DAY).exists())
+
+  def test_history_api(self):
+    """ Test the history endpoint serves a range from the rollups. """
+    self._poll(START, online=4)
+    self._poll(START + timedelta(hours=2), online=8)
+    rollup_players()
+
+    response = self.client.get(
+      reverse('wrangler:history', kwargs={'server_name': 'mc-00'}),
+      {
+        'resolution': 'hour',
+        'start': '2021-01-20T13:00:00',
+        'end': '2021-01-21T00:00:00Z',
+      }
+    )
+
+    points = response.json()['points']
+    self.assertEqual(len(points), 1)
+    self.assertEqual(points[0]['online_peak'], 8)
+
+  def test_history_api_bad_resolution(self):
+    """ Test we refuse a resolution we don't roll up. """
+    response = self.client.get(
+      reverse('wrangler:history', kwargs={'server_name': 'mc-00'}),
+      {'resolution': 'raw'}
+    )
+
+    self.assertEqual(response.status_code, 400)
+
+  def test_history_api_impossible_time(self):
+    """ Test a time that's well formed but can't exist is refused. """
+    response = self.client.get(
+      reverse('wrangler:history', kwargs={'server_name': 'mc-00'}),
+      {'start': '2021-13-40T00:00'}
+    )
+
+    self.assertEqual(response.status_code, 400)
+
+  def test_latency_percentiles(self):
+    """ Test percentiles per server and host, over recent samples only. """
+    for i in range(1, 101):
+      PlayerSample.objects.create(
+        server=self.server,
+        timestamp=START - timedelta(seconds=i),
+        up=True,
+        latency=float(i)
+      )
+    PlayerSample.objects.create(
+      server=self.server,
+      timestamp=START - timedelta(days=1),
+      latency=5000.0
+    )
+
+    latency = refresh_latency_percentiles(now=START)
+
+    self.assertEqual(
+      latency['servers'][self.server.pk],
+      {'p50': 50.0, 'p95': 95.0, 'p99': 99.0, 'samples': 100}
+    )
+    self.assertEqual(latency['hosts']['example.com']['p99'], 99.0)
+
+  def test_status_page_shows_latency(self):
+    """ Test the status page shows the cached percentiles. """
+    cache.clear()
+    self._poll(START, online=1)
+    refresh_latency_percentiles(now=START)
+
+    down = [(self.server, {'version': {'text': '', 'error': 'timed out'}})]
+    with mock.patch('wrangler.tasks.probe_servers', mock.AsyncMock(return_value=down)):
+      response = self.client.get(reverse('wrangler:status'))
+
+    self.assertContains(response, '10 / 10 ms')
+    self.assertEqual(response.context['host_latency'][0][0], 'example.com')
+    cache.clear()
@@ -0,0 +1,81 @@
+"""
+file: wrangler/tests/test_images.py
+author: lkmhaqer
+"""
+from unittest import mock
+
+from django.test import TestCase
+from docker.errors import APIError
+
+from wrangler.images import normalize_image, warm_images
+from wrangler.models import HostImage, ImageState, MineHost, ServerType
+
+
+def _image(tag, image_id='sha256:abc'):
+  """ Fake a docker-py Image with a single tag. """
+  return mock.MagicMock(tags=[tag], id=image_id, attrs={'Size': 1024})
+
+
+class ImageWarmingTests(TestCase):
+  """ Tests for pre-pulling ServerType images onto our hosts. """
+  def setUp(self):
+    # Migration 0001 adds a Vanilla type, keep it out of our way.
+    ServerType.objects.update(enabled=False)
+    ServerType.objects.create(
+      name='FTB',
+      version='1.0',
+      docker_image='itzg/minecraft-server:java8'
+    )
+    ServerType.objects.create(name='Paper', version='1.16', docker_image='paper')
+    self.mine_host = MineHost.objects.create(name='example.com')
+    self.client = mock.MagicMock()
+    self.client.images.list.return_value = [
+      _image('itzg/minecraft-server:java8'),
+    ]
+    self.client.images.pull.return_value = _image('paper:latest', 'sha256:def')
+
+  def _warm(self):
+    """ Warm our host against the fake docker client. """
+    with mock.patch('wrangler.images.docker_clients') as docker_clients:
+      docker_clients.get.return_value = self.client
+      return warm_images()
+
+  def test_normalize_image(self):
+    """ Test images without a tag are spelled with :latest. """
+    self.assertEqual(normalize_image('paper'), 'paper:latest')
+    self.assertEqual(normalize_image('reg:5000/a:b'), 'reg:5000/a:b')
+
+  def test_pulls_only_missing_images(self):
+    """ Test present images are recorded, and only missing ones pulled. """
+    report = self._warm()
+
+    self.client.images.pull.assert_called_once_with('paper', tag='latest')
+    self.assertEqual(report, {'present': 1, 'pulled': 1, 'failed': 0, 'down': 0})
+    states = dict(HostImage.objects.values_list('image', 'state'))
+    self.assertEqual(states, {
+      'itzg/minecraft-server:java8': ImageState.PRESENT,
+      'paper:latest': ImageState.PRESENT,
+    })
+
+  def test_failed_pull_recorded(self):
+    """ Test a failed pull is kept with its reason, for the admin. """
+    self.client.images.pull.side_effect = APIError('disk full')
+
+    report = self._warm()
+
+    self.assertEqual(report['failed'], 1)
+    image = HostImage.objects.get(image='paper:latest')
+    self.assertEqual(image.state, ImageState.FAILED)
+    self.assertIn('disk full', image.message)
+
+  def test_unused_images_forgotten(self):
+    """ Test images of disabled types are dropped from our records. """
+    self._warm()
+    ServerType.objects.filter(name='Paper').update(enabled=False)
+
+    self._warm()
+
+    self.assertEqual(
+      list(HostImage.objects.values_list('image', flat=True)),
+      ['itzg/minecraft-server:java8']
+    )
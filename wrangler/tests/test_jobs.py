@@ -0,0 +1,90 @@
+"""
+file: wrangler/tests/test_jobs.py
+author: lkmhaqer
+"""
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from docker.errors import DockerException
+
+from accounts.models import User
+
+from wrangler.jobs import claim_job, enqueue, run_job
+from wrangler.models import Job, JobAction, JobState, MineHost, Server
+
+
+class JobTests(TestCase):
+  """ Tests for claiming and running container lifecycle jobs. """
+  def setUp(self):
+    self.user = User.objects.create_user('TestyMcTestFace', 'foo@bar.com', 'pw')
+    self.mine_host = MineHost(name='example.com')
+    self.mine_host.save()
+    self.server = Server(name='mc-test', owner=self.user, host=self.mine_host)
+    self.server.save()
+
+  def test_claim_oldest_job_once(self):
+    """ Test that jobs are claimed oldest first, and only the once. """
+    first = enqueue(self.server, JobAction.START)
+    enqueue(self.server, JobAction.RESTART)
+
+    job = claim_job()
+
+    self.assertEqual(job.pk, first.pk)
+    self.assertEqual(job.state, JobState.RUNNING)
+    self.assertEqual(claim_job().action, JobAction.RESTART)
+    self.assertIsNone(claim_job())
+
+  @mock.patch('wrangler.jobs.docker_delete_server')
+  def test_delete_job_removes_server(self, docker_delete):
+    """ Test that a delete job removes the container, then the Server. """
+    enqueue(self.server, JobAction.DELETE)
+
+    job = run_job(claim_job())
+
+    docker_delete.assert_called_once()
+    self.assertEqual(job.state, JobState.SUCCEEDED)
+    self.assertFalse(Server.objects.filter(name='mc-test').exists())
+    self.assertEqual(Job.objects.get(pk=job.pk).server_name, 'mc-test')
+
+  def test_failed_job_records_error(self):
+    """ Test that a docker error marks the job failed, with the reason. """
+    enqueue(self.server, JobAction.RESTART)
+    with mock.patch.dict(
+      'wrangler.jobs.ACTIONS',
+      {JobAction.RESTART: mock.MagicMock(side_effect=DockerException('no host'))}
+    ):
+      job = run_job(claim_job())
+
+    self.assertEqual(job.state, JobState.FAILED)
+    self.assertEqual(job.message, 'no host')
+
+  @override_settings(JOB_HOST_CONCURRENCY=1)
+  def test_full_host_not_claimed(self):
+    """ Test a host's last slot is rechecked as the job is claimed. """
+    enqueue(self.server, JobAction.START)
+    running = enqueue(self.server, JobAction.STOP)
+    Job.objects.filter(pk=running.pk).update(
+      state=JobState.RUNNING,
+      started=timezone.now()
+    )
+
+    # Another worker filled the host after we picked our job.
+    with mock.patch('wrangler.jobs._busy_hosts', return_value=[]):
+      self.assertIsNone(claim_job())
+
+  @override_settings(JOB_HOST_CONCURRENCY=1, JOB_STALE_MINUTES=60)
+  def test_stale_job_failed(self):
+    """ Test a job abandoned by its worker is failed, freeing its host. """
+    stale = enqueue(self.server, JobAction.RESTART)
+    Job.objects.filter(pk=stale.pk).update(
+      state=JobState.RUNNING,
+      started=timezone.now() - timedelta(minutes=61)
+    )
+    queued = enqueue(self.server, JobAction.START)
+
+    self.assertEqual(claim_job().pk, queued.pk)
+    stale.refresh_from_db()
+    self.assertEqual(stale.state, JobState.FAILED)
+    self.assertIsNotNone(stale.finished)
@@ -0,0 +1,72 @@
+"""
+file: wrangler/tests/test_launch.py
+author: lkmhaqer
+"""
+from django.core.cache import cache
+from django.test import TestCase
+
+from wrangler.launch import launch_spec
+from wrangler.models import EnvironmentVar, ServerType
+
+
+class LaunchSpecTests(TestCase):
+  """ Tests for caching ServerType launch specs, and keeping them fresh. """
+  def setUp(self):
+    cache.clear()
+    self.server_type = ServerType.objects.create(
+      name='Modded',
+      version='1.0',
+      docker_image='itzg/minecraft-server'
+    )
+    self.memory = EnvironmentVar.objects.create(name='MEMORY', value='4G')
+    self.server_type.environment_vars.add(self.memory)
+
+  def tearDown(self):
+    cache.clear()
+
+  def test_spec_cached(self):
+    """ Test a spec is built once, then read without any queries. """
+    spec = launch_spec(self.server_type)
+
+    with self.assertNumQueries(0):
+      self.assertEqual(launch_spec(self.server_type), spec)
+    self.assertEqual(spec['environment'], ['MEMORY=4G'])
+    self.assertIsNone(spec['volumes'])
+
+  def test_modpack_volume(self):
+    """ Test a CurseForge modpack gets the modpacks volume mounted. """
+    self.server_type.environment_vars.add(
+      EnvironmentVar.objects.create(name='CF_SERVER_MOD', value='/modpacks/a.zip')
+    )
+
+    self.assertIn('/srv/modpacks', launch_spec(self.server_type)['volumes'])
+
+  def test_invalidated_by_m2m_changes(self):
+    """ Test adding and removing vars, from either side, drops the spec. """
+    launch_spec(self.server_type)
+    motd = EnvironmentVar.objects.create(name='MOTD', value='hi')
+    motd.servertype_set.add(self.server_type)
+    self.assertIn('MOTD=hi', launch_spec(self.server_type)['environment'])
+
+    self.server_type.environment_vars.remove(motd)
+    self.assertNotIn('MOTD=hi', launch_spec(self.server_type)['environment'])
+
+    self.memory.servertype_set.clear()
+    self.assertEqual(launch_spec(self.server_type)['environment'], [])
+
+  def test_invalidated_by_saves(self):
+    """ Test editing a var or the type itself drops the spec. """
+    launch_spec(self.server_type)
+    self.memory.value = '8G'
+    self.memory.save()
+    self.assertEqual(launch_spec(self.server_type)['environment'], ['MEMORY=8G'])
+
+    self.server_type.docker_image = 'itzg/minecraft-server:java8'
+    self.server_type.save()
+    self.assertEqual(
+      launch_spec(self.server_type)['image'],
+      'itzg/minecraft-server:java8'
+    )
+
+    self.memory.delete()
+    self.assertEqual(launch_spec(self.server_type)['environment'], [])
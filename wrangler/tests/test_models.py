@@ -2,6 +2,9 @@
 file: wrangler/tests/test_models.py
 author: lkmhaqer
 """
+from unittest import mock
+
+from django.core.exceptions import ValidationError
 from django.db.utils import IntegrityError
 from django.test import TestCase
 
@@ -97,3 +100,38 @@ class ServerTests(TestCase):
     not a port that is just the highest plus one.
     """
     self.assertEqual(self.servers[3].port, self.mine_host.min_port + 2)
+
+  def test_server_port_skips_custom_port(self):
+    """
+    Test that once the ports below our custom port fill up,
+    we hop over it to the next free port.
+    """
+    ports = []
+    for i in range(4, 8):
+      server = Server(name=f'mc-0{i}', owner=self.user, host=self.mine_host)
+      server.save()
+      ports.append(server.port)
+
+    self.assertEqual(ports, [25568, 25569, 25571, 25572])
+
+  def test_server_port_none_left(self):
+    """ Test that a full host refuses to hand out a port. """
+    self.mine_host.max_port = self.mine_host.min_port + 3
+    self.mine_host.save()
+    with self.assertRaises(ValidationError):
+      Server(name='mc-full', owner=self.user, host=self.mine_host).save()
+
+  def test_server_port_retried_when_taken(self):
+    """
+    Test that if a concurrent create takes our port first,
+    we pick again rather than failing.
+    """
+    with mock.patch.object(
+      Server,
+      '_next_free_port',
+      side_effect=[self.servers[0].port, 25580]
+    ):
+      server = Server(name='mc-race', owner=self.user, host=self.mine_host)
+      server.save()
+
+    self.assertEqual(server.port, 25580)
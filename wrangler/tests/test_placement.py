@@ -0,0 +1,91 @@
+"""
+file: wrangler/tests/test_placement.py
+author: lkmhaqer
+"""
+from unittest import mock
+
+from django.test import TestCase
+
+from accounts.models import User
+
+from wrangler.forms import ServerForm
+from wrangler.models import EnvironmentVar, MineHost, Server, ServerType
+from wrangler.placement import choose_host, parse_memory
+
+
+GIB = 1024 ** 3
+
+
+class PlacementTests(TestCase):
+  """
+  Tests for our placement engine. We have two hosts, a big one already
+  running a 4G modpack, and a small idle one.
+  """
+  def setUp(self):
+    self.user = User.objects.create_user('TestyMcTestFace', 'foo@bar.com', 'pw')
+    self.big_host = MineHost(name='big.example.com')
+    self.big_host.save()
+    self.small_host = MineHost(name='small.example.com')
+    self.small_host.save()
+    self.modpack = ServerType(name='FTB', docker_image='itzg/minecraft-server')
+    self.modpack.save()
+    self.modpack.environment_vars.add(
+      EnvironmentVar.objects.create(name='MEMORY', value='4G')
+    )
+    self.vanilla = ServerType.objects.get(pk=1)
+    Server(
+      name='mc-00',
+      owner=self.user,
+      host=self.big_host,
+      server_type=self.modpack
+    ).save()
+    self.infos = {
+      'big.example.com': {'mem_total': 16 * GIB, 'ncpu': 8, 'running': 1},
+      'small.example.com': {'mem_total': 6 * GIB, 'ncpu': 2, 'running': 0},
+    }
+
+  def _choose(self, server_type):
+    """ Choose a host, with docker info answered from self.infos. """
+    with mock.patch(
+      'wrangler.placement._host_info',
+      lambda host: self.infos.get(host.name)
+    ):
+      return choose_host(server_type)
+
+  def test_parse_memory(self):
+    """ Test docker style memory sizes are read as bytes. """
+    self.assertEqual(parse_memory('4G'), 4 * GIB)
+    self.assertEqual(parse_memory('512m'), 512 * 1024 ** 2)
+    self.assertIsNone(parse_memory('lots'))
+
+  def test_choose_roomiest_host(self):
+    """ Test that we pick the host with the most headroom. """
+    self.assertEqual(self._choose(self.modpack), self.big_host)
+
+  def test_skip_host_without_memory(self):
+    """ Test that a host that can't fit the server's memory is skipped. """
+    self.infos['big.example.com']['mem_total'] = 6 * GIB
+    self.assertEqual(self._choose(self.modpack), self.small_host)
+
+  def test_skip_unreachable_and_full_hosts(self):
+    """ Test that unreachable or full hosts never get picked. """
+    del self.infos['big.example.com']
+    self.small_host.server_limit = 0
+    self.small_host.save()
+
+    self.assertIsNone(self._choose(self.vanilla))
+
+  def test_form_places_server_without_host(self):
+    """ Test the create form fills in the host when none is chosen. """
+    form = ServerForm(
+      {'name': 'mc-auto', 'game_type': 0, 'server_type': self.modpack.pk},
+      user=self.user
+    )
+    with mock.patch(
+      'wrangler.forms.choose_host',
+      return_value=self.small_host
+    ) as choose:
+      self.assertTrue(form.is_valid())
+
+    choose.assert_called_once_with(self.modpack)
+    self.assertEqual(form.save().host, self.small_host)
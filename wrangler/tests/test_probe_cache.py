@@ -0,0 +1,104 @@
+"""
+file: wrangler/tests/test_probe_cache.py
+author: lkmhaqer
+"""
+import asyncio
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from wrangler.probe_cache import ProbeCache
+
+
+UP = {'version': {'name': '1.16.4'}, 'players': {'online': 1, 'max': 20}}
+DOWN = {'version': {'text': '', 'error': 'timed out'}}
+
+
+@override_settings(PROBE_CACHE_TTL=5, PROBE_DOWN_TTL=2, PROBE_DOWN_MAX_TTL=6)
+class ProbeCacheTests(SimpleTestCase):
+  """ Tests for caching, backing off and coalescing status probes. """
+  def setUp(self):
+    self.cache = ProbeCache()
+    self.calls = 0
+    self.now = 100.0
+    patcher = mock.patch('wrangler.probe_cache.time')
+    patcher.start().monotonic.side_effect = lambda: self.now
+    self.addCleanup(patcher.stop)
+
+  def _probe(self, status, delay=0):
+    """ Return a probe answering with status, counting how often it runs. """
+    async def probe():
+      self.calls += 1
+      await asyncio.sleep(delay)
+      return status
+    return probe
+
+  def _get(self, status):
+    """ Look up example.com through the cache, probing with status. """
+    return asyncio.run(self.cache.probe('example.com:25565', self._probe(status)))
+
+  def test_live_result_reused(self):
+    """ Test a live result is reused until its TTL runs out. """
+    self._get(UP)
+    self.now += 4
+    self._get(UP)
+    self.assertEqual(self.calls, 1)
+
+    self.now += 2
+    self._get(UP)
+    self.assertEqual(self.calls, 2)
+
+  def test_down_servers_backed_off(self):
+    """ Test each failure doubles the wait, up to our max. """
+    probed = []
+    for wait in (2, 4, 6, 6):
+      self._get(DOWN)
+      probed.append(self.calls)
+      self.now += wait - 0.1
+      self._get(DOWN)
+      probed.append(self.calls)
+      self.now += 0.1
+
+    self.assertEqual(probed, [1, 1, 2, 2, 3, 3, 4, 4])
+
+  def test_back_up_resets_backoff(self):
+    """ Test a server that comes back is cached as live again. """
+    self._get(DOWN)
+    self.now += 2
+    self.assertEqual(self._get(UP), UP)
+    self.now += 4.9
+
+    self.assertEqual(self._get(DOWN), UP)
+    self.assertEqual(self.calls, 2)
+
+  def test_concurrent_probes_coalesced(self):
+    """ Test simultaneous lookups on one event loop share a single probe. """
+    async def lookups():
+      return await asyncio.gather(*[
+        self.cache.probe('example.com:25565', self._probe(UP, delay=0.01))
+        for _ in range(5)
+      ])
+
+    self.assertEqual(asyncio.run(lookups()), [UP] * 5)
+    self.assertEqual(self.calls, 1)
+
+  def test_probes_coalesced_across_threads(self):
+    """ Test a lookup from another thread awaits the probe in flight. """
+    started = threading.Event()
+
+    async def slow_probe():
+      started.set()
+      await asyncio.sleep(0.1)
+      return UP
+
+    leader = threading.Thread(
+      target=lambda: asyncio.run(self.cache.probe('example.com:25565', slow_probe))
+    )
+    leader.start()
+    started.wait()
+    status = self._get(DOWN)
+    leader.join()
+
+    self.assertEqual(status, UP)
+    self.assertEqual(self.calls, 0)
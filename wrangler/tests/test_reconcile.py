@@ -0,0 +1,120 @@
+"""
+file: wrangler/tests/test_reconcile.py
+author: lkmhaqer
+"""
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from docker.errors import DockerException
+
+from accounts.models import User
+
+from wrangler.jobs import enqueue
+from wrangler.models import Job, JobAction, MineHost, Server
+from wrangler.reconcile import (
+  AWAKE,
+  CONTAINER_STATES_KEY,
+  MISSING,
+  ORPHAN,
+  PORT,
+  find_drift,
+  repair
+)
+from wrangler.tasks import SERVER_LABEL
+
+
+def _container(name, port=None, labels=None, state='running'):
+  """ Fake a container as docker's list API describes it. """
+  ports = []
+  if port:
+    ports = [{'PrivatePort': 25565, 'PublicPort': port, 'Type': 'tcp'}]
+  return {
+    'Id': f'id-{name}',
+    'Names': [f'/{name}'],
+    'Labels': labels or {},
+    'Ports': ports,
+    'State': state,
+  }
+
+
+class ReconcileTests(TestCase):
+  """ Tests for finding and repairing drift between the DB and docker. """
+  def setUp(self):
+    cache.clear()
+    self.user = User.objects.create_user('TestyMcTestFace', 'foo@bar.com', 'pw')
+    self.mine_host = MineHost.objects.create(name='example.com')
+    self.servers = []
+    for i in range(3):
+      server = Server(name=f'mc-0{i}', owner=self.user, host=self.mine_host)
+      server.save()
+      self.servers.append(server)
+    self.client = mock.MagicMock()
+    self.client.api.containers.return_value = [
+      # mc-00 is as it should be, and mc-01 is on the wrong port
+      _container('mc-00', self.servers[0].port, {SERVER_LABEL: 'mc-00'}),
+      _container('mc-01', 30000, {SERVER_LABEL: 'mc-01'}, state='exited'),
+      # an orphan from a failed delete, and someone else's container
+      _container('mc-gone', 25600, {SERVER_LABEL: 'mc-gone'}),
+      _container('portainer'),
+    ]
+    patcher = mock.patch('wrangler.reconcile.docker_clients')
+    self.docker_clients = patcher.start()
+    self.docker_clients.get.return_value = self.client
+    self.addCleanup(patcher.stop)
+
+  def tearDown(self):
+    cache.clear()
+
+  def test_find_drift(self):
+    """ Test each kind of drift is found, and other containers ignored. """
+    drift, down = find_drift()
+
+    self.assertEqual(down, [])
+    self.assertEqual(
+      sorted((item.kind, item.name) for item in drift),
+      [(MISSING, 'mc-02'), (ORPHAN, 'mc-gone'), (PORT, 'mc-01')]
+    )
+    self.assertEqual(cache.get(CONTAINER_STATES_KEY)['example.com/mc-01'], 'exited')
+
+  def test_busy_servers_skipped(self):
+    """ Test a server with a job underway isn't called drifted. """
+    enqueue(self.servers[2], JobAction.START)
+
+    drift, _ = find_drift()
+
+    self.assertNotIn('mc-02', [item.name for item in drift])
+
+  def test_awake_hibernated_server(self):
+    """ Test a hibernating server whose container came back is put to sleep. """
+    Server.objects.filter(pk=self.servers[0].pk).update(hibernated=True)
+
+    drift, _ = find_drift()
+
+    awake = [item for item in drift if item.kind == AWAKE]
+    self.assertEqual([item.name for item in awake], ['mc-00'])
+    self.assertEqual(repair(awake[0]), 'queued hibernate')
+    self.assertEqual(Job.objects.get().action, JobAction.HIBERNATE)
+
+  def test_down_host_reported(self):
+    """ Test a host we can't list is reported, not treated as empty. """
+    self.client.api.containers.side_effect = DockerException('down')
+
+    drift, down = find_drift()
+
+    self.assertEqual(drift, [])
+    self.assertEqual(down, [self.mine_host])
+
+  def test_command_repairs(self):
+    """ Test --repair queues jobs for our servers and removes orphans. """
+    out = StringIO()
+    call_command('reconcile', '--once', '--repair', stdout=out)
+
+    self.assertIn('example.com/mc-gone: orphan, no Server: removed', out.getvalue())
+    self.client.api.remove_container.assert_called_once_with('id-mc-gone', force=True)
+    self.assertEqual(
+      sorted(Job.objects.values_list('server_name', 'action')),
+      [('mc-01', JobAction.RECREATE), ('mc-02', JobAction.START)]
+    )
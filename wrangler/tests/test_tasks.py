@@ -0,0 +1,256 @@
+"""
+file: wrangler/tests/test_tasks.py
+author: lkmhaqer
+"""
+import asyncio
+import threading
+import time
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import TestCase
+from mcstatus.pinger import PingResponse
+
+from accounts.models import User
+
+from wrangler.models import MineHost, Server
+from wrangler.probe_cache import probe_cache
+from wrangler.tasks import (
+  async_snapshot_status,
+  docker_stream_logs,
+  minecraft_status,
+  refresh_status_snapshot,
+  snapshot_status
+)
+
+
+def _fake_status(online, maximum):
+  """ Build an mcstatus PingResponse, as a live server would answer. """
+  return PingResponse({
+    'version': {'name': '1.16.4', 'protocol': 754},
+    'players': {'online': online, 'max': maximum},
+    'description': 'A Minecraft Server',
+  })
+
+
+class MinecraftStatusTests(TestCase):
+  """ Tests for our concurrent minecraft status probes. """
+  def setUp(self):
+    probe_cache.clear()
+    self.user = User.objects.create_user('TestyMcTestFace', 'foo@bar.com', 'pw')
+    self.mine_host = MineHost(name='example.com')
+    self.mine_host.save()
+    self.servers = []
+    for i in range(0, 3):
+      server = Server(name=f'mc-0{i}', owner=self.user, host=self.mine_host)
+      server.save()
+      self.servers.append(server)
+
+    self.calls = []
+    self.query = mock.AsyncMock(side_effect=asyncio.TimeoutError)
+
+  def tearDown(self):
+    probe_cache.clear()
+
+  def _fake_lookup(self, responses):
+    """ Return an async_lookup replacement that answers from responses. """
+    async def lookup(socket, timeout):
+      query = mock.MagicMock()
+
+      async def status():
+        self.calls.append(socket)
+        response = responses[socket]
+        if isinstance(response, Exception):
+          raise response
+        if response is None:
+          await asyncio.sleep(timeout * 4)
+        return response
+
+      async def ping():
+        return 12.5
+
+      query.async_status = status
+      query.async_ping = ping
+      query.async_query = self.query
+      return query
+
+    return lookup
+
+  def test_status_totals_and_order(self):
+    """
+    Test that up servers are totalled, down and slow servers are reported
+    with an error, and the results keep the order of the server list.
+    """
+    responses = {
+      'example.com:25565': _fake_status(3, 20),
+      'example.com:25566': ConnectionRefusedError('refused'),
+      'example.com:25567': None,
+    }
+    with self.settings(STATUS_PROBE_TIMEOUT=.05), mock.patch(
+      'wrangler.tasks.JavaServer.async_lookup',
+      self._fake_lookup(responses)
+    ):
+      output = minecraft_status(self.servers)
+
+    self.assertEqual(output['total_players'], 3)
+    self.assertEqual(output['total_capacity'], 20)
+    self.assertEqual(
+      [server for server, _ in output['serverlist']],
+      self.servers
+    )
+    self.assertEqual(output['serverlist'][2][1]['version']['error'], 'timed out')
+
+  def test_one_status_round_trip_per_server(self):
+    """ Test that we only ask each server for its status once. """
+    responses = {
+      server.get_socket(): _fake_status(1, 10) for server in self.servers
+    }
+    with mock.patch(
+      'wrangler.tasks.JavaServer.async_lookup',
+      self._fake_lookup(responses)
+    ):
+      minecraft_status(self.servers)
+
+    self.assertEqual(sorted(self.calls), sorted(responses))
+
+  def test_ping_and_query(self):
+    """
+    Test live servers are pinged, and queried for every player when
+    Query is on, while a failed query leaves the server up.
+    """
+    responses = {
+      server.get_socket(): _fake_status(1, 10) for server in self.servers
+    }
+    self.query.side_effect = [
+      mock.MagicMock(players=mock.MagicMock(names=['Steve', 'Alex']), map='world'),
+      asyncio.TimeoutError,
+      OSError('no query port'),
+    ]
+    with self.settings(STATUS_QUERY_ENABLED=True), mock.patch(
+      'wrangler.tasks.JavaServer.async_lookup',
+      self._fake_lookup(responses)
+    ):
+      output = minecraft_status(self.servers)
+
+    statuses = [status for _, status in output['serverlist']]
+    self.assertEqual([status['ping'] for status in statuses], [12.5] * 3)
+    names = [status['players'].get('names') for status in statuses]
+    self.assertEqual(sorted(names, key=bool), [None, None, ['Steve', 'Alex']])
+    self.assertEqual(output['total_players'], 3)
+
+  def test_empty_server_list(self):
+    """ Test that no servers means no probes and empty totals. """
+    output = minecraft_status([])
+
+    self.assertEqual(output['serverlist'], [])
+    self.assertEqual(output['total_players'], 0)
+
+
+class StatusSnapshotTests(TestCase):
+  """ Tests for the cached status snapshot our poller maintains. """
+  def setUp(self):
+    probe_cache.clear()
+    cache.clear()
+    self.user = User.objects.create_user('TestyMcTestFace', 'foo@bar.com', 'pw')
+    self.mine_host = MineHost(name='example.com')
+    self.mine_host.save()
+    self.server = Server(name='mc-00', owner=self.user, host=self.mine_host)
+    self.server.save()
+    self.live = {
+      'serverlist': [(self.server, {'players': {'online': 2, 'max': 10}})],
+      'total_players': 2,
+      'total_capacity': 10,
+    }
+
+  def tearDown(self):
+    probe_cache.clear()
+    cache.clear()
+
+  def test_snapshot_is_served_without_probing(self):
+    """ Test that once the poller has run, lookups don't probe again. """
+    with mock.patch('wrangler.tasks.minecraft_status', return_value=self.live):
+      snapshot = refresh_status_snapshot()
+
+    with mock.patch('wrangler.tasks.minecraft_status') as probe:
+      output = snapshot_status([self.server])
+
+    probe.assert_not_called()
+    self.assertEqual(output['total_players'], 2)
+    self.assertEqual(output['taken'], snapshot['taken'])
+
+  def test_no_snapshot_probes_live(self):
+    """ Test that without a poller, we still answer with a live probe. """
+    with mock.patch(
+      'wrangler.tasks.probe_servers',
+      mock.AsyncMock(return_value=self.live['serverlist'])
+    ) as probe:
+      output = snapshot_status([self.server])
+
+    probe.assert_awaited_once_with(
+      [(self.server, 'example.com:25565')],
+      cached=True
+    )
+    self.assertEqual(output['total_players'], 2)
+    self.assertIsNone(output['taken'])
+
+  def test_async_snapshot_status(self):
+    """ Test async views get the same answer, probing on their own loop. """
+    with mock.patch(
+      'wrangler.tasks.probe_servers',
+      mock.AsyncMock(return_value=self.live['serverlist'])
+    ) as probe:
+      output = async_to_sync(async_snapshot_status)([self.server])
+
+    probe.assert_awaited_once()
+    self.assertEqual(output['total_capacity'], 10)
+
+
+class DockerStreamLogsTests(TestCase):
+  """ Tests for following a container's logs. """
+  def setUp(self):
+    self.user = User.objects.create_user('TestyMcTestFace', 'foo@bar.com', 'pw')
+    self.mine_host = MineHost(name='example.com')
+    self.mine_host.save()
+    self.server = Server(name='mc-00', owner=self.user, host=self.mine_host)
+    self.server.save()
+    self.container = mock.MagicMock()
+    self.container.logs.return_value = iter([
+      b'2021-01-17T17:19:00.1Z Starting',
+      b' server\n2021-01-17T17:19:00.25Z Done\n',
+    ])
+
+  def _stream(self, **kwargs):
+    """ Follow our fake container's logs. """
+    with mock.patch('wrangler.tasks._get_client') as get_client:
+      get_client.return_value.containers.get.return_value = self.container
+      return list(docker_stream_logs(self.server, **kwargs))
+
+  def test_lines_reassembled_with_cursors(self):
+    """ Test that lines split across chunks come out whole, with cursors. """
+    self.assertEqual(self._stream(tail=10), [
+      ('2021-01-17T17:19:00.100000000Z', 'Starting server'),
+      ('2021-01-17T17:19:00.250000000Z', 'Done'),
+    ])
+    self.assertEqual(self.container.logs.call_args.kwargs['tail'], 10)
+
+  def test_quiet_container_hung_up_on(self):
+    """ Test we stop following after max_seconds, with no lines to wake us. """
+    hung_up = threading.Event()
+    stream = mock.MagicMock()
+    stream.__iter__.return_value = iter(lambda: hung_up.wait(5) and None, None)
+    stream.close.side_effect = hung_up.set
+    self.container.logs.return_value = stream
+
+    started = time.monotonic()
+    self.assertEqual(self._stream(max_seconds=0.1), [])
+
+    stream.close.assert_called_once()
+    self.assertLess(time.monotonic() - started, 2)
+
+  def test_since_skips_lines_already_sent(self):
+    """ Test that resuming from a cursor skips lines up to and including it. """
+    lines = self._stream(since='2021-01-17T17:19:00.100000000Z')
+
+    self.assertEqual(lines, [('2021-01-17T17:19:00.250000000Z', 'Done')])
+    self.assertEqual(self.container.logs.call_args.kwargs['since'], 1610903940)
@@ -0,0 +1,143 @@
+"""
+file: wrangler/tests/test_telemetry.py
+author: lkmhaqer
+"""
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse
+
+from accounts.models import User
+
+from wrangler.models import MineHost, Resolution, ResourceSample, Server
+from wrangler.telemetry import collect_samples, downsample, parse_stats
+
+
+FAKE_STATS = {
+  'cpu_stats': {
+    'cpu_usage': {'total_usage': 300},
+    'system_cpu_usage': 2000,
+    'online_cpus': 4,
+  },
+  'precpu_stats': {
+    'cpu_usage': {'total_usage': 100},
+    'system_cpu_usage': 1000,
+  },
+  'memory_stats': {'usage': 1500, 'limit': 4000, 'stats': {'cache': 500}},
+  'networks': {'eth0': {'rx_bytes': 10, 'tx_bytes': 20}},
+  'blkio_stats': {'io_service_bytes_recursive': [
+    {'op': 'Read', 'value': 30},
+    {'op': 'Write', 'value': 40},
+  ]},
+}
+
+
+class TelemetryTests(TestCase):
+  """ Tests for sampling, downsampling and charting resource use. """
+  def setUp(self):
+    self.user = User.objects.create_user('TestyMcTestFace', 'foo@bar.com', 'pw')
+    self.mine_host = MineHost(name='example.com')
+    self.mine_host.save()
+    self.server = Server(name='mc-00', owner=self.user, host=self.mine_host)
+    self.server.save()
+
+  def test_parse_stats(self):
+    """ Test docker stats are worked out the way the docker CLI does. """
+    fields = parse_stats(FAKE_STATS)
+
+    self.assertEqual(fields['cpu_percent'], 80.0)
+    self.assertEqual(fields['memory_bytes'], 1000)
+    self.assertEqual(fields['net_tx_bytes'], 20)
+    self.assertEqual(fields['block_write_bytes'], 40)
+
+  @mock.patch('wrangler.telemetry.docker_clients')
+  def test_collect_writes_server_and_host_rows(self, docker_clients):
+    """ Test each container gets a row, plus a total for its host. """
+    containers = []
+    for name in ('mc-00', 'not-ours'):
+      container = mock.MagicMock()
+      container.name = name
+      container.stats.return_value = FAKE_STATS
+      containers.append(container)
+    docker_clients.get.return_value.containers.list.return_value = containers
+
+    collect_samples()
+
+    self.assertEqual(ResourceSample.objects.get(server=self.server).memory_bytes, 1000)
+    total = ResourceSample.objects.get(host=self.mine_host, container='')
+    self.assertEqual(total.memory_bytes, 2000)
+
+  def test_downsample_rolls_up_whole_hours(self):
+    """
+    Test that old raw samples become one row per hour, and that
+    recent samples are left alone.
+    """
+    now = datetime(2021, 1, 20, 12, 30, tzinfo=timezone.utc)
+    for hour, minute, cpu in ((8, 0, 10), (8, 30, 30), (12, 0, 50)):
+      ResourceSample.objects.create(
+        host=self.mine_host,
+        container=self.server.name,
+        server=self.server,
+        timestamp=now.replace(hour=hour, minute=minute),
+        cpu_percent=cpu,
+        memory_bytes=cpu * 10
+      )
+
+    with self.settings(TELEMETRY_RAW_RETENTION=3600):
+      rollups, deleted = downsample(now=now)
+
+    self.assertEqual((rollups, deleted), (1, 2))
+    hourly = ResourceSample.objects.get(resolution=Resolution.HOUR)
+    self.assertEqual(hourly.cpu_percent, 20)
+    self.assertEqual(hourly.memory_bytes, 300)
+    self.assertEqual(
+      ResourceSample.objects.filter(resolution=Resolution.RAW).count(),
+      1
+    )
+
+  def test_resources_page_staff_only(self):
+    """ Test that only staff can see the resources page. """
+    self.client.force_login(user=self.user)
+    response = self.client.get(reverse('wrangler:resources'))
+    self.assertEqual(response.status_code, 302)
+
+    self.user.is_staff = True
+    self.user.save()
+    response = self.client.get(reverse('wrangler:resources'))
+    self.assertContains(response, 'is collect_stats running?')
+
+  def test_resources_page_latest_samples(self):
+    """
+    Test hosts are charted from all their samples, and containers listed
+    by their latest alone, hungriest first.
+    """
+    self.user.is_staff = True
+    self.user.save()
+    self.client.force_login(user=self.user)
+    now = datetime.now(timezone.utc)
+
+    def sample(container, minutes_ago, memory):
+      ResourceSample.objects.create(
+        host=self.mine_host,
+        container=container,
+        server=self.server if container == 'mc-00' else None,
+        timestamp=now - timedelta(minutes=minutes_ago),
+        memory_bytes=memory,
+      )
+
+    for minutes_ago in (2, 1):
+      sample('', minutes_ago, 1000 * minutes_ago)
+      sample('mc-00', minutes_ago, 100 * minutes_ago)
+      sample('portainer', minutes_ago, 300 * minutes_ago)
+
+    # The session and user, the hosts, and the containers' latest samples.
+    with self.assertNumQueries(5):
+      response = self.client.get(reverse('wrangler:resources'))
+
+    self.assertEqual(len(response.context['charts']), 1)
+    self.assertEqual(response.context['charts'][0]['latest'].memory_bytes, 1000)
+    self.assertEqual(
+      [(s.container, s.memory_bytes) for s in response.context['servers']],
+      [('portainer', 300), ('mc-00', 100)]
+    )
@@ -5,12 +5,29 @@ author: lkmhaqer
 from unittest import mock
 
 from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.shortcuts import render
 from django.urls import reverse
+from docker.errors import NotFound
 
-from accounts.models import User
+from accounts.models import MinecraftUser, User
 
-from wrangler.models import MineHost, ServerType, Server
+from wrangler.jobs import claim_job, enqueue
+from wrangler.models import (
+  EnvironmentVar,
+  Job,
+  JobAction,
+  JobState,
+  MineHost,
+  ServerType,
+  Server
+)
+from wrangler.probe_cache import probe_cache
+from wrangler.tasks import docker_start_server, refresh_status_snapshot
 
 
 class TestViews(TestCase):
@@ -27,6 +44,7 @@ class TestViews(TestCase):
   )
 
   def setUp(self):
+    probe_cache.clear()
     self.user = User.objects.create_user('TestyMcTestFace', 'foo@bar.com', 'pw')
     self.test_user = User.objects.create_user('PrivateUser', 'ex@mple.com', 'pw')
     self.mine_host = MineHost(name='example.com')
@@ -52,6 +70,9 @@ class TestViews(TestCase):
       ),
     ]
 
+  def tearDown(self):
+    probe_cache.clear()
+
   def test_anonymous_cannot_see_page(self):
     """ Test you cannot view the server create page if not logged in. """
     for test, expected in self.redirect_tests:
@@ -151,6 +172,46 @@ class TestViews(TestCase):
     ))
 
     self.assertContains(response, 'These are the logs')
+    # Following them is left to the owner, it holds a worker.
+    self.assertContains(response, '<button id="follow_logs" type="button">')
+
+  def test_server_logs_stream_only_to_owner(self):
+    """ Test that only the owner can follow a server's logs. """
+
+    self.client.force_login(user=self.test_user)
+    response = self.client.get(reverse(
+      'wrangler:server_logs',
+      kwargs={'server_name': 'mc-test'},
+    ))
+
+    self.assertEqual(response.status_code, 403)
+
+  @mock.patch('wrangler.views.docker_stream_logs')
+  def test_server_logs_stream_events(self, stream_logs):
+    """
+    Test that log lines are sent as server-sent events, resuming
+    from the Last-Event-ID the browser sends when it reconnects.
+    """
+    stream_logs.return_value = iter([
+      ('2021-01-17T17:19:00.100000000Z', 'Done (4.2s)!'),
+    ])
+
+    self.client.force_login(user=self.user)
+    response = self.client.get(
+      reverse('wrangler:server_logs', kwargs={'server_name': 'mc-test'}),
+      {'tail': '5000'},
+      HTTP_LAST_EVENT_ID='2021-01-17T17:18:59.000000000Z',
+    )
+    body = b''.join(response.streaming_content).decode('utf-8')
+
+    self.assertEqual(response['Content-Type'], 'text/event-stream')
+    self.assertIn('id: 2021-01-17T17:19:00.100000000Z\ndata: Done (4.2s)!', body)
+    stream_logs.assert_called_once_with(
+      mock.ANY,
+      tail=settings.LOG_STREAM_MAX_TAIL,
+      since='2021-01-17T17:18:59.000000000Z',
+      max_seconds=settings.LOG_STREAM_MAX_SECONDS,
+    )
 
   def test_mine_host_not_offered_when_disabled(self):
     """ Test that a mine_host is not in the form when it's disabled. """
@@ -179,7 +240,7 @@ class TestViews(TestCase):
 
     self.assertNotContains(response, 'ExampleMod')
 
-  @mock.patch('wrangler.views.docker_delete_server', fake_delete)
+  @mock.patch('wrangler.jobs.docker_delete_server', fake_delete)
   def test_server_delete_page_only_triggered_by_owner(self):
     """
     Test that we return 403 if the server owner
@@ -194,7 +255,7 @@ class TestViews(TestCase):
 
     self.assertEqual(response.status_code, 403)
 
-  @mock.patch('wrangler.views.docker_restart_server', fake_delete)
+  @mock.patch('wrangler.jobs.docker_restart_server', fake_delete)
   def test_server_restart_page_only_triggered_by_owner(self):
     """
     Test that we return 403 if the server owner
@@ -209,6 +270,48 @@ class TestViews(TestCase):
 
     self.assertEqual(response.status_code, 403)
 
+  def test_server_restart_enqueues_job(self):
+    """
+    Test that a restart is queued for the job worker,
+    rather than run inside the request.
+    """
+
+    self.client.force_login(user=self.user)
+    response = self.client.post(reverse(
+      'wrangler:server_restart',
+      kwargs={'server_name': 'mc-test'},
+    ))
+
+    self.assertRedirects(response, reverse(
+      'wrangler:user_status', args=[self.user.username]
+    ))
+    job = Job.objects.get(server=self.server)
+    self.assertEqual(job.action, JobAction.RESTART)
+    self.assertEqual(job.state, JobState.QUEUED)
+
+  def test_server_jobs_only_viewed_by_owner(self):
+    """ Test that job progress is only shown to the server owner. """
+
+    Job.objects.create(
+      server=self.server,
+      server_name=self.server.name,
+      action=JobAction.START
+    )
+
+    self.client.force_login(user=self.test_user)
+    response = self.client.get(reverse(
+      'wrangler:server_jobs',
+      kwargs={'server_name': 'mc-test'},
+    ))
+    self.assertEqual(response.status_code, 403)
+
+    self.client.force_login(user=self.user)
+    response = self.client.get(reverse(
+      'wrangler:server_jobs',
+      kwargs={'server_name': 'mc-test'},
+    ))
+    self.assertEqual(response.json()['jobs'][0]['state'], JobState.QUEUED)
+
   def test_only_request_user_can_see_user_status(self):
     """
     Test that we return 403 if the logged in user
@@ -250,3 +353,267 @@ class TestViews(TestCase):
     response = self.client.get(reverse('wrangler:server_create'))
 
     self.assertContains(response, 'example.com')
+
+
+class TestStatusApi(TestCase):
+  """
+  Tests for our JSON status endpoints, served from the status snapshot.
+  """
+  def setUp(self):
+    probe_cache.clear()
+    cache.clear()
+    self.user = User.objects.create_user('TestyMcTestFace', 'foo@bar.com', 'pw')
+    self.mine_host = MineHost(name='example.com')
+    self.mine_host.save()
+    self.server = Server(name='mc-test', owner=self.user, host=self.mine_host)
+    self.server.save()
+    self.online = 3
+    self._poll()
+
+  def tearDown(self):
+    probe_cache.clear()
+    cache.clear()
+
+  def _poll(self):
+    """ Refresh the snapshot, with our server up and self.online players. """
+    live = {
+      'serverlist': [(self.server, {
+        'version': {'name': '1.16.4'},
+        'players': {'online': self.online, 'max': 20, 'sample': []},
+        'latency': 12.5,
+      })],
+      'total_players': self.online,
+      'total_capacity': 20,
+    }
+    with mock.patch('wrangler.tasks.minecraft_status', return_value=live):
+      refresh_status_snapshot()
+
+  def test_status_api(self):
+    """ Test the fleet status comes back as JSON with validators. """
+    response = self.client.get(reverse('wrangler:status_api'))
+
+    self.assertEqual(response.json()['servers'][0]['players']['online'], 3)
+    self.assertTrue(response.json()['servers'][0]['up'])
+    self.assertIn('ETag', response)
+    self.assertIn('Last-Modified', response)
+
+  def test_status_api_not_modified(self):
+    """
+    Test that a client sending back our ETag gets a 304, until the
+    snapshot actually changes.
+    """
+    url = reverse('wrangler:server_status_api', kwargs={'server_name': 'mc-test'})
+    etag = self.client.get(url)['ETag']
+
+    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual(response.status_code, 304)
+    self.assertEqual(response.content, b'')
+
+    self.online = 4
+    self._poll()
+    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual(response.status_code, 200)
+
+  def test_user_status_api_only_for_that_user(self):
+    """ Test only the user themselves can see their status as JSON. """
+    response = self.client.get(reverse(
+      'wrangler:user_status_api',
+      kwargs={'username': 'TestyMcTestFace'}
+    ))
+    self.assertEqual(response.status_code, 403)
+
+    self.client.force_login(user=self.user)
+    response = self.client.get(reverse(
+      'wrangler:user_status_api',
+      kwargs={'username': 'TestyMcTestFace'}
+    ))
+    self.assertEqual(response.json()['total_players'], 3)
+
+
+class TestQueryCounts(TestCase):
+  """
+  Guards against N+1 queries, the number of queries for our pages must
+  not grow with the number of servers being shown.
+  """
+  def setUp(self):
+    probe_cache.clear()
+    cache.clear()
+    self.user = User.objects.create_user('TestyMcTestFace', 'foo@bar.com', 'pw')
+    self.user.server_limit = 100
+    self.user.save()
+    self.mine_host = MineHost(name='example.com')
+    self.mine_host.save()
+    self.server_type = ServerType.objects.get(pk=1)
+    self.client.force_login(user=self.user)
+
+  def tearDown(self):
+    probe_cache.clear()
+    cache.clear()
+
+  def _add_servers(self, count):
+    """ Add count more servers, and poll them all into the snapshot. """
+    start = Server.objects.count()
+    for i in range(start, start + count):
+      server = Server(name=f'mc-{i}', owner=self.user, host=self.mine_host)
+      server.save()
+
+    servers = list(Server.objects.all())
+    live = {
+      'serverlist': [
+        (server, {
+          'version': {'name': '1.16.4'},
+          'players': {'online': 1, 'max': 20, 'sample': []},
+        })
+        for server in servers
+      ],
+      'total_players': len(servers),
+      'total_capacity': 20 * len(servers),
+    }
+    with mock.patch('wrangler.tasks.minecraft_status', return_value=live):
+      refresh_status_snapshot()
+
+  def _count_queries(self, url):
+    """ Return how many queries a GET of url takes. """
+    with CaptureQueriesContext(connection) as queries:
+      response = self.client.get(url)
+    self.assertEqual(response.status_code, 200)
+    return len(queries)
+
+  def test_status_pages_constant_queries(self):
+    """ Test the status pages cost the same for 1 server as for 20. """
+    urls = [
+      reverse('wrangler:status'),
+      reverse('wrangler:user_status', args=[self.user.username]),
+      reverse('wrangler:status_api'),
+    ]
+    self._add_servers(1)
+    few = [self._count_queries(url) for url in urls]
+    self._add_servers(19)
+    many = [self._count_queries(url) for url in urls]
+
+    self.assertEqual(few, many)
+
+  def test_status_page_query_count(self):
+    """ Test the fleet status page takes a fixed number of queries. """
+    self._add_servers(10)
+
+    # session, user and the server list
+    with self.assertNumQueries(3):
+      self.client.get(reverse('wrangler:status'))
+
+  @mock.patch('wrangler.tasks._get_client')
+  def test_start_job_constant_queries(self, get_client):
+    """
+    Test that starting a server costs the same queries no matter
+    how many ops and environment vars it has.
+    """
+    # With no container to start, one is created from the launch spec.
+    get_client.return_value.containers.get.side_effect = NotFound('x')
+    self._add_servers(1)
+    server = Server.objects.get()
+    counts = []
+    for i in range(2):
+      server.op_list.add(MinecraftUser.objects.create(name=f'op{i}', owner=self.user))
+      self.server_type.environment_vars.add(
+        EnvironmentVar.objects.create(name=f'VAR_{i}', value='true')
+      )
+      enqueue(server, JobAction.START)
+      job = claim_job()
+      with CaptureQueriesContext(connection) as queries:
+        docker_start_server(job.server)
+      counts.append(len(queries))
+
+    self.assertEqual(get_client.return_value.containers.run.call_count, 2)
+    self.assertEqual(counts[0], counts[1])
+    self.assertGreater(counts[0], 0)
+
+
+class TestPageCaching(TestCase):
+  """ Tests for our view and template fragment caching. """
+  def setUp(self):
+    probe_cache.clear()
+    cache.clear()
+    self.user = User.objects.create_user('TestyMcTestFace', 'foo@bar.com', 'pw')
+
+  def tearDown(self):
+    probe_cache.clear()
+    cache.clear()
+
+  def test_index_cached(self):
+    """
+    Test the index is only rendered once for repeat anonymous visits,
+    and caches know it varies with who is logged in.
+    """
+    with mock.patch('wrangler.views.render', wraps=render) as spy:
+      first = self.client.get(reverse('wrangler:index'))
+      second = self.client.get(reverse('wrangler:index'))
+
+    self.assertEqual(spy.call_count, 1)
+    self.assertEqual(first.content, second.content)
+    self.assertIn('max-age', second['Cache-Control'])
+    self.assertIn('Cookie', second['Vary'])
+
+  def test_index_cached_per_user(self):
+    """ Test a logged in user doesn't get the anonymous page from cache. """
+    self.client.get(reverse('wrangler:index'))
+
+    self.client.force_login(user=self.user)
+    response = self.client.get(reverse('wrangler:index'))
+
+    self.assertContains(response, 'Welcome TestyMcTestFace')
+
+  def test_status_table_fragment_cached(self):
+    """ Test the status table is cached against the snapshot it shows. """
+    mine_host = MineHost(name='example.com')
+    mine_host.save()
+    server = Server(name='mc-test', owner=self.user, host=mine_host)
+    server.save()
+    live = {
+      'serverlist': [(server, {'version': {'text': '', 'error': 'timed out'}})],
+      'total_players': 0,
+      'total_capacity': 0,
+    }
+    with mock.patch('wrangler.tasks.minecraft_status', return_value=live):
+      snapshot = refresh_status_snapshot()
+
+    self.client.get(reverse('wrangler:status'))
+
+    key = make_template_fragment_key('status_table', [snapshot['taken'], 1])
+    self.assertIn('mc-test', cache.get(key))
+
+
+class TestAsgiViews(TestCase):
+  """ Tests that our async views answer when served over ASGI. """
+  def setUp(self):
+    probe_cache.clear()
+    cache.clear()
+    self.user = User.objects.create_user('TestyMcTestFace', 'foo@bar.com', 'pw')
+    self.mine_host = MineHost(name='example.com')
+    self.mine_host.save()
+    self.server = Server(name='mc-test', owner=self.user, host=self.mine_host)
+    self.server.save()
+    self.live = [(self.server, {
+      'version': {'name': '1.16.4'},
+      'players': {'online': 5, 'max': 20, 'sample': []},
+    })]
+
+  async def test_status_over_asgi(self):
+    """ Test the status page probes on the request's own event loop. """
+    with mock.patch(
+      'wrangler.tasks.probe_servers',
+      mock.AsyncMock(return_value=self.live)
+    ):
+      response = await self.async_client.get(reverse('wrangler:status'))
+
+    self.assertContains(response, '5 / 20')
+
+  async def test_server_detail_over_asgi(self):
+    """ Test the detail page redirects anonymous users, even when async. """
+    url = reverse('wrangler:server_detail', kwargs={'server_name': 'mc-test'})
+    response = await self.async_client.get(url)
+
+    self.assertRedirects(
+      response,
+      f'{settings.LOGIN_URL}?next={url}',
+      fetch_redirect_response=False
+    )
@@ -13,6 +13,15 @@ urlpatterns = [
   path('page/<slug:template>', views.page, name='page'),
   path('status/', views.status, name='status'),
   path('status/<str:username>', views.status, name='user_status'),
+  path('resources/', views.resources, name='resources'),
+  path('api/history/<slug:server_name>', views.history, name='history'),
+  path('api/status/', views.status_api, name='status_api'),
+  path('api/status/<str:username>', views.status_api, name='user_status_api'),
+  path(
+    'api/server/<slug:server_name>/status',
+    views.server_status_api,
+    name='server_status_api'
+  ),
   path(
     'server/create',
     views.server_create,
@@ -28,9 +37,24 @@ urlpatterns = [
     views.server_restart,
     name='server_restart'
   ),
+  path(
+    'server/<slug:server_name>/wake',
+    views.server_wake,
+    name='server_wake'
+  ),
   path(
     'server/<slug:server_name>/detail',
     views.server_detail,
     name='server_detail'
   ),
+  path(
+    'server/<slug:server_name>/logs',
+    views.server_logs,
+    name='server_logs'
+  ),
+  path(
+    'server/<slug:server_name>/jobs',
+    views.server_jobs,
+    name='server_jobs'
+  ),
 ]
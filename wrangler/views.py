@@ -2,31 +2,74 @@
 file: wrangler/views.py
 author: lkmhaqer
 """
-from django.http import Http404, HttpResponseRedirect
+import asyncio
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache
+from django.http import (
+  Http404,
+  HttpResponse,
+  HttpResponseRedirect,
+  JsonResponse,
+  StreamingHttpResponse
+)
 from django.core.exceptions import PermissionDenied
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max, Q
 from django.template import TemplateDoesNotExist
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.cache import cache_page
+from django.views.decorators.vary import vary_on_cookie
 from django.shortcuts import get_object_or_404, render
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 from accounts.models import User
 
 from .forms import ServerForm
-from .models import Server
+from .history import LATENCY_KEY, player_history
+from .jobs import enqueue
+from .models import JobAction, JobState, Resolution, ResourceSample, Server
 from .tasks import (
-  docker_delete_server,
-  docker_restart_server,
-  docker_start_server,
+  async_snapshot_status,
   docker_get_logs,
-  minecraft_status
+  docker_stream_logs,
+  snapshot_status
 )
 
 
+def _async_login_required(view):
+  """ login_required for async views, Django 3.1's only wraps sync ones. """
+  @functools.wraps(view)
+  async def wrapped(request, *args, **kwargs):
+    authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+    if not authenticated:
+      return redirect_to_login(request.get_full_path())
+    return await view(request, *args, **kwargs)
+
+  return wrapped
+
+# Our static pages only change with who is logged in, so they're cached
+# once per session cookie.
+@cache_page(settings.PAGE_CACHE_SECONDS)
+@vary_on_cookie
 def index(request):
   """ our root page response """
   return render(request, 'wrangler/index.html')
 
 @login_required
+@cache_page(settings.PAGE_CACHE_SECONDS)
+@vary_on_cookie
 def page(request, template):
   """ Return a given template page where no context is needed. """
   try:
@@ -43,7 +86,7 @@ def server_create(request):
     if form.is_valid():
       server = form.save()
       server = form.instance
-      docker_start_server(server)
+      enqueue(server, JobAction.START)
       return HttpResponseRedirect(reverse('wrangler:server_detail', args=[server.name]))
 
   else:
@@ -58,8 +101,7 @@ def server_delete(request, server_name):
     server = get_object_or_404(Server, name=server_name)
     if not request.user == server.owner:
       raise PermissionDenied
-    docker_delete_server(server)
-    server.delete()
+    enqueue(server, JobAction.DELETE)
 
   return HttpResponseRedirect(reverse(
     'wrangler:user_status', args=[request.user.username]
@@ -72,51 +114,334 @@ def server_restart(request, server_name):
     server = get_object_or_404(Server, name=server_name)
     if not request.user == server.owner:
       raise PermissionDenied
-    docker_restart_server(server)
+    enqueue(server, JobAction.RESTART)
 
   return HttpResponseRedirect(reverse(
     'wrangler:user_status', args=[request.user.username]
   ))
 
 @login_required
-def server_detail(request, server_name):
-  """ Show the details for a server. """
-  server = get_object_or_404(Server, name=server_name)
-  query = minecraft_status([server])
-  query_info, server_status = query['serverlist'][0]
+def server_wake(request, server_name):
+  """
+  Wake a hibernating server. Anyone who can see the server may wake it,
+  so friends can play without waiting on its owner.
+  """
+  if request.method == 'POST':
+    server = get_object_or_404(Server, name=server_name)
+    pending = server.job_set.filter(
+      action=JobAction.WAKE,
+      state__in=(JobState.QUEUED, JobState.RUNNING)
+    )
+    if server.hibernated and not pending.exists():
+      enqueue(server, JobAction.WAKE)
+
+  return HttpResponseRedirect(reverse(
+    'wrangler:server_detail', args=[server_name]
+  ))
+
+def _with_latency(serverlist):
+  """
+  Attach each server's cached latency percentiles to its status, and
+  return them with the percentiles per host.
+  """
+  latency = cache.get(LATENCY_KEY) or {'servers': {}, 'hosts': {}}
+  servers = [
+    (server, {**status, 'percentiles': latency['servers'].get(server.pk)})
+    for server, status in serverlist
+  ]
+  return servers, latency['hosts']
+
+def _server_detail_lookup(request, server_name):
+  """ Fetch a server, whether we own it, and if so its recent jobs. """
+  server = get_object_or_404(Server.objects.for_display(), name=server_name)
+  is_owner = request.user.pk == server.owner_id
+  jobs = list(server.job_set.order_by('-created')[:5]) if is_owner else []
+
+  return server, is_owner, jobs
+
+@_async_login_required
+async def server_detail(request, server_name):
+  """
+  Show the details for a server. The status probe and docker logs are
+  fetched at the same time, rather than one after the other.
+  """
+  server, is_owner, jobs = await sync_to_async(_server_detail_lookup)(
+    request,
+    server_name
+  )
+
+  fetches = [async_snapshot_status([server])]
+  if is_owner:
+    fetches.append(sync_to_async(docker_get_logs, thread_sensitive=False)(server))
+  query, *logs = await asyncio.gather(*fetches)
+  serverlist, _ = _with_latency(query['serverlist'])
+  query_info, server_status = serverlist[0]
 
   safe_logs = []
-  if request.user == server.owner:
-    logs = docker_get_logs(server)
-    logs = logs.splitlines()
-    safe_logs = [l.decode('utf-8') for l in logs]
+  if logs:
+    safe_logs = [l.decode('utf-8') for l in logs[0].splitlines()]
 
   context = {
     'server': server,
+    'jobs': jobs,
+    'jobs_pending': any(not job.done for job in jobs),
     'logs': safe_logs,
     'status': server_status,
+    'status_taken': query['taken'],
     'query_info': query_info
   }
 
-  return render(request, 'wrangler/server_detail.html', context)
+  return await sync_to_async(render)(
+    request,
+    'wrangler/server_detail.html',
+    context
+  )
 
-def status(request, username=None):
-  """ list out servers and show status. """
+@login_required
+def server_jobs(request, server_name):
+  """ Return the recent jobs for a server, for the detail page to poll. """
+  server = get_object_or_404(Server, name=server_name)
+  if not request.user == server.owner:
+    raise PermissionDenied
+
+  jobs = [
+    {
+      'id': job.pk,
+      'action': job.action,
+      'state': job.state,
+      'message': job.message,
+      'done': job.done,
+    }
+    for job in server.job_set.order_by('-created')[:5]
+  ]
+
+  return JsonResponse({'jobs': jobs})
+
+def _log_events(server, tail, since):
+  """
+  Turn a server's log stream into server-sent events. Each event's id is
+  the line's cursor, so a reconnecting EventSource resumes where it was.
+  We hang up after LOG_STREAM_MAX_SECONDS to hand our worker back, quiet
+  container or not, and the browser reconnects on its own.
+  """
+  yield 'retry: 1000\n\n'
+  try:
+    for cursor, line in docker_stream_logs(
+      server,
+      tail=tail,
+      since=since,
+      max_seconds=settings.LOG_STREAM_MAX_SECONDS
+    ):
+      yield f'id: {cursor}\ndata: {line}\n\n'
+  except Exception: # pylint: disable=broad-except
+    yield 'event: error\ndata: Unable to collect logs.\n\n'
+
+@login_required
+def server_logs(request, server_name):
+  """ Stream a server's logs to its owner as server-sent events. """
+  server = get_object_or_404(Server.objects.for_display(), name=server_name)
+  if not request.user == server.owner:
+    raise PermissionDenied
+
+  try:
+    tail = int(request.GET.get('tail', settings.LOG_STREAM_TAIL))
+  except ValueError:
+    tail = settings.LOG_STREAM_TAIL
+  tail = min(max(tail, 0), settings.LOG_STREAM_MAX_TAIL)
+  since = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('since')
+
+  response = StreamingHttpResponse(
+    _log_events(server, tail, since),
+    content_type='text/event-stream'
+  )
+  response['Cache-Control'] = 'no-cache'
+  response['X-Accel-Buffering'] = 'no'
+
+  return response
+
+def _sparkline(values, width=300, height=40):
+  """ Return SVG polyline points charting values, scaled to fit. """
+  if not values:
+    return ''
+  top = max(values) or 1
+  step = width / max(len(values) - 1, 1)
+  return ' '.join(
+    f'{i * step:.1f},{height - value / top * height:.1f}'
+    for i, value in enumerate(values)
+  )
+
+@staff_member_required
+def resources(request):
+  """ Chart CPU and memory use per host, and list the hungriest servers. """
+  since = timezone.now() - timedelta(hours=settings.TELEMETRY_CHART_HOURS)
+  recent = ResourceSample.objects.filter(timestamp__gte=since)
+
+  # Only the hosts are charted, so only their rows are fetched whole.
+  hosts = {}
+  for sample in recent.filter(container='').select_related('host').order_by('timestamp'):
+    hosts.setdefault(sample.host, []).append(sample)
+
+  charts = [
+    {
+      'host': host,
+      'latest': host_samples[-1],
+      'cpu': _sparkline([sample.cpu_percent for sample in host_samples]),
+      'memory': _sparkline([sample.memory_bytes for sample in host_samples]),
+    }
+    for host, host_samples in sorted(hosts.items(), key=lambda h: h[0].name)
+  ]
+  # Containers are listed by their latest sample alone, so we find when
+  # that was for each, and fetch just those rows.
+  newest = recent.exclude(container='').values('host', 'container').annotate(
+    taken=Max('timestamp')
+  ).order_by()
+  latest = Q(pk__in=[])
+  for row in newest:
+    latest |= Q(host=row['host'], container=row['container'], timestamp=row['taken'])
+  hungriest = recent.filter(latest).select_related(
+    'host',
+    'server'
+  ).order_by('-memory_bytes')
+
+  context = {
+    'charts': charts,
+    'servers': hungriest,
+    'hours': settings.TELEMETRY_CHART_HOURS,
+  }
+
+  return render(request, 'wrangler/resources.html', context)
+
+def _parse_time(value, default):
+  """
+  Parse an ISO 8601 query parameter, assuming UTC if it's naive. Raises
+  ValueError for a well formed time that can't exist, like month 13.
+  """
+  parsed = parse_datetime(value) if value else None
+  if parsed is None:
+    return default
+  if timezone.is_naive(parsed):
+    parsed = timezone.make_aware(parsed, timezone.utc)
+  return parsed
+
+def history(request, server_name):
+  """
+  Return a server's player history as JSON, straight from our rollups.
+  Takes resolution (minute, hour or day), and ISO 8601 start and end.
+  """
+  server = get_object_or_404(Server, name=server_name)
+  resolution = request.GET.get('resolution', Resolution.HOUR)
+  if resolution not in (Resolution.MINUTE, Resolution.HOUR, Resolution.DAY):
+    return JsonResponse({'error': f'Unknown resolution {resolution}.'}, status=400)
+
+  try:
+    end = _parse_time(request.GET.get('end'), timezone.now())
+    start = _parse_time(request.GET.get('start'), end - timedelta(days=1))
+  except ValueError as err:
+    return JsonResponse({'error': f'Bad start or end, {err}.'}, status=400)
+
+  return JsonResponse({
+    'server': server.name,
+    'resolution': resolution,
+    'start': start.isoformat(),
+    'end': end.isoformat(),
+    'points': player_history(server, resolution, start, end),
+  })
+
+def _status_servers(request, username):
+  """ Fetch the servers for the status page, and which template to use. """
   if username:
     user = get_object_or_404(User, username=username)
     if not request.user == user:
       raise PermissionDenied
-    server_list = Server.objects.filter(owner=user.id)
-    template = 'user_status'
-  else:
-    server_list = Server.objects.all()
-    template = 'status'
+    return list(Server.objects.for_display().filter(owner=user.id)), 'user_status'
+
+  return list(Server.objects.for_display()), 'status'
+
+async def status(request, username=None):
+  """ list out servers and show status. """
+  server_list, template = await sync_to_async(_status_servers)(
+    request,
+    username
+  )
 
-  servers = minecraft_status(server_list)
+  servers = await async_snapshot_status(server_list)
+  serverlist, host_latency = _with_latency(servers['serverlist'])
   context = {
-    'servers': servers['serverlist'],
+    'servers': serverlist,
+    'host_latency': sorted(host_latency.items()),
+    'status_taken': servers['taken'],
+    'fragment_timeout': settings.STATUS_SNAPSHOT_MAX_AGE,
     'total_players': servers['total_players'],
     'total_capacity': servers['total_capacity']
   }
 
-  return render(request, f'wrangler/{template}.html', context)
+  return await sync_to_async(render)(
+    request,
+    f'wrangler/{template}.html',
+    context
+  )
+
+def _server_json(server, server_status):
+  """ Describe a server and its status as plain JSON-able data. """
+  return {
+    'name': server.name,
+    'socket': server.get_socket(),
+    'type': str(server.server_type),
+    'up': bool(server_status['version'].get('name')),
+    'version': server_status['version'].get('name', ''),
+    'players': server_status.get('players', {'online': 0, 'max': 0, 'sample': []}),
+    'latency': server_status.get('latency'),
+    'ping': server_status.get('ping'),
+    'latency_percentiles': server_status.get('percentiles'),
+    'error': server_status['version'].get('error', ''),
+  }
+
+def _status_response(request, servers):
+  """
+  Answer with a status snapshot as JSON, tagged with an ETag of its
+  content and the snapshot's Last-Modified time. If the client already
+  has this snapshot, answer with an empty 304 instead.
+  """
+  payload = {
+    'taken': servers['taken'],
+    'total_players': servers['total_players'],
+    'total_capacity': servers['total_capacity'],
+    'servers': [
+      _server_json(*server) for server in _with_latency(servers['serverlist'])[0]
+    ],
+  }
+  body = json.dumps(payload, cls=DjangoJSONEncoder, sort_keys=True)
+  etag = f'"{hashlib.sha1(body.encode()).hexdigest()}"'
+  last_modified = int(servers['taken'].timestamp()) if servers['taken'] else None
+
+  response = get_conditional_response(
+    request,
+    etag=etag,
+    last_modified=last_modified
+  )
+  if response is None:
+    # The body is serialised once, up front, as the ETag is its hash.
+    response = HttpResponse(body, content_type='application/json') # pylint: disable=http-response-with-content-type-json
+  response['ETag'] = etag
+  if last_modified:
+    response['Last-Modified'] = http_date(last_modified)
+  response['Cache-Control'] = 'no-cache'
+
+  return response
+
+def status_api(request, username=None):
+  """ The status page, as JSON, for dashboards and bots to poll. """
+  server_list = Server.objects.for_display()
+  if username:
+    user = get_object_or_404(User, username=username)
+    if not request.user == user:
+      raise PermissionDenied
+    server_list = server_list.filter(owner=user.id)
+
+  return _status_response(request, snapshot_status(server_list))
+
+def server_status_api(request, server_name):
+  """ The status of a single server, as JSON. """
+  server = get_object_or_404(Server.objects.for_display(), name=server_name)
+
+  return _status_response(request, snapshot_status([server]))